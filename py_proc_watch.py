@@ -1,110 +1,1124 @@
 #!/usr/bin/env python3
 
-import argparse
-import dataclasses
-import datetime
+import array
+import collections
+import contextlib
+import functools
+import hashlib
 import io
+import math
 import os
-import pathlib
 import re
-import shlex
-import shutil
+import selectors
+import signal
+import struct
 import subprocess
 import sys
 import threading
 import time
-from typing import List, Tuple
+import unicodedata
+import zlib
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    cast,
+    overload,
+)
 
-import colorama
-import colorama.ansi
+if TYPE_CHECKING:
+    import asyncio
+    import concurrent.futures
+    import mmap
+    import pathlib
 
-REMOVE_OTHER_ANSI_SEQS = re.compile(r"\033\[\d*[ABCDEFGJKST]")
-REMOVE_ANSI_COLOR_SEQS = re.compile(r"\033\[\d+(;\d+){0,2}m")
-INCOMPLETE_ANSI_SEQ = re.compile(r"\033[\[\d;]*$")
-PADDING_LINE = f"{colorama.Fore.LIGHTBLACK_EX}~{colorama.Style.RESET_ALL}{colorama.ansi.clear_line(0)}\n"
+if sys.platform == "win32":
+    import msvcrt  # pragma: no cover
+else:
+    import termios
+    import tty
+
+ANSI_ESCAPE_SEQ = re.compile(r"\033(?:\[[0-?]*[ -/]*(?:([@-~])|$)|\][^\007\033]*(?:\007|\033\\|$)|[ -/]*[0-~]?)")
+TAB_SIZE = 8
+READ_BUFFER_SIZE = 1024 * 1024
+MAX_SCROLLBACK_LINES = 1024 * 1024
+MISSED_TICK_POLICIES = ("skip", "immediate", "coalesce")
+HEADLESS_FORMATS = ("jsonl", "text")
+HISTOGRAM_BUCKETS_PER_OCTAVE = 4
+METRICS_PHASES = ("exec", "lines", "render", "write", "record", "sleep")
+# Values kept for every tracked number, the last SPARKLINE_WIDTH of them are drawn.
+TRACK_HISTORY = 256
+SPARKLINE_WIDTH = 16
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+# Recording file: a header (timestamp, frame kind, payload size) followed by the zlib compressed JSON payload, the
+# sidecar index holds (timestamp, offset) of every keyframe.
+RECORD_HEADER = struct.Struct("<dBI")
+RECORD_INDEX_ENTRY = struct.Struct("<dQ")
+RECORD_KEYFRAME = 0
+RECORD_DELTA = 1
+RECORD_KEYFRAME_INTERVAL = 60
+# Linux inotify event header (watch descriptor, mask, cookie, name length) and the events of files being written,
+# replaced, created or removed.
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_CHANGE_MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+INOTIFY_NEW_ENTRY_MASK = 0x80 | 0x100
+INOTIFY_IS_DIRECTORY = 0x40000000
+# A burst of changes ends when nothing changed for the quiet time, continuous changes still run the command after the
+# settle limit.
+CHANGE_QUIET_TIME = 0.1
+CHANGE_SETTLE_LIMIT = 1.0
+KEY_SEQUENCES = {
+    "\033[A": "up",
+    "\033[B": "down",
+    "\033[C": "right",
+    "\033[D": "left",
+    "\033[H": "home",
+    "\033[F": "end",
+    "\033[1~": "home",
+    "\033[4~": "end",
+    "\033[5~": "page_up",
+    "\033[6~": "page_down",
+    "\033OA": "up",
+    "\033OB": "down",
+    "\033OC": "right",
+    "\033OD": "left",
+    "\033OH": "home",
+    "\033OF": "end",
+}
+WINDOWS_KEYS = {
+    "H": "up",
+    "P": "down",
+    "M": "right",
+    "K": "left",
+    "G": "home",
+    "O": "end",
+    "I": "page_up",
+    "Q": "page_down",
+}
+HIGHLIGHT_ON = "\033[7m"
+HIGHLIGHT_OFF = "\033[27m"
+# Escape sequences are precomputed, colorama is only needed to make the Windows console understand them.
+COLOR_GREY = "\033[90m"
+COLOR_RED = "\033[91m"
+COLOR_RESET = "\033[39m"
+STYLE_RESET = "\033[0m"
+CLEAR_LINE = "\033[0K"
+PADDING_LINE = f"{COLOR_GREY}~{STYLE_RESET}{CLEAR_LINE}\n"
 
 
 class PyProcWatchError(Exception):
     pass
 
 
-@dataclasses.dataclass(init=False)
-class CommandResult:
-    stdout_lines: List[str]
-    exit_status: int = -1
-    total_read_bytes: int = 0
-    used_bytes: int = 0
+def cursor_position(column: int, row: int) -> str:
+    return f"\033[{row};{column}H"
+
+
+def fix_windows_console() -> None:
+    if sys.platform == "win32":  # pragma: no cover
+        import colorama
+
+        colorama.just_fix_windows_console()
+
+
+def decode_line(line: Union[bytes, bytearray, memoryview]) -> str:
+    return str(line, "UTF-8", "backslashreplace")
+
+
+class LineBuffer(Sequence[str]):
+    # Raw lines stored back to back in a single buffer with an array of their end offsets, lines are decoded only when
+    # they are read. Much more compact than a list of str, reads as one.
+    __slots__ = ("data", "ends")
 
     def __init__(self) -> None:
-        self.stdout_lines = []
+        self.data = bytearray()
+        self.ends = array.array("Q")
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return self._decode(range(*index.indices(len(self.ends))))
+        if index < 0:
+            index += len(self.ends)
+            if index < 0:
+                raise IndexError("LineBuffer index out of range")
+        start = self.ends[index - 1] if index > 0 else 0
+        return decode_line(self.data[start : self.ends[index]])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._decode(range(len(self.ends))))
+
+    def __eq__(self, other: object) -> bool:
+        # Equal to any sequence of the same decoded lines, like the list of lines it replaces.
+        if not isinstance(other, Sequence) or isinstance(other, (str, bytes, bytearray)):
+            return NotImplemented
+        return len(self) == len(other) and all(line == other_line for line, other_line in zip(self, other))
+
+    def _decode(self, indexes: range) -> List[str]:
+        # A single view of the buffer is sliced without copying the lines, it is released before the buffer can grow.
+        ends = self.ends
+        with memoryview(self.data) as view:
+            return [decode_line(view[ends[index - 1] if index > 0 else 0 : ends[index]]) for index in indexes]
+
+    def raw(self, index: int) -> memoryview:
+        # The raw line without copying, the buffer can not grow while the view exists.
+        start = self.ends[index - 1] if index > 0 else 0
+        return memoryview(self.data)[start : self.ends[index]]
+
+    def append(self, line: Union[bytes, bytearray, memoryview]) -> None:
+        self.data += line
+        self.ends.append(len(self.data))
+
+    def window(self, start: int, count: int) -> List[str]:
+        return self._decode(range(max(start, 0), min(start + count, len(self.ends))))
+
+    def split_lines(self) -> List[bytes]:
+        # Raw lines without their newlines. Lines contain no other newlines, so splitting the whole buffer at once is
+        # much faster than slicing every line.
+        if not self.data:
+            return []
+        lines = bytes(self.data).split(b"\n")
+        if self.data.endswith(b"\n"):
+            lines.pop()
+        return lines
+
+
+class CommandResult:
+    # Lines are kept raw in a single LineBuffer for every run, a scrollback run may keep more of them than fit on the
+    # screen.
+    __slots__ = (
+        "exit_status",
+        "output_hash",
+        "stdout_lines",
+        "timed_out",
+        "total_read_bytes",
+        "tracked",
+        "tracker",
+        "truncated",
+        "used_bytes",
+    )
+
+    def __init__(self, tracker: "Optional[FieldTracker]" = None) -> None:
+        self.stdout_lines = LineBuffer()
+        self.exit_status = -1
+        self.total_read_bytes = 0
+        self.used_bytes = 0
+        self.truncated = False
+        self.timed_out = False
+        # Hash of the raw bytes of all used lines, lets callers tell if the output changed without keeping old outputs.
+        self.output_hash = hashlib.blake2b(digest_size=16)
+        self.tracker = tracker
+        # Numbers are extracted from the raw lines as they are added, NaN until a line matched.
+        self.tracked = tracker.new_values() if tracker is not None else None
+
+    @property
+    def line_count(self) -> int:
+        return len(self.stdout_lines)
 
     def add_line(self, line: str) -> None:
+        # Lines added directly are hashed here.
+        encoded_line = line.encode("UTF-8", "backslashreplace")
+        self.output_hash.update(encoded_line)
+        self.add_raw_line(encoded_line)
+
+    def add_raw_line(self, line: Union[bytes, bytearray, memoryview]) -> None:
+        # The raw bytes are hashed by the caller.
         self.stdout_lines.append(line)
-        line_len = len(line)
-        self.total_read_bytes += line_len
-        self.used_bytes += line_len
+        self.total_read_bytes += len(line)
+        self.used_bytes += len(line)
+        if self.tracker is not None:
+            self.extract_tracked(len(self.stdout_lines) - 1)
 
+    def extract_tracked(self, first_line: int) -> None:
+        if self.tracker is not None and self.tracked is not None:
+            self.tracker.extract(self.stdout_lines, first_line, self.tracked)
 
-def reader_thread_func(command_result: CommandResult, stream: io.TextIOBase, max_lines: int) -> None:
-    while True:
-        if len(command_result.stdout_lines) >= max_lines:
-            read_bytes = len(stream.read(io.DEFAULT_BUFFER_SIZE))
-            command_result.total_read_bytes += read_bytes
-            if read_bytes < io.DEFAULT_BUFFER_SIZE:
-                return
+
+class LineCollector:
+    # Splits raw output into lines stored in the result, everything past max_lines is just counted. Complete lines of a
+    # chunk are copied into the buffer at once. Collecting stops once max_bytes (if non-zero) were received.
+    def __init__(self, command_result: CommandResult, max_lines: int, max_bytes: int = 0) -> None:
+        self.command_result = command_result
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.pending = bytearray()
+
+    def feed(self, data: Union[bytes, memoryview]) -> bool:
+        command_result = self.command_result
+        lines = command_result.stdout_lines
+        if len(lines) >= self.max_lines:
+            command_result.total_read_bytes += len(data)
         else:
-            line = stream.readline()
-            if not line:
-                return
-            command_result.add_line(line)
+            pending = self.pending
+            search_from = len(pending)
+            pending += data
+            first_line = len(lines)
+            offset = len(lines.data)
+            ends = lines.ends
+            line_start = 0
+            while len(ends) < self.max_lines:
+                line_end = pending.find(b"\n", search_from) + 1
+                if not line_end:
+                    break
+                ends.append(offset + line_end)
+                line_start = search_from = line_end
+            if line_start:
+                with memoryview(pending) as view, view[:line_start] as used:
+                    command_result.output_hash.update(used)
+                    lines.data += used
+                command_result.total_read_bytes += line_start
+                command_result.used_bytes += line_start
+                if command_result.tracker is not None:
+                    command_result.extract_tracked(first_line)
+            del pending[:line_start]
+            if len(lines) >= self.max_lines:
+                command_result.total_read_bytes += len(pending)
+                pending.clear()
+
+        if self.max_bytes and command_result.total_read_bytes + len(self.pending) >= self.max_bytes:
+            command_result.total_read_bytes += len(self.pending)
+            self.pending.clear()
+            command_result.truncated = True
+            return False
+        return True
+
+    def finish(self) -> None:
+        if self.pending:
+            self.command_result.output_hash.update(self.pending)
+            self.command_result.add_raw_line(self.pending)
+            self.pending.clear()
+
+
+def reader_thread_func(
+    command_result: CommandResult, stream: Union[io.RawIOBase, io.BufferedIOBase], max_lines: int, max_bytes: int = 0
+) -> None:
+    collector = LineCollector(command_result, max_lines, max_bytes)
+    buffer = bytearray(READ_BUFFER_SIZE)
+    view = memoryview(buffer)
+    while read_bytes := stream.readinto(buffer):
+        if not collector.feed(view[:read_bytes]):
+            return
+    collector.finish()
+
+
+def kill_process_group(proc: "Union[subprocess.Popen[bytes], asyncio.subprocess.Process]") -> None:
+    # Commands are started in their own session, so the whole process group (including everything the shell started)
+    # can be killed, not only the direct child.
+    if sys.platform != "win32":
+        with contextlib.suppress(OSError):
+            os.killpg(proc.pid, signal.SIGKILL)
+    with contextlib.suppress(ProcessLookupError):
+        proc.kill()
+
+
+def _reader_thread_main(
+    command_result: CommandResult,
+    stream: Union[io.RawIOBase, io.BufferedIOBase],
+    max_lines: int,
+    max_bytes: int,
+    proc: "subprocess.Popen[bytes]",
+    done_fd: int,
+) -> None:
+    try:
+        reader_thread_func(command_result, stream, max_lines, max_bytes)
+        if command_result.truncated:
+            kill_process_group(proc)
+    finally:
+        os.close(done_fd)
+
+
+def _open_pidfd(pid: int) -> Optional[int]:
+    pidfd_open = getattr(os, "pidfd_open", None)
+    if pidfd_open is None:
+        return None  # pragma: no cover
+    try:
+        return int(pidfd_open(pid))
+    except OSError:
+        return None
+
+
+def wait_for_exit(
+    proc: "subprocess.Popen[bytes]", reader_thread: threading.Thread, reader_done_fd: int, timeout: float = 0.0
+) -> Optional[int]:
+    # Block (without burning CPU) until both the child exited and the reader thread finished, on Linux both events are
+    # multiplexed via pidfd, elsewhere fall back to blocking wait and join. Returns None if timeout (if non-zero)
+    # expired first.
+    deadline = time.monotonic() + timeout if timeout else None
+    pidfd = _open_pidfd(proc.pid)
+    if pidfd is None:
+        try:
+            exit_status = proc.wait(timeout or None)
+        except subprocess.TimeoutExpired:
+            return None
+        reader_thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return None if reader_thread.is_alive() else exit_status
+
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(pidfd, selectors.EVENT_READ)
+            selector.register(reader_done_fd, selectors.EVENT_READ)
+            while selector.get_map():
+                events = selector.select(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                if not events:
+                    return None
+                for key, _ in events:
+                    selector.unregister(key.fd)
+    finally:
+        os.close(pidfd)
+    reader_thread.join()
+    return proc.wait()
+
+
+_thread_state = threading.local()
+
+
+def _read_buffer() -> bytearray:
+    # Allocated once per thread and reused by every run.
+    buffer: Optional[bytearray] = getattr(_thread_state, "read_buffer", None)
+    if buffer is None:
+        buffer = _thread_state.read_buffer = bytearray(READ_BUFFER_SIZE)
+    return buffer
+
+
+def read_output(
+    proc: "subprocess.Popen[bytes]",
+    command_result: CommandResult,
+    max_lines: int,
+    max_bytes: int = 0,
+    timeout: float = 0.0,
+) -> int:
+    # Reads the output on the calling thread until both the output ended and the child exited, on Linux both events are
+    # multiplexed via pidfd, elsewhere the child is waited for after the output ended. When the timeout (if non-zero)
+    # expires the process group is killed and the rest of the output is still collected.
+    assert proc.stdout is not None
+    stream = cast(io.RawIOBase, proc.stdout)
+    collector = LineCollector(command_result, max_lines, max_bytes)
+    buffer = _read_buffer()
+    view = memoryview(buffer)
+    deadline = time.monotonic() + timeout if timeout else None
+    pidfd = _open_pidfd(proc.pid)
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(stream.fileno(), selectors.EVENT_READ)
+            if pidfd is not None:
+                selector.register(pidfd, selectors.EVENT_READ)
+            while selector.get_map():
+                events = selector.select(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                if not events:
+                    command_result.timed_out = True
+                    kill_process_group(proc)
+                    deadline = None
+                for key, _ in events:
+                    if key.fd == pidfd:
+                        selector.unregister(pidfd)
+                    elif not (read_bytes := stream.readinto(buffer)):
+                        collector.finish()
+                        selector.unregister(key.fd)
+                    elif not collector.feed(view[:read_bytes]):
+                        kill_process_group(proc)
+                        selector.unregister(key.fd)
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+    if deadline is None:
+        return proc.wait()
+    try:
+        return proc.wait(max(0.0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        command_result.timed_out = True
+        kill_process_group(proc)
+        return proc.wait()
+
+
+def read_output_in_thread(
+    proc: "subprocess.Popen[bytes]",
+    command_result: CommandResult,
+    max_lines: int,
+    max_bytes: int = 0,
+    timeout: float = 0.0,
+) -> int:
+    # Same as read_output, for platforms where pipes can not be used with selectors (Windows).
+    stream = cast(io.RawIOBase, proc.stdout)
+    reader_done_read, reader_done_write = os.pipe()
+    reader_thread = threading.Thread(
+        target=_reader_thread_main, args=(command_result, stream, max_lines, max_bytes, proc, reader_done_write)
+    )
+    reader_thread.start()
+    try:
+        exit_status = wait_for_exit(proc, reader_thread, reader_done_read, timeout)
+        if exit_status is None:
+            command_result.timed_out = True
+            kill_process_group(proc)
+            exit_status = proc.wait()
+            reader_thread.join()
+        return exit_status
+    finally:
+        os.close(reader_done_read)
 
 
-def get_output(command: List[str], shell: bool, max_lines: int) -> CommandResult:
-    if max_lines < 1 or max_lines > 8192:
+def _check_max_lines(max_lines: int, scrollback: bool) -> None:
+    if max_lines < 1 or max_lines > (MAX_SCROLLBACK_LINES if scrollback else 8192):
         raise ValueError(f"Invalid number of maximum lines: {max_lines}")
 
+
+def get_output(
+    command: List[str],
+    shell: bool,
+    max_lines: int,
+    max_bytes: int = 0,
+    timeout: float = 0.0,
+    scrollback: bool = False,
+    on_start: "Optional[Callable[[subprocess.Popen[bytes]], None]]" = None,
+    tracker: "Optional[FieldTracker]" = None,
+) -> CommandResult:
+    _check_max_lines(max_lines, scrollback)
+
     with subprocess.Popen(
-        command,
-        shell=shell,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        encoding="UTF-8",
-        errors="backslashreplace",
+        command, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, start_new_session=True
     ) as proc:
         if proc.stdout is None:
             raise PyProcWatchError("Failed to open child process stdout")
+        if on_start is not None:
+            on_start(proc)
+
+        result = CommandResult(tracker)
+        read = read_output_in_thread if sys.platform == "win32" else read_output
+        try:
+            result.exit_status = read(proc, result, max_lines, max_bytes, timeout)
+        except BaseException:
+            # Interrupted (e.g. by Ctrl-C), nothing the command started may outlive it. After a normal exit background
+            # jobs the command started on purpose keep running, the group was already killed on truncation or timeout.
+            kill_process_group(proc)
+            raise
+        return result
+
+
+def _tail_offset(data: "Union[bytes, mmap.mmap]", line_count: int) -> int:
+    # Start of the last line_count lines, a last line without a newline counts as a line like in tail.
+    end = len(data) - 1 if data[-1:] == b"\n" else len(data)
+    for _ in range(line_count):
+        end = data.rfind(b"\n", 0, end)
+        if end < 0:
+            return 0
+    return end + 1
+
+
+def read_file(
+    path: str,
+    max_lines: int,
+    max_bytes: int = 0,
+    scrollback: bool = False,
+    tail: bool = False,
+    tracker: "Optional[FieldTracker]" = None,
+) -> CommandResult:
+    # Reads the file in-process instead of running cat or tail. Regular files are mapped, so only the pages of the
+    # used lines are touched, files that can not be mapped (procfs reports size 0) are read. Errors are shown as the
+    # output of a failed run.
+    import mmap
+    import pathlib
+
+    _check_max_lines(max_lines, scrollback)
+    result = CommandResult(tracker)
+    try:
+        with pathlib.Path(path).open("rb", buffering=0) as file:
+            data: Union[bytes, mmap.mmap]
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                data = file.readall()
+    except OSError as error:
+        result.add_line(f"{path}: {error.strerror}\n")
+        result.exit_status = 1
+        return result
+
+    collector = LineCollector(result, max_lines, max_bytes)
+    start = _tail_offset(data, max_lines) if tail else 0
+    with memoryview(data) as view:
+        for offset in range(start, len(data), READ_BUFFER_SIZE):
+            if not collector.feed(view[offset : offset + READ_BUFFER_SIZE]):
+                break
+        else:
+            collector.finish()
+    if isinstance(data, mmap.mmap):
+        data.close()
+    result.exit_status = 0
+    return result
+
+
+class Inotify:
+    # Linux file change notifications through ctypes, no extra dependency is needed.
+    def __init__(self) -> None:
+        import ctypes
+
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = int(self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path: str, mask: int) -> int:
+        import ctypes
+
+        descriptor = int(self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask)))
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return descriptor
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        # Pending (watch descriptor, mask, name) events, an empty list when there are none.
+        events = []
+        with contextlib.suppress(BlockingIOError):
+            while data := os.read(self.fd, 64 * 1024):
+                offset = 0
+                while offset < len(data):
+                    descriptor, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += INOTIFY_EVENT.size
+                    events.append((descriptor, mask, os.fsdecode(data[offset : offset + length].rstrip(b"\0"))))
+                    offset += length
+        return events
+
+
+def _is_pseudo_file(path: str) -> bool:
+    # procfs, sysfs and similar report no blocks, their files have no meaningful size or modification time.
+    try:
+        return hasattr(os, "statvfs") and os.statvfs(path).f_blocks == 0
+    except OSError:
+        return False
+
+
+class FileSource:
+    # Watches a file without child processes. Regular files are read again only when they changed, on Linux inotify
+    # on the parent directory (which also sees the file being replaced or created) ends the wait between runs as soon
+    # as the file is written. Pseudo files have no change notifications and are read on every run.
+    def __init__(self, path: str, tail: bool = False) -> None:
+        import pathlib
+
+        self.path = path
+        self.tail = tail
+        self.file_path = pathlib.Path(path)
+        self.pseudo = _is_pseudo_file(path)
+        self.inotify: Optional[Inotify] = None
+        self.last_stat: Optional[Tuple[int, int, int]] = None
+        self.last_read: Optional[Tuple[int, int, bool]] = None
+        self.result: Optional[CommandResult] = None
+        self.pending = False
+        if sys.platform == "linux" and not self.pseudo:
+            self.inotify = Inotify()
+            try:
+                self.inotify.add_watch(str(self.file_path.parent), INOTIFY_CHANGE_MASK)
+            except OSError as error:
+                self.close()
+                raise PyProcWatchError(f"Failed to watch {path} for changes: {error}") from error
 
-        result = CommandResult()
-        reader_thread = threading.Thread(target=reader_thread_func, args=(result, proc.stdout, max_lines))
-        reader_thread.start()
+    def __enter__(self) -> "FileSource":
+        return self
 
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+
+    @property
+    def fd(self) -> Optional[int]:
+        return None if self.inotify is None else self.inotify.fd
+
+    def notified(self) -> bool:
+        # Consumes the pending notifications, events about other entries of the directory are dropped. A notification
+        # about the file is kept until the file is checked.
+        if self.inotify is not None and any(name == self.file_path.name for _, _, name in self.inotify.read_events()):
+            self.pending = True
+        return self.pending
+
+    def _changed(self) -> bool:
+        if self.pseudo:
+            return True
+        notified = self.notified()
+        self.pending = False
+        try:
+            stat_result = self.file_path.stat()
+            file_stat: Optional[Tuple[int, int, int]] = (
+                stat_result.st_ino,
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+            )
+        except OSError:
+            file_stat = None
+        # The file is checked before it is read, a change during the read shows up in the next check.
+        changed = notified or file_stat != self.last_stat
+        self.last_stat = file_stat
+        return changed
+
+    def read(
+        self,
+        max_lines: int,
+        max_bytes: int = 0,
+        scrollback: bool = False,
+        tracker: "Optional[FieldTracker]" = None,
+    ) -> CommandResult:
+        changed = self._changed()
+        if changed or self.result is None or self.last_read != (max_lines, max_bytes, scrollback):
+            self.result = read_file(self.path, max_lines, max_bytes, scrollback, self.tail, tracker)
+            self.last_read = (max_lines, max_bytes, scrollback)
+        return self.result
+
+
+class ChangeMonitor:
+    # Watches paths for changes with inotify: files through their parent directory (so replacing them is seen too),
+    # directories with all their subdirectories, new subdirectories are watched as they appear.
+    def __init__(self, paths: Sequence[str]) -> None:
+        import pathlib
+
+        if sys.platform != "linux":  # pragma: no cover
+            raise PyProcWatchError("Watching paths for changes requires Linux inotify")
+        self.inotify = Inotify()
+        self.directories: "Dict[int, pathlib.Path]" = {}
+        # Names of the watched files in a directory, None when all of its entries are watched.
+        self.names: Dict[int, Optional[Set[str]]] = {}
+        # Set when paths changed while the command ran, the next run is an extra one.
+        self.rerun = False
         try:
-            while (exit_status := proc.poll()) is None:
+            for path in paths:
+                file_path = pathlib.Path(path)
+                if file_path.is_dir():
+                    self._watch_tree(file_path)
+                else:
+                    names = self.names.get(self._watch(file_path.parent), set())
+                    if names is not None:
+                        names.add(file_path.name)
+        except OSError as error:
+            self.close()
+            raise PyProcWatchError(f"Failed to watch {error.filename} for changes: {error.strerror}") from error
+
+    def __enter__(self) -> "ChangeMonitor":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.inotify.close()
+
+    @property
+    def fd(self) -> int:
+        return self.inotify.fd
+
+    def _watch(self, directory: "pathlib.Path") -> int:
+        descriptor = self.inotify.add_watch(str(directory), INOTIFY_CHANGE_MASK)
+        self.directories[descriptor] = directory
+        self.names.setdefault(descriptor, set())
+        return descriptor
+
+    def _watch_tree(self, directory: "pathlib.Path") -> None:
+        import pathlib
+
+        for root, _, _ in os.walk(directory):
+            self.names[self._watch(pathlib.Path(root))] = None
+
+    def changed(self) -> bool:
+        # Whether a watched path changed since the last call or while the command last ran, consumes the pending
+        # events.
+        return self._read_events() or self.rerun
+
+    def _read_events(self) -> bool:
+        changed = False
+        for descriptor, mask, name in self.inotify.read_events():
+            names = self.names.get(descriptor, set())
+            if names is None or name in names:
+                changed = True
+                if names is None and mask & INOTIFY_IS_DIRECTORY and mask & INOTIFY_NEW_ENTRY_MASK:
+                    # The directory may already be gone again.
+                    with contextlib.suppress(OSError):
+                        self._watch_tree(self.directories[descriptor] / name)
+        return changed
+
+    def after_run(self) -> None:
+        # Changes made while the command ran may be edits its output does not show yet, they run it once more. Changes
+        # during that extra run are taken as the command's own (like git status refreshing the index) and dropped, so
+        # a command changing watched paths does not run in a loop.
+        changed = self._read_events()
+        self.rerun = changed and not self.rerun
+
+    def settle(self, quiet_time: float = CHANGE_QUIET_TIME, limit: float = CHANGE_SETTLE_LIMIT) -> None:
+        deadline = time.monotonic() + limit
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.fd, selectors.EVENT_READ)
+            while (remaining := deadline - time.monotonic()) > 0 and selector.select(min(quiet_time, remaining)):
+                self.changed()
+
+    def wait(self, timeout: Optional[float] = None, sleep: Optional[Callable[[float], bool]] = None) -> None:
+        # Returns after a burst of changes settled, or after the timeout without any change. A sleep waking up on
+        # changes (like the one of the terminal) can replace the selector, it ends the wait early by returning True.
+        deadline = math.inf if timeout is None else time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.fd, selectors.EVENT_READ)
+            while not self.changed():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if sleep is None:
+                    selector.select(min(remaining, 60.0))
+                elif sleep(min(remaining, 60.0)):
+                    return
+        self.settle()
+
+
+class ShellCoprocess:
+    def __init__(self, shell: str, probe_timeout: float = 10.0) -> None:
+        self.shell = shell
+        self.probe_timeout = probe_timeout
+        self.proc: "Optional[subprocess.Popen[bytes]]" = None
+
+    def __enter__(self) -> "ShellCoprocess":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.proc is not None:
+            kill_process_group(self.proc)
+            with contextlib.suppress(BrokenPipeError), self.proc:
                 pass
-            result.exit_status = exit_status
-            reader_thread.join()
+            self.proc = None
+
+    @staticmethod
+    def _script(command: str, sentinel: str) -> bytes:
+        # The command runs in the long-lived shell, a unique sentinel printed after it marks the end of its output
+        # and carries its exit status.
+        return f"{{ {command}\n}} </dev/null\nprintf '%s %d\\n' {sentinel} \"$?\"\n".encode()
+
+    def _probe(self, proc: "subprocess.Popen[bytes]") -> None:
+        import uuid
+
+        # A shell that does not understand the POSIX syntax of the script (e.g. fish or tcsh) never prints the
+        # sentinel, without this check the first run would wait for it forever.
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+        sentinel = uuid.uuid4().hex.encode()
+        proc.stdin.write(self._script("true", sentinel.decode()))
+        proc.stdin.flush()
+        timer = threading.Timer(self.probe_timeout, kill_process_group, args=(proc,))
+        timer.start()
+        try:
+            while line := proc.stdout.readline():
+                if sentinel in line:
+                    if line.endswith(sentinel + b" 0\n"):
+                        return
+                    break
+        finally:
+            timer.cancel()
+        self.close()
+        raise PyProcWatchError(
+            f"Shell {self.shell} does not understand POSIX syntax, set SHELL to a POSIX shell for the persistent shell"
+        )
+
+    def _send(self, script: bytes) -> "subprocess.Popen[bytes]":
+        if self.proc is None or self.proc.poll() is not None:
+            self.close()
+            self.proc = subprocess.Popen(
+                [self.shell],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            if self.proc.stdin is None or self.proc.stdout is None:
+                raise PyProcWatchError("Failed to open shell co-process pipes")
+            self._probe(self.proc)
+        assert self.proc.stdin is not None
+        self.proc.stdin.write(script)
+        self.proc.stdin.flush()
+        return self.proc
+
+    @staticmethod
+    def _expire(proc: "subprocess.Popen[bytes]", result: CommandResult) -> None:
+        result.timed_out = True
+        kill_process_group(proc)
+
+    def run(
+        self,
+        command: str,
+        max_lines: int,
+        max_bytes: int = 0,
+        timeout: float = 0.0,
+        scrollback: bool = False,
+        tracker: "Optional[FieldTracker]" = None,
+    ) -> CommandResult:
+        import uuid
+
+        _check_max_lines(max_lines, scrollback)
+
+        sentinel = uuid.uuid4().hex
+        script = self._script(command, sentinel)
+        try:
+            proc = self._send(script)
+        except BrokenPipeError:
+            self.close()
+            proc = self._send(script)
+        assert proc.stdout is not None
+
+        result = CommandResult(tracker)
+        sentinel_bytes = sentinel.encode()
+        timer = threading.Timer(timeout, self._expire, args=(proc, result)) if timeout else None
+        if timer is not None:
+            timer.start()
+        try:
+            while line := proc.stdout.readline():
+                if (sentinel_at := line.find(sentinel_bytes)) >= 0:
+                    line, status = line[:sentinel_at], line[sentinel_at + len(sentinel_bytes) :]
+                    result.exit_status = int(status)
+                if line and result.line_count < max_lines:
+                    result.output_hash.update(line)
+                    result.add_raw_line(line)
+                else:
+                    result.total_read_bytes += len(line)
+                if sentinel_at >= 0:
+                    return result
+                if max_bytes and result.total_read_bytes >= max_bytes:
+                    result.truncated = True
+                    break
         finally:
-            proc.kill()
+            if timer is not None:
+                timer.cancel()
 
+        # The shell exited (for example the command called exit or was killed after hitting a limit), it will be
+        # started again on the next run.
+        kill_process_group(proc)
+        result.exit_status = proc.wait()
+        self.close()
         return result
 
 
+@functools.lru_cache(maxsize=None)
+def _char_width(char: str) -> int:
+    category = unicodedata.category(char)
+    if category == "Cc":
+        return -1
+    if category in ("Mn", "Me", "Cf") or unicodedata.combining(char):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+
+def _append_visible(output: List[str], text: str, column: int, max_width: int) -> int:
+    if text.isascii() and text.isprintable():
+        output.append(text[: max_width - column])
+        return min(column + len(text), max_width)
+
+    for char in text:
+        if char == "\t":
+            spaces = min(TAB_SIZE - column % TAB_SIZE, max_width - column)
+            output.append(" " * spaces)
+            column += spaces
+            continue
+        width = _char_width(char)
+        if width < 0:
+            continue
+        if column + width > max_width:
+            # Wide character does not fit in the last column, pad so the line still ends exactly at max_width.
+            output.append(" " * (max_width - column))
+            return max_width
+        output.append(char)
+        column += width
+    return column
+
+
 def ansi_aware_line_trim(line: str, max_width: int) -> str:
     if max_width < 1 or max_width > 8192:
         raise ValueError(f"Invalid maximum width: {max_width}")
 
-    line = REMOVE_OTHER_ANSI_SEQS.sub("", line.rstrip())
-    if len(REMOVE_ANSI_COLOR_SEQS.sub("", line)) < max_width:
-        return f"{line}{colorama.ansi.clear_line(0)}\n"
-    chop_at = max_width
-    while len(INCOMPLETE_ANSI_SEQ.sub("", REMOVE_ANSI_COLOR_SEQS.sub("", line[:chop_at]))) < max_width:
-        chop_at += 1
-    chopped_line = INCOMPLETE_ANSI_SEQ.sub("", line[:chop_at])
-    return f"{chopped_line}{colorama.Style.RESET_ALL}"
+    # Single pass over the line: visible text is measured in terminal columns, SGR (color) sequences are kept, all
+    # other escape sequences and control characters are dropped.
+    line = line.rstrip()
+    output: List[str] = []
+    column = 0
+    position = 0
+    for match in ANSI_ESCAPE_SEQ.finditer(line):
+        column = _append_visible(output, line[position : match.start()], column, max_width)
+        if column >= max_width:
+            return f"{''.join(output)}{STYLE_RESET}"
+        if match.group(1) == "m":
+            output.append(match.group())
+        position = match.end()
+    column = _append_visible(output, line[position:], column, max_width)
+    if column >= max_width:
+        return f"{''.join(output)}{STYLE_RESET}"
+    return f"{''.join(output)}{CLEAR_LINE}\n"
+
+
+def _changed_cells(line: str, previous_line: str) -> bytearray:
+    # Cells are visible characters (escape sequences removed), everything past the end of the previous line is new.
+    visible = ANSI_ESCAPE_SEQ.sub("", line)
+    previous_visible = ANSI_ESCAPE_SEQ.sub("", previous_line)
+    changed = bytearray(len(visible))
+    for index, (char, previous_char) in enumerate(zip(visible, previous_visible)):
+        if char != previous_char:
+            changed[index] = 1
+    changed[len(previous_visible) :] = b"\x01" * (len(visible) - len(previous_visible))
+    return changed
+
+
+def highlight_cells(line: str, changed: bytearray) -> str:
+    # Runs of changed visible characters are wrapped in reverse video, SGR sequences of the line are kept so
+    # ansi_aware_line_trim can still trim it. Inside a run reverse video is enabled again after every sequence as it
+    # could have been reset.
+    offsets: Sequence[int] = range(len(line))
+    if "\033" in line:
+        offsets = []
+        position = 0
+        for match in ANSI_ESCAPE_SEQ.finditer(line):
+            offsets.extend(range(position, match.start()))
+            position = match.end()
+        offsets.extend(range(position, len(line)))
+
+    output: List[str] = []
+    position = 0
+    end = 0
+    limit = min(len(changed), len(offsets))
+    while (start := changed.find(1, end, limit)) >= 0:
+        end = changed.find(0, start, limit)
+        if end < 0:
+            end = limit
+        run_start, run_end = offsets[start], offsets[end - 1] + 1
+        run = line[run_start:run_end]
+        if "\033" in run:
+            run = ANSI_ESCAPE_SEQ.sub(f"\\g<0>{HIGHLIGHT_ON}", run)
+        output.extend((line[position:run_start], HIGHLIGHT_ON, run, HIGHLIGHT_OFF))
+        position = run_end
+    output.append(line[position:])
+    return "".join(output)
+
+
+class DifferenceHighlighter:
+    # Highlights cells that differ from the previous run, or in cumulative mode cells that changed in any run so far.
+    # Only lines that are not equal to the previous ones are compared cell by cell.
+    def __init__(self, cumulative: bool = False) -> None:
+        self.cumulative = cumulative
+        self.previous_lines: Optional[Sequence[str]] = None
+        self.changed_cells: List[Optional[bytearray]] = []
+        self.highlighted = False
+
+    def reset(self) -> None:
+        self.previous_lines = None
+        self.changed_cells = []
+        self.highlighted = False
+
+    def highlight(self, lines: Sequence[str]) -> Sequence[str]:
+        previous_lines = self.previous_lines
+        self.previous_lines = lines
+        if previous_lines is None:
+            return lines
+
+        if not self.cumulative:
+            self.changed_cells = []
+        self.changed_cells.extend([None] * (len(lines) - len(self.changed_cells)))
+        output = []
+        self.highlighted = False
+        for index, line in enumerate(lines):
+            changed = self.changed_cells[index]
+            if index >= len(previous_lines) or line != previous_lines[index]:
+                new_changes = _changed_cells(
+                    line.rstrip(), previous_lines[index].rstrip() if index < len(previous_lines) else ""
+                )
+                if changed is not None:
+                    for cell in range(min(len(changed), len(new_changes))):
+                        new_changes[cell] |= changed[cell]
+                changed = self.changed_cells[index] = new_changes
+            if changed is not None and 1 in changed:
+                output.append(highlight_cells(line.rstrip(), changed))
+                self.highlighted = True
+            else:
+                output.append(line)
+        return output
+
+
+class FrameRenderer:
+    def __init__(self) -> None:
+        self.size = (0, 0)
+        self.status_color = ""
+        self.status_text = ""
+        self.rows: List[str] = []
+        self.last_frame_bytes = 0
+
+    def render(self, size: Tuple[int, int], status_color: str, status_text: str, lines: List[str]) -> str:
+        # Compose escape sequences updating only the parts of the screen that differ from the previously rendered
+        # frame: the changed tail of the status line and runs of consecutive changed lines.
+        width, height = size
+        rows = lines[: height - 1]
+        if rows:
+            rows[-1] = rows[-1].rstrip("\n")
+        full_redraw = size != self.size
+
+        parts = []
+        if full_redraw or status_color != self.status_color or len(status_text) != len(self.status_text):
+            parts.append(f"{cursor_position(1, 1)}{status_color}{status_text}{COLOR_RESET}")
+        elif status_text != self.status_text:
+            column = len(os.path.commonprefix([status_text, self.status_text]))
+            parts.append(f"{cursor_position(column + 1, 1)}{status_color}{status_text[column:]}{COLOR_RESET}")
+
+        # Runs are always positioned explicitly: after a full-width status line the cursor waits at the last column
+        # instead of wrapping, so the erase and newline of an empty first row would land on the status line.
+        run_start = -1
+        for index, row in enumerate([*rows, None]):
+            changed = row is not None and (full_redraw or index >= len(self.rows) or self.rows[index] != row)
+            if changed and run_start < 0:
+                run_start = index
+            elif not changed and run_start >= 0:
+                parts.append(cursor_position(1, run_start + 2))
+                parts.extend(rows[run_start:index])
+                run_start = -1
+        parts.append(cursor_position(width, height))
+
+        self.size = size
+        self.status_color = status_color
+        self.status_text = status_text
+        self.rows = rows
+        frame = "".join(parts)
+        self.last_frame_bytes = len(frame.encode("UTF-8"))
+        return frame
+
+    def render_status(self, status_color: str, status_text: str) -> str:
+        return self.render(self.size, status_color, status_text, self.rows)
 
 
 def check_shell(command: str) -> Tuple[bool, List[str]]:
+    import pathlib
+    import shlex
+    import shutil
+
     if shell_env := os.getenv("SHELL"):
         shell = shell_env if pathlib.Path(shell_env).is_file() else shutil.which(shell_env)
         if not shell:
@@ -113,33 +1127,1156 @@ def check_shell(command: str) -> Tuple[bool, List[str]]:
     return True, shlex.split(command)
 
 
-def watch(command: str, interval: float = 1.0, precise: bool = False, show_debug: bool = False) -> None:
-    if not command:
+def _check_terminal_size(width: int, height: int) -> None:
+    if width < 48 or height < 4:
+        raise PyProcWatchError(f"Terminal window too small: ({width}x{height}), need at least (48x4)")
+
+
+def _fit_status_line(left: str, right: str, width: int) -> str:
+    if (status_len := len(left) + len(right)) > width:
+        return left[: width - len(right) - 1] + "…" + right
+    return left + " " * (width - status_len) + right
+
+
+def _run_status(command_result: CommandResult) -> str:
+    if command_result.timed_out:
+        return "timed out"
+    if command_result.truncated:
+        return f"exit status: {command_result.exit_status}, truncated"
+    return f"exit status: {command_result.exit_status}"
+
+
+class TickScheduler:
+    def __init__(
+        self,
+        interval: float,
+        missed_tick_policy: str = "skip",
+        clock: Optional[Callable[[], float]] = None,
+        sleep: Optional[Callable[[float], object]] = None,
+    ) -> None:
+        if missed_tick_policy not in MISSED_TICK_POLICIES:
+            raise ValueError(f"Invalid missed tick policy: {missed_tick_policy}")
+        self.interval = interval
+        self.missed_tick_policy = missed_tick_policy
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or time.sleep
+        self.start = self.clock()
+        self.tick = 0
+        self.jitter = 0.0
+        self.overruns = 0
+
+    def wait(self) -> None:
+        # Deadlines are always computed from the start time (start + tick * interval), so errors of individual sleeps
+        # never accumulate.
+        self.tick += 1
+        deadline = self.start + self.tick * self.interval
+        now = self.clock()
+        if now > deadline and self.interval > 0:
+            self.overruns += 1
+            missed_ticks = math.floor((now - self.start) / self.interval)
+            if self.missed_tick_policy == "immediate":
+                self.jitter = now - deadline
+                return
+            if self.missed_tick_policy == "coalesce":
+                self.jitter = now - deadline
+                self.tick = missed_ticks
+                return
+            self.tick = missed_ticks + 1
+            deadline = self.start + self.tick * self.interval
+        self.sleep(max(0.0, deadline - now))
+        self.jitter = self.clock() - deadline
+
+
+class RunPipeline:
+    def __init__(
+        self,
+        run: "Callable[[Callable[[subprocess.Popen[bytes]], None]], CommandResult]",
+        interval: float,
+        max_in_flight: int,
+    ) -> None:
+        import concurrent.futures
+
+        if max_in_flight < 1:
+            raise ValueError(f"Invalid number of runs in flight: {max_in_flight}")
+        self.run = run
+        self.interval = interval
+        self.max_in_flight = max_in_flight
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_in_flight, thread_name_prefix="py-proc-watch-run")
+        self.in_flight: "Dict[concurrent.futures.Future[Tuple[float, float, CommandResult]], int]" = {}
+        self.processes: "Dict[int, subprocess.Popen[bytes]]" = {}
+        self.next_start = time.monotonic()
+        self.started = 0
+        self.shown = -1
+        self.dropped = 0
+
+    def __enter__(self) -> "RunPipeline":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Runs still in flight are not waited for, their processes are killed so the worker threads finish quickly.
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for proc in list(self.processes.values()):
+            kill_process_group(proc)
+
+    def _run(self, sequence: int) -> Tuple[float, float, CommandResult]:
+        def started(proc: "subprocess.Popen[bytes]") -> None:
+            self.processes[sequence] = proc
+
+        start_time = time.time()
+        try:
+            command_result = self.run(started)
+        finally:
+            self.processes.pop(sequence, None)
+        return start_time, time.time() - start_time, command_result
+
+    def next_result(self) -> Tuple[float, float, CommandResult]:
+        import concurrent.futures
+
+        # Runs are started every interval (as soon as a run finishes when all slots are busy), the result of the
+        # newest finished run is returned. Runs finishing after a newer one was returned are dropped.
+        while True:
+            now = time.monotonic()
+            if now >= self.next_start and len(self.in_flight) < self.max_in_flight:
+                self.in_flight[self.executor.submit(self._run, self.started)] = self.started
+                self.started += 1
+                self.next_start = max(self.next_start + self.interval, now)
+            timeout = max(0.0, self.next_start - now) if len(self.in_flight) < self.max_in_flight else None
+            done, _ = concurrent.futures.wait(self.in_flight, timeout, concurrent.futures.FIRST_COMPLETED)
+            finished = sorted(
+                ((self.in_flight.pop(future), future.result()) for future in done), key=lambda item: item[0]
+            )
+            fresh = [item for item in finished if item[0] > self.shown]
+            self.dropped += len(finished) - min(len(fresh), 1)
+            if fresh:
+                self.shown, result = fresh[-1]
+                return result
+
+
+def group_results(
+    targets: Sequence[str],
+    results: Sequence[CommandResult],
+    max_lines: int,
+    tracker: "Optional[FieldTracker]" = None,
+) -> CommandResult:
+    # Targets with identical output and status are collapsed into one group, groups are listed in target order. Every
+    # group is hashed even when only the first max_lines lines of the combined output are kept.
+    groups: Dict[Tuple[bytes, str], List[int]] = {}
+    for index, result in enumerate(results):
+        groups.setdefault((result.output_hash.digest(), _run_status(result)), []).append(index)
+    combined = CommandResult()
+    for (_digest, status), indexes in groups.items():
+        result = results[indexes[0]]
+        for line in [f"{', '.join(targets[index] for index in indexes)} ({status}):\n", *result.stdout_lines]:
+            raw_line = line.encode("UTF-8", "backslashreplace")
+            combined.output_hash.update(raw_line)
+            if combined.line_count < max_lines:
+                combined.add_raw_line(raw_line)
+    combined.exit_status = next((result.exit_status for result in results if result.exit_status != 0), 0)
+    combined.total_read_bytes = sum(result.total_read_bytes for result in results)
+    combined.used_bytes = sum(result.used_bytes for result in results)
+    combined.truncated = any(result.truncated for result in results)
+    combined.timed_out = all(result.timed_out for result in results)
+    if tracker is not None:
+        # Numbers come from the output of the targets in order, never from the group headers. Identical outputs give
+        # the same numbers, so one target per group is enough.
+        combined.tracked = tracker.new_values()
+        for indexes in groups.values():
+            tracker.extract(results[indexes[0]].stdout_lines, 0, combined.tracked)
+    return combined
+
+
+class FanOut:
+    # Runs the command for every target at once on a bounded pool of threads, so a run takes about as long as the
+    # slowest target instead of the sum of all of them.
+    def __init__(self, command: str, targets: Sequence[str], max_in_flight: int) -> None:
+        import concurrent.futures
+        import shlex
+
+        if not targets:
+            raise ValueError("No targets to run the command for")
+        if max_in_flight < 1:
+            raise ValueError(f"Invalid number of parallel targets: {max_in_flight}")
+        self.targets = list(targets)
+        self.commands = [check_shell(command.replace("{}", shlex.quote(target))) for target in targets]
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            min(max_in_flight, len(targets)), thread_name_prefix="py-proc-watch-target"
+        )
+        self.processes: "Dict[int, subprocess.Popen[bytes]]" = {}
+
+    def __enter__(self) -> "FanOut":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Targets still running (when interrupted) are not waited for, their processes are killed instead.
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for proc in list(self.processes.values()):
+            kill_process_group(proc)
+
+    def _run_target(
+        self, index: int, max_lines: int, max_bytes: int, timeout: float, scrollback: bool
+    ) -> CommandResult:
+        def started(proc: "subprocess.Popen[bytes]") -> None:
+            self.processes[index] = proc
+
+        use_shell, run_command = self.commands[index]
+        try:
+            return get_output(run_command, use_shell, max_lines, max_bytes, timeout, scrollback, on_start=started)
+        finally:
+            self.processes.pop(index, None)
+
+    def run(
+        self,
+        max_lines: int,
+        max_bytes: int = 0,
+        timeout: float = 0.0,
+        scrollback: bool = False,
+        tracker: "Optional[FieldTracker]" = None,
+    ) -> CommandResult:
+        results = list(
+            self.executor.map(
+                lambda index: self._run_target(index, max_lines, max_bytes, timeout, scrollback),
+                range(len(self.targets)),
+            )
+        )
+        return group_results(self.targets, results, max_lines, tracker)
+
+
+class LatencyHistogram:
+    # Log-linear buckets starting at 1us, a few per power of two, keep memory constant however long pywatch runs.
+    def __init__(self) -> None:
+        self.counts = [0] * (HISTOGRAM_BUCKETS_PER_OCTAVE * 40)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        index = math.ceil(math.log2(seconds * 1e6) * HISTOGRAM_BUCKETS_PER_OCTAVE) if seconds > 1e-6 else 0
+        self.counts[min(index, len(self.counts) - 1)] += 1
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        # Reported values are upper bounds of the bucket holding the requested rank.
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return 2 ** (index / HISTOGRAM_BUCKETS_PER_OCTAVE) / 1e6
+        return 0.0
+
+
+def _percentiles_display(histograms: Dict[str, LatencyHistogram], phases: Sequence[str]) -> str:
+    return (
+        " p50/95/99 "
+        + " ".join(
+            f"{phase[0]}:"
+            + "/".join(f"{histograms[phase].percentile(percent) * 1000:0.1f}" for percent in (50, 95, 99))
+            for phase in phases
+        )
+        + "ms"
+    )
+
+
+class ValueHistory:
+    # Ring buffer of the last values of a tracked number and their times, memory stays the same however long pywatch
+    # runs.
+    def __init__(self, size: int) -> None:
+        if size < 2:
+            raise ValueError(f"Invalid history size: {size}")
+        self.times = array.array("d", bytes(8 * size))
+        self.values = array.array("d", bytes(8 * size))
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, len(self.values))
+
+    def append(self, timestamp: float, value: float) -> None:
+        index = self.count % len(self.values)
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.count += 1
+
+    def latest(self, count: int) -> List[float]:
+        # Oldest first.
+        size = len(self.values)
+        return [self.values[index % size] for index in range(self.count - min(count, len(self)), self.count)]
+
+    def kept(self) -> "array.array[float]":
+        return self.values if self.count >= len(self.values) else self.values[: self.count]
+
+    def rate(self) -> float:
+        # Change per second between the oldest and the newest kept value.
+        if len(self) < 2:
+            return 0.0
+        size = len(self.values)
+        first, last = (self.count - len(self)) % size, (self.count - 1) % size
+        elapsed = self.times[last] - self.times[first]
+        return (self.values[last] - self.values[first]) / elapsed if elapsed > 0 else 0.0
+
+
+def sparkline(values: Sequence[float]) -> str:
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    steps = len(SPARKLINE_BLOCKS) - 1
+    return "".join(
+        SPARKLINE_BLOCKS[round((value - low) / (high - low) * steps) if high > low else 0] for value in values
+    )
+
+
+class FieldTracker:
+    # Extracts a number per pattern from every run while its lines are collected: the first capture group (or the
+    # whole match) of the first line where it is a number. Lines are matched raw, before they are decoded.
+    def __init__(self, patterns: Sequence[str], history: int = TRACK_HISTORY) -> None:
+        self.patterns = [_compile_track_pattern(pattern) for pattern in patterns]
+        self.labels = [next(iter(pattern.groupindex), pattern.pattern.decode()) for pattern in self.patterns]
+        self.histories = [ValueHistory(history) for _ in patterns]
+
+    def new_values(self) -> "array.array[float]":
+        return array.array("d", [math.nan]) * len(self.patterns)
+
+    def extract(self, lines: LineBuffer, first_line: int, values: "array.array[float]") -> None:
+        # Lines from first_line on are searched in place in the buffer, patterns are multi-line so ^ and $ match at the
+        # start and end of every line.
+        data, ends = lines.data, lines.ends
+        start = ends[first_line - 1] if first_line > 0 else 0
+        for line_index in range(first_line, len(ends)):
+            end = ends[line_index]
+            for index, pattern in enumerate(self.patterns):
+                if math.isnan(values[index]) and (match := pattern.search(data, start, end)):
+                    # A group that did not take part in the match is None.
+                    with contextlib.suppress(TypeError, ValueError):
+                        values[index] = float(match.group(1 if pattern.groups else 0))
+            start = end
+
+    def record(self, timestamp: float, values: Sequence[float]) -> None:
+        for history, value in zip(self.histories, values):
+            if not math.isnan(value):
+                history.append(timestamp, value)
+
+    def describe(self) -> str:
+        parts = []
+        for label, history in zip(self.labels, self.histories):
+            if not history:
+                parts.append(f"{label} -")
+                continue
+            values = history.latest(SPARKLINE_WIDTH)
+            kept = history.kept()
+            parts.append(
+                f"{label} {sparkline(values)} {_format_number(values[-1])} min {_format_number(min(kept))} "
+                f"max {_format_number(max(kept))} {history.rate():+.3g}/s"
+            )
+        return "  ".join(parts)
+
+
+def _format_number(value: float) -> str:
+    # Counters and sizes are shown with all their digits, not in exponent notation.
+    return f"{value:.0f}" if value.is_integer() and abs(value) < 1e15 else f"{value:.6g}"
+
+
+def _compile_track_pattern(pattern: str) -> "re.Pattern[bytes]":
+    try:
+        return re.compile(pattern.encode(), re.MULTILINE)
+    except re.error as error:
+        raise ValueError(f"Invalid track pattern {pattern}: {error}") from error
+
+
+def _screen_lines(lines: Sequence[str], width: int, height: int) -> List[str]:
+    buffer = [
+        ansi_aware_line_trim(line, width if index + 2 < height else width - 1)
+        for index, line in enumerate(lines[: height - 1])
+    ]
+    if len(buffer) < height - 1:
+        buffer.extend([PADDING_LINE] * (height - len(buffer) - 1))
+    return buffer
+
+
+class ScrollView:
+    # Position of the visible window in the scrollback, kept across runs. Once scrolled to the end it follows the end
+    # of the output.
+    def __init__(self) -> None:
+        self.position = 0
+        self.at_end = False
+
+    def scroll(self, key: str, line_count: int, page: int) -> bool:
+        moves = {
+            "down": 1,
+            "j": 1,
+            "up": -1,
+            "k": -1,
+            "page_down": page,
+            " ": page,
+            "page_up": -page,
+            "home": -line_count,
+            "g": -line_count,
+            "end": line_count,
+            "G": line_count,
+        }
+        if key not in moves:
+            return False
+        last_position = max(line_count - page, 0)
+        position = min(max(self.position + moves[key], 0), last_position)
+        self.at_end = 0 < position == last_position
+        moved = position != self.position
+        self.position = position
+        return moved
+
+    def window(self, lines: LineBuffer, page: int) -> List[str]:
+        last_position = max(len(lines) - page, 0)
+        self.position = last_position if self.at_end else min(self.position, last_position)
+        return lines.window(self.position, page)
+
+    def describe(self, line_count: int, shown: int) -> str:
+        return f" [{self.position + min(shown, 1)}-{self.position + shown}/{line_count}]"
+
+
+def _common_length(first: Iterable[bytes], second: Iterable[bytes]) -> int:
+    length = 0
+    for first_line, second_line in zip(first, second):
+        if first_line != second_line:
+            break
+        length += 1
+    return length
+
+
+def line_changes(previous_lines: Sequence[bytes], lines: Sequence[bytes]) -> Tuple[List[bytes], List[bytes]]:
+    # Added and removed lines, compared as multisets: lines that only moved are not reported, repeated lines count.
+    # Usually only a few lines differ, equal lines at the start and the end are skipped before counting.
+    start = _common_length(previous_lines, lines)
+    end = _common_length(reversed(previous_lines[start:]), reversed(lines[start:]))
+    previous_lines = previous_lines[start : len(previous_lines) - end]
+    lines = lines[start : len(lines) - end]
+
+    remaining = collections.Counter(previous_lines)
+    get_count = remaining.get
+    added = []
+    for line in lines:
+        count = get_count(line)
+        if count:
+            remaining[line] = count - 1
+        else:
+            added.append(line)
+    removed = []
+    if len(previous_lines) + len(added) > len(lines):
+        for line in previous_lines:
+            count = get_count(line)
+            if count:
+                remaining[line] = count - 1
+                removed.append(line)
+    return added, removed
+
+
+class HeadlessWriter:
+    # Writes every run as a record instead of drawing the screen: the whole output or the lines added and removed
+    # since the previous run, as JSON lines or plain text with a header line per run.
+    def __init__(self, stream: BinaryIO, command: str, output_format: str = "jsonl", deltas: bool = False) -> None:
+        if output_format not in HEADLESS_FORMATS:
+            raise ValueError(f"Invalid headless output format: {output_format}")
+        self.stream = stream
+        self.command = command
+        self.output_format = output_format
+        self.deltas = deltas
+        self.previous_lines: List[bytes] = []
+        self.previous_digest: Optional[bytes] = None
+
+    def render(self, frame: "Frame") -> None:
+        self.write(frame.time, frame.command_result)
+
+    def write(self, timestamp: float, command_result: CommandResult) -> None:
+        import datetime
+        import json
+
+        lines = command_result.stdout_lines
+        added: List[bytes] = []
+        removed: List[bytes] = []
+        if self.deltas:
+            digest = command_result.output_hash.digest()
+            if digest != self.previous_digest:
+                # Compared without newlines, the last line without one did not change when more lines follow it.
+                raw_lines = lines.split_lines()
+                added, removed = line_changes(self.previous_lines, raw_lines)
+                self.previous_lines = raw_lines
+            self.previous_digest = digest
+
+        if self.output_format == "jsonl":
+            record: Dict[str, object] = {
+                "time": timestamp,
+                "command": self.command,
+                "exit_status": command_result.exit_status,
+                "truncated": command_result.truncated,
+                "timed_out": command_result.timed_out,
+            }
+            if command_result.tracked is not None:
+                record["tracked"] = [None if math.isnan(value) else value for value in command_result.tracked]
+            if self.deltas:
+                record["added"] = [decode_line(line) for line in added]
+                record["removed"] = [decode_line(line) for line in removed]
+            else:
+                # Decoding everything at once and splitting gives the same lines, a lot faster.
+                text = decode_line(lines.data)
+                record["lines"] = text[: -1 if text.endswith("\n") else None].split("\n") if text else []
+            self.stream.write(json.dumps(record).encode() + b"\n")
+        else:
+            moment = datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds")
+            self.stream.write(f"--- {moment} {self.command} ({_run_status(command_result)})\n".encode())
+            if self.deltas:
+                self.stream.write(b"".join(b"-" + line + b"\n" for line in removed))
+                self.stream.write(b"".join(b"+" + line + b"\n" for line in added))
+            elif lines.data:
+                self.stream.write(lines.data if lines.data.endswith(b"\n") else lines.data + b"\n")
+        self.stream.flush()
+
+
+def _recording_index_path(path: str) -> "pathlib.Path":
+    import pathlib
+
+    return pathlib.Path(f"{path}.idx")
+
+
+class FrameRecorder:
+    # Appends every frame to the recording, as a delta of changed lines against the previous frame. Each keyframe
+    # (full frame) restarts the compression stream, so decoding can start at any keyframe found in the index.
+    def __init__(self, path: str, keyframe_interval: int = RECORD_KEYFRAME_INTERVAL) -> None:
+        import pathlib
+
+        if keyframe_interval < 1:
+            raise ValueError(f"Invalid keyframe interval: {keyframe_interval}")
+        self.keyframe_interval = keyframe_interval
+        self.file = pathlib.Path(path).open("ab")
+        self.index = _recording_index_path(path).open("ab")
+        self.compressor = zlib.compressobj()
+        self.previous_lines: List[str] = []
+        self.frames = 0
+
+    def __enter__(self) -> "FrameRecorder":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def record(self, timestamp: float, exit_status: int, lines: List[str]) -> None:
+        import json
+
+        keyframe = self.frames % self.keyframe_interval == 0
+        if keyframe:
+            self.compressor = zlib.compressobj()
+            data: Dict[str, object] = {"exit_status": exit_status, "lines": lines}
+        else:
+            previous_lines = self.previous_lines
+            data = {
+                "exit_status": exit_status,
+                "count": len(lines),
+                "changed": [
+                    (index, line)
+                    for index, line in enumerate(lines)
+                    if index >= len(previous_lines) or line != previous_lines[index]
+                ],
+            }
+        payload = self.compressor.compress(json.dumps(data).encode()) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        offset = self.file.tell()
+        self.file.write(
+            RECORD_HEADER.pack(timestamp, RECORD_KEYFRAME if keyframe else RECORD_DELTA, len(payload)) + payload
+        )
+        self.file.flush()
+        if keyframe:
+            # Indexed only after the keyframe is completely written, the index never points past the end of the file.
+            self.index.write(RECORD_INDEX_ENTRY.pack(timestamp, offset))
+            self.index.flush()
+        self.previous_lines = lines
+        self.frames += 1
+
+    def close(self) -> None:
+        self.file.close()
+        self.index.close()
+
+
+class RecordedFrame(NamedTuple):
+    timestamp: float
+    exit_status: int
+    lines: List[str]
+
+
+class RecordingReader:
+    def __init__(self, path: str) -> None:
+        import pathlib
+
+        try:
+            self.file = pathlib.Path(path).open("rb")
+            self.index = _recording_index_path(path).open("rb")
+        except OSError as error:
+            raise PyProcWatchError(f"Failed to open recording {path}: {error}") from error
+
+    def __enter__(self) -> "RecordingReader":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+        self.index.close()
+
+    def _keyframe(self, position: int) -> Tuple[float, int]:
+        self.index.seek(position * RECORD_INDEX_ENTRY.size)
+        return cast(Tuple[float, int], RECORD_INDEX_ENTRY.unpack(self.index.read(RECORD_INDEX_ENTRY.size)))
+
+    def _keyframe_offset(self, timestamp: float) -> int:
+        # Binary search over the fixed size index entries, only O(log n) entries are read.
+        low, high = 0, os.fstat(self.index.fileno()).st_size // RECORD_INDEX_ENTRY.size
+        if not high:
+            raise PyProcWatchError("Recording is empty")
+        while low < high:
+            middle = (low + high) // 2
+            if self._keyframe(middle)[0] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return self._keyframe(max(0, low - 1))[1]
+
+    def _frames(self, offset: int) -> Iterator[RecordedFrame]:
+        import json
+
+        self.file.seek(offset)
+        decompressor = zlib.decompressobj()
+        lines: List[str] = []
+        while len(header := self.file.read(RECORD_HEADER.size)) == RECORD_HEADER.size:
+            timestamp, kind, size = RECORD_HEADER.unpack(header)
+            payload = self.file.read(size)
+            if len(payload) < size:
+                return
+            if kind == RECORD_KEYFRAME:
+                decompressor = zlib.decompressobj()
+            data = json.loads(decompressor.decompress(payload))
+            if kind == RECORD_KEYFRAME:
+                lines = data["lines"]
+            else:
+                lines = lines[: data["count"]] + [""] * (data["count"] - len(lines))
+                for index, line in data["changed"]:
+                    lines[index] = line
+            yield RecordedFrame(timestamp, data["exit_status"], lines)
+
+    def locate(self, timestamp: float) -> Tuple[Optional[RecordedFrame], Optional[RecordedFrame]]:
+        # Returns the last frame recorded at or before the timestamp and the first frame after it, decoding starts at
+        # the closest preceding keyframe.
+        previous_frame = None
+        for frame in self._frames(self._keyframe_offset(timestamp)):
+            if frame.timestamp > timestamp:
+                return previous_frame, frame
+            previous_frame = frame
+        return previous_frame, None
+
+
+class CommandSource:
+    # Runs the watched command the way the options ask for: a new process or a command of the persistent shell per
+    # run, the command for every target, or reads a file instead. Paths watched for runs on changes are kept with it.
+    def __init__(
+        self,
+        command: str,
+        persistent_shell: bool = False,
+        max_bytes: int = 0,
+        timeout: float = 0.0,
+        targets: Sequence[str] = (),
+        parallel_targets: int = 16,
+        file_path: Optional[str] = None,
+        file_tail: bool = False,
+        change_paths: Sequence[str] = (),
+        track: Sequence[str] = (),
+    ) -> None:
+        self.command = command
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.title = command if file_path is None else file_path
+        self.tracker = FieldTracker(track) if track else None
+        self.use_shell, self.run_command = check_shell(command) if file_path is None else (False, [])
+        if persistent_shell and self.use_shell:
+            raise PyProcWatchError("Persistent shell requires the SHELL environment variable to be set")
+        self.coprocess: Optional[ShellCoprocess] = None
+        self.fan_out: Optional[FanOut] = None
+        self.file_source: Optional[FileSource] = None
+        self.changes: Optional[ChangeMonitor] = None
+        try:
+            if persistent_shell:
+                self.coprocess = ShellCoprocess(self.run_command[0])
+            if targets:
+                self.fan_out = FanOut(command, targets, parallel_targets)
+            if file_path is not None:
+                self.file_source = FileSource(file_path, file_tail)
+            if change_paths:
+                self.changes = ChangeMonitor(change_paths)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> "CommandSource":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for source in (self.coprocess, self.fan_out, self.file_source, self.changes):
+            if source is not None:
+                source.close()
+
+    def run(self, max_lines: int, scrollback: bool) -> CommandResult:
+        tracker = self.tracker
+        if self.coprocess is not None:
+            command_result = self.coprocess.run(
+                self.command, max_lines, self.max_bytes, self.timeout, scrollback, tracker
+            )
+        elif self.fan_out is not None:
+            command_result = self.fan_out.run(max_lines, self.max_bytes, self.timeout, scrollback, tracker)
+        elif self.file_source is not None:
+            command_result = self.file_source.read(max_lines, self.max_bytes, scrollback, tracker)
+        else:
+            command_result = get_output(
+                self.run_command, self.use_shell, max_lines, self.max_bytes, self.timeout, scrollback, tracker=tracker
+            )
+        if self.changes is not None:
+            self.changes.after_run()
+        return command_result
+
+
+class Frame(NamedTuple):
+    # A run as yielded by watch_frames, the output is kept as read without trimming it to a terminal.
+    time: float
+    command_result: CommandResult
+    execution_time: float
+    wait_time: float
+    size: Tuple[int, int]
+    changed: bool
+    unchanged_runs: int
+
+
+def _check_source_options(
+    command: str,
+    interval: float,
+    precise: bool,
+    persistent_shell: bool,
+    max_bytes: int,
+    timeout: float,
+    scrollback: int,
+    pipeline_runs: int,
+    targets: Sequence[str],
+    parallel_targets: int,
+    file_path: Optional[str],
+    file_tail: bool,
+    change_paths: Sequence[str],
+    track: Sequence[str],
+) -> None:
+    if not command and file_path is None:
         raise ValueError(f"Invalid command: {command}")
     if interval < 0.0 or interval >= 24 * 60 * 60:
         raise ValueError(f"Invalid interval value: {interval}")
+    if scrollback < 0 or scrollback > MAX_SCROLLBACK_LINES:
+        raise ValueError(f"Invalid number of scrollback lines: {scrollback}")
+    if pipeline_runs < 0 or pipeline_runs > 64:
+        raise ValueError(f"Invalid number of pipelined runs: {pipeline_runs}")
+    if parallel_targets < 1 or parallel_targets > 256:
+        raise ValueError(f"Invalid number of parallel targets: {parallel_targets}")
+    if max_bytes < 0:
+        raise ValueError(f"Invalid maximum bytes value: {max_bytes}")
+    if timeout < 0.0:
+        raise ValueError(f"Invalid timeout value: {timeout}")
+    if targets and "{}" not in command:
+        raise ValueError(f"Command must contain {{}} to be run for each target: {command}")
+    if targets and (persistent_shell or pipeline_runs):
+        raise ValueError("Targets do not support persistent shell and pipelined runs")
+    if file_path is None and file_tail:
+        raise ValueError("Tail is only shown for a file source")
+    if file_path is not None and (command or persistent_shell or pipeline_runs or targets):
+        raise ValueError("File source does not support commands, persistent shell, pipelined runs and targets")
+    if change_paths and (precise or pipeline_runs):
+        raise ValueError("Runs on changes do not support precise timing and pipelined runs")
+    for pattern in track:
+        _compile_track_pattern(pattern)
+
+
+def _generate_frames(
+    source: CommandSource,
+    interval: float,
+    scheduler: Optional[TickScheduler],
+    get_size: Callable[[], Tuple[int, int]],
+    max_lines: Callable[[Tuple[int, int]], int],
+    scrollback: bool,
+    sleep: Optional[Callable[[float], bool]] = None,
+    pipeline: Optional[RunPipeline] = None,
+) -> Generator[Frame, None, None]:
+    # The runs of both the terminal and watch_frames: a frame per run of the command (or result of the pipeline),
+    # then the wait for the next run once the frame was consumed. The terminal waits with its own sleep, which redraws
+    # on resizes and keys and wakes up on changes of the source.
+    last_digest: Optional[bytes] = None
+    unchanged_runs = 0
+    wait_time = 0.0
+    while True:
+        size = get_size()
+        if pipeline is not None:
+            # Runs are started by the pipeline, waiting for the next result replaces the wait between runs.
+            start_time = time.time()
+            tick_time, execution_time, command_result = pipeline.next_result()
+            wait_time = time.time() - start_time
+        else:
+            tick_time = time.time()
+            command_result = source.run(max_lines(size), scrollback)
+            execution_time = time.time() - tick_time
+        digest = command_result.output_hash.digest()
+        output_changed = last_digest is not None and digest != last_digest
+        unchanged_runs = unchanged_runs + 1 if digest == last_digest else 0
+        last_digest = digest
+        yield Frame(tick_time, command_result, execution_time, wait_time, size, output_changed, unchanged_runs)
+
+        if pipeline is None:
+            start_time = time.time()
+            if scheduler is not None:
+                scheduler.wait()
+            elif source.changes is not None:
+                source.changes.wait(interval or None, sleep)
+            elif sleep is not None:
+                sleep(interval)
+            else:
+                time.sleep(interval)
+            wait_time = time.time() - start_time
+
+
+def _source_frames(
+    open_source: Callable[[], CommandSource], interval: float, precise: bool, missed_tick_policy: str, max_lines: int
+) -> Generator[Frame, None, None]:
+    import shutil
+
+    def get_size() -> Tuple[int, int]:
+        size = shutil.get_terminal_size()
+        return size.columns, size.lines
+
+    with open_source() as source:
+        scheduler = TickScheduler(interval, missed_tick_policy) if precise else None
+        yield from _generate_frames(source, interval, scheduler, get_size, lambda _size: max_lines, True)
+
+
+def watch_frames(
+    command: str,
+    interval: float = 1.0,
+    precise: bool = False,
+    persistent_shell: bool = False,
+    max_bytes: int = 0,
+    timeout: float = 0.0,
+    missed_tick_policy: str = "skip",
+    scrollback: int = 0,
+    targets: Sequence[str] = (),
+    parallel_targets: int = 16,
+    file_path: Optional[str] = None,
+    file_tail: bool = False,
+    change_paths: Sequence[str] = (),
+    track: Sequence[str] = (),
+) -> Generator[Frame, None, None]:
+    # Runs the command like watch without a terminal and yields a frame per run. Options are checked right away, the
+    # first run starts with the first frame taken. The next run waits until the frame is consumed, a consumer slower
+    # than the interval delays runs (or skips ticks with precise timing).
+    _check_source_options(
+        command,
+        interval,
+        precise,
+        persistent_shell,
+        max_bytes,
+        timeout,
+        scrollback,
+        0,
+        targets,
+        parallel_targets,
+        file_path,
+        file_tail,
+        change_paths,
+        track,
+    )
+    if missed_tick_policy not in MISSED_TICK_POLICIES:
+        raise ValueError(f"Invalid missed tick policy: {missed_tick_policy}")
+    open_source = functools.partial(
+        CommandSource,
+        command,
+        persistent_shell,
+        max_bytes,
+        timeout,
+        targets,
+        parallel_targets,
+        file_path,
+        file_tail,
+        change_paths,
+        track,
+    )
+    # All lines (up to the scrollback limit) are kept, so they are collected into the compact line store.
+    return _source_frames(open_source, interval, precise, missed_tick_policy, scrollback or MAX_SCROLLBACK_LINES)
+
+
+def _render_frames(
+    frames: Iterator[Frame],
+    renderer: Callable[[Frame], object],
+    exit_on_change: bool,
+    exit_on_unchanged: int,
+) -> None:
+    try:
+        for frame in frames:
+            renderer(frame)
+            if (exit_on_change and frame.changed) or (exit_on_unchanged and frame.unchanged_runs >= exit_on_unchanged):
+                break
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head), nothing more can be written. Further writes at interpreter
+        # exit go to /dev/null, so flushing stdout does not fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def watch(
+    command: str,
+    interval: float = 1.0,
+    precise: bool = False,
+    show_debug: bool = False,
+    persistent_shell: bool = False,
+    max_bytes: int = 0,
+    timeout: float = 0.0,
+    missed_tick_policy: str = "skip",
+    metrics_file: Optional[str] = None,
+    exit_on_change: bool = False,
+    exit_on_unchanged: int = 0,
+    differences: bool = False,
+    cumulative_differences: bool = False,
+    record_file: Optional[str] = None,
+    scrollback: int = 0,
+    headless: Optional[str] = None,
+    headless_deltas: bool = False,
+    pipeline_runs: int = 0,
+    targets: Sequence[str] = (),
+    parallel_targets: int = 16,
+    file_path: Optional[str] = None,
+    file_tail: bool = False,
+    change_paths: Sequence[str] = (),
+    render: Optional[Callable[[Frame], object]] = None,
+    track: Sequence[str] = (),
+) -> None:
+    import json
+    import pathlib
+
+    _check_source_options(
+        command,
+        interval,
+        precise,
+        persistent_shell,
+        max_bytes,
+        timeout,
+        scrollback,
+        pipeline_runs,
+        targets,
+        parallel_targets,
+        file_path,
+        file_tail,
+        change_paths,
+        track,
+    )
+    if exit_on_unchanged < 0:
+        raise ValueError(f"Invalid number of unchanged runs: {exit_on_unchanged}")
+    if headless is None and headless_deltas:
+        raise ValueError("Deltas are only written in headless mode")
+    if headless is not None and render is not None:
+        raise ValueError("Headless mode writes the frames itself, it does not use a render callback")
+    if (headless is not None or render is not None) and (
+        differences or cumulative_differences or metrics_file or record_file
+    ):
+        raise ValueError("Headless mode does not support differences, metrics and recording")
+    if pipeline_runs and (precise or persistent_shell or scrollback or headless is not None or render is not None):
+        raise ValueError(
+            "Pipelined runs do not support precise timing, persistent shell, scrollback and headless modes"
+        )
+
+    if headless is not None:
+        writer = HeadlessWriter(
+            cast(BinaryIO, sys.stdout.buffer), command if file_path is None else file_path, headless, headless_deltas
+        )
+        render = writer.render
+    if render is not None:
+        frames = watch_frames(
+            command,
+            interval,
+            precise,
+            persistent_shell,
+            max_bytes,
+            timeout,
+            missed_tick_policy,
+            scrollback,
+            targets,
+            parallel_targets,
+            file_path,
+            file_tail,
+            change_paths,
+            track,
+        )
+        with contextlib.closing(frames):
+            _render_frames(frames, render, exit_on_change, exit_on_unchanged)
+        return
 
     if not sys.stdout.isatty():
         raise PyProcWatchError("stdout is not a tty!")
+    if scrollback and not sys.stdin.isatty():
+        raise PyProcWatchError("stdin is not a tty, scrollback needs keyboard input")
 
-    use_shell, run_command = check_shell(command)
-    try:
-        while True:
-            width, height = os.get_terminal_size()
-            if width < 48 or height < 4:
-                raise PyProcWatchError(f"Terminal window too small: ({width}x{height}), need at least (48x4)")
+    source = CommandSource(
+        command,
+        persistent_shell,
+        max_bytes,
+        timeout,
+        targets,
+        parallel_targets,
+        file_path,
+        file_tail,
+        change_paths,
+        track,
+    )
+    changes = source.changes
+    file_source = source.file_source
+    tracker = source.tracker
+    # The row of tracked numbers is reserved under the status line.
+    track_rows = 0 if tracker is None else 1
+    # With runs on changes a non-zero interval bounds how long the output can be stale.
+    if changes is None:
+        schedule = f"Every {interval:0.01f}s"
+    else:
+        schedule = f"On change or every {interval:0.01f}s" if interval else "On change"
+    renderer = FrameRenderer()
+    histograms = {phase: LatencyHistogram() for phase in METRICS_PHASES}
+    write_time = 0.0
+    last_frame_key: Optional[Tuple[object, ...]] = None
+    highlighter = DifferenceHighlighter(cumulative_differences) if differences or cumulative_differences else None
+    metrics = pathlib.Path(metrics_file).open("a", encoding="utf-8") if metrics_file else None
+    recorder = FrameRecorder(record_file) if record_file else None
+    view = ScrollView() if scrollback else None
+    resources = contextlib.ExitStack()
+    keys: Optional[KeyReader] = None
+    terminal = ResizeMonitor()
+    width, height = terminal.size
+    display_lines: Sequence[str] = []
 
-            start_time = time.time()
-            command_result = get_output(run_command, use_shell, height - 1)
-            execution_time = time.time() - start_time
+    def run_lines(size: Tuple[int, int]) -> int:
+        # All of the scrollback, or the rows under the status line (and the tracked numbers).
+        return scrollback or size[1] - 1 - track_rows
+
+    max_lines = run_lines(terminal.size)
 
+    def get_size() -> Tuple[int, int]:
+        size = terminal.get_size()
+        _check_terminal_size(*size)
+        return size
+
+    def tracked_rows() -> List[str]:
+        return [] if tracker is None else [ansi_aware_line_trim(tracker.describe(), width)]
+
+    def wait_for_events(seconds: float) -> bool:
+        # Sleeps like time.sleep, meanwhile redraws the output of the last run when the terminal is resized or keys
+        # scroll it. Returns True early when the resized terminal has room for more lines than the last run captured.
+        nonlocal width, height, display_lines, last_frame_key
+        deadline = time.monotonic() + seconds
+        while (remaining := deadline - time.monotonic()) > 0:
+            key = None
+            if keys is not None:
+                key = keys.read(remaining, terminal.wakeup_fds)
+            else:
+                terminal.wait(remaining)
+            if terminal.check_resized():
+                width, height = terminal.get_size()
+                _check_terminal_size(width, height)
+                if view is None and command_result.line_count >= max_lines and height - 1 - track_rows > max_lines:
+                    return True
+            elif key is None:
+                # Writes to other files next to a watched file do not end the wait. Change notifications are consumed
+                # by wait_for_change, which waits again when they were not about a watched path.
+                if file_source is None or file_source.notified() or changes is not None:
+                    return False
+                continue
+            elif view is None or not view.scroll(key, command_result.line_count, height - 1 - track_rows):
+                continue
+            scroll_display = ""
+            if view is not None:
+                display_lines = view.window(command_result.stdout_lines, height - 1 - track_rows)
+                scroll_display = view.describe(command_result.line_count, len(display_lines))
+                if highlighter is not None:
+                    # Cells are compared with the same window position in the next run.
+                    highlighter.reset()
+                    highlighter.highlight(display_lines)
+            status_line = _fit_status_line(status_text + scroll_display, status_right, width)
+            rows = [*tracked_rows(), *_screen_lines(display_lines, width, height - track_rows)]
+            sys.stdout.write(renderer.render((width, height), status_color, status_line, rows))
+            sys.stdout.flush()
+            last_frame_key = None
+        return False
+
+    scheduler = TickScheduler(interval, missed_tick_policy, sleep=wait_for_events) if precise else None
+    resources.enter_context(terminal)
+    if changes is not None:
+        terminal.extra_fds.append(changes.fd)
+    if file_source is not None and file_source.fd is not None:
+        terminal.extra_fds.append(file_source.fd)
+    if scrollback:
+        keys = resources.enter_context(KeyReader())
+    pipeline = (
+        resources.enter_context(
+            RunPipeline(
+                lambda on_start: get_output(
+                    source.run_command,
+                    source.use_shell,
+                    max_lines,
+                    max_bytes,
+                    timeout,
+                    False,
+                    on_start=on_start,
+                    tracker=tracker,
+                ),
+                interval,
+                pipeline_runs,
+            )
+        )
+        if pipeline_runs
+        else None
+    )
+    frames = _generate_frames(
+        source, interval, scheduler, get_size, run_lines, scrollback > 0, wait_for_events, pipeline
+    )
+    try:
+        for run, frame in enumerate(frames):
+            tick_time, command_result, execution_time = frame.time, frame.command_result, frame.execution_time
+            width, height = frame.size
+            max_lines = run_lines(frame.size)
+            # The wait before the run is reported with it, there is none before the first run unless it was pipelined.
+            sleep_time = None if run == 0 and pipeline is None else frame.wait_time
+            digest = command_result.output_hash.digest()
+            if tracker is not None and command_result.tracked is not None:
+                tracker.record(tick_time, command_result.tracked)
             start_time = time.time()
-            buffer = [
-                ansi_aware_line_trim(line, width if index + 2 < height else width - 1)
-                for index, line in enumerate(command_result.stdout_lines)
-            ]
-            if len(buffer) < height - 1:
-                buffer.extend([PADDING_LINE] * (height - len(buffer) - 1))
+            lines: Sequence[str] = command_result.stdout_lines
+            scroll_display = ""
+            if view is not None:
+                # Only the visible window of the scrollback is decoded and trimmed.
+                lines = view.window(command_result.stdout_lines, height - 1 - track_rows)
+                scroll_display = view.describe(command_result.line_count, len(lines))
+            elif highlighter is not None or recorder is not None:
+                # Decoded once for highlighting and recording, otherwise lines are decoded only when the frame changed.
+                lines = command_result.stdout_lines[:]
+            display_lines = highlighter.highlight(lines) if highlighter is not None else lines
+            # Output identical to the previous run is already on the screen, only the status line needs an update.
+            frame_key = (
+                digest,
+                width,
+                height,
+                command_result.exit_status,
+                command_result.truncated,
+                command_result.timed_out,
+                highlighter is not None and highlighter.highlighted,
+            )
+            unchanged_frame = frame_key == last_frame_key
+            last_frame_key = frame_key
+
+            if not unchanged_frame:
+                buffer = _screen_lines(display_lines, width, height - track_rows)
             lines_processing_time = time.time() - start_time
 
             debug_display = ""
@@ -147,62 +2284,737 @@ def watch(command: str, interval: float = 1.0, precise: bool = False, show_debug
                 debug_display = (
                     f"<<w={width},h={height} "
                     f"B:{command_result.total_read_bytes}->{command_result.used_bytes} "
-                    f"{execution_time:0.03f}s+{lines_processing_time:0.03f}s>>"
+                    f"O:{renderer.last_frame_bytes} W:{write_time:0.03f}s "
+                    f"{execution_time:0.03f}s+{lines_processing_time:0.03f}s"
                 )
-            status_line_left = f"Every {interval:0.01f}s: {command} (exit status: {command_result.exit_status})"
-            status_line_right = debug_display + datetime.datetime.now().strftime(" %H:%M:%S")
+                if scheduler is not None:
+                    debug_display += f" J:{scheduler.jitter * 1000:+0.1f}ms X:{scheduler.overruns}"
+                if pipeline is not None:
+                    debug_display += f" F:{len(pipeline.in_flight)} D:{pipeline.dropped}"
+                if histograms["exec"].count:
+                    debug_display += _percentiles_display(histograms, ("exec", "lines", "render", "write"))
+                debug_display += ">>"
+            status_text = f"{schedule}: {source.title} ({_run_status(command_result)})"
+            status_right = debug_display + time.strftime(" %H:%M:%S")
+            status_line = _fit_status_line(status_text + scroll_display, status_right, width)
 
-            if (status_len := len(status_line_left) + len(status_line_right)) > width:
-                status_line_left = status_line_left[: width - len(status_line_right) - 1] + "…"
+            status_color = COLOR_GREY if command_result.exit_status == 0 else COLOR_RED
+            start_time = time.time()
+            if unchanged_frame and tracker is None:
+                screen = renderer.render_status(status_color, status_line)
             else:
-                status_line_left = status_line_left + " " * (width - status_len)
+                # Unchanged output is not trimmed again, only the row of tracked numbers is redrawn.
+                screen = renderer.render((width, height), status_color, status_line, [*tracked_rows(), *buffer])
+            render_time = time.time() - start_time
+
+            start_time = time.time()
+            sys.stdout.write(screen)
+            sys.stdout.flush()
+            write_time = time.time() - start_time
 
             start_time = time.time()
-            sys.stdout.write(
-                colorama.Cursor.POS(1, 1)
-                + (colorama.Fore.LIGHTBLACK_EX if command_result.exit_status == 0 else colorama.Fore.LIGHTRED_EX)
-                + status_line_left
-                + status_line_right
-                + colorama.Fore.RESET
-                + "".join(buffer).strip()
-                + colorama.Cursor.POS(width, height)
+            if recorder is not None:
+                recorder.record(tick_time, command_result.exit_status, list(lines))
+            record_time = time.time() - start_time
+
+            # Written before the wait, so the run ending the watch (or interrupted while waiting) is not lost.
+            timings = {
+                "exec": execution_time,
+                "lines": lines_processing_time,
+                "render": render_time,
+                "write": write_time,
+                "record": record_time,
+            }
+            for phase, seconds in timings.items():
+                histograms[phase].add(seconds)
+            if sleep_time is not None:
+                histograms["sleep"].add(sleep_time)
+            if metrics is not None:
+                sleep_overshoot = None
+                if sleep_time is not None:
+                    sleep_overshoot = scheduler.jitter if scheduler is not None else sleep_time - interval
+                record = {
+                    "time": tick_time,
+                    **{f"{phase}_time": seconds for phase, seconds in timings.items()},
+                    "sleep_time": sleep_time,
+                    "sleep_overshoot": sleep_overshoot,
+                    "total_read_bytes": command_result.total_read_bytes,
+                    "used_bytes": command_result.used_bytes,
+                    "lines": command_result.line_count,
+                    "output_bytes": renderer.last_frame_bytes,
+                    "exit_status": command_result.exit_status,
+                    "truncated": command_result.truncated,
+                    "timed_out": command_result.timed_out,
+                    "unchanged": unchanged_frame,
+                }
+                metrics.write(json.dumps(record) + "\n")
+                metrics.flush()
+
+            if (exit_on_change and frame.changed) or (exit_on_unchanged and frame.unchanged_runs >= exit_on_unchanged):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+        if metrics is not None:
+            metrics.close()
+        if recorder is not None:
+            recorder.close()
+        resources.close()
+
+
+async def get_output_async(
+    command: List[str], shell: bool, max_lines: int, max_bytes: int = 0, timeout: float = 0.0
+) -> CommandResult:
+    import asyncio
+    import shlex
+
+    _check_max_lines(max_lines, False)
+
+    if shell:
+        proc = await asyncio.create_subprocess_shell(
+            shlex.join(command), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    else:
+        proc = await asyncio.create_subprocess_exec(
+            *command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    if proc.stdout is None:
+        raise PyProcWatchError("Failed to open child process stdout")
+
+    result = CommandResult()
+    collector = LineCollector(result, max_lines, max_bytes)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+    try:
+        while True:
+            try:
+                data = await asyncio.wait_for(
+                    proc.stdout.read(READ_BUFFER_SIZE), None if deadline is None else deadline - loop.time()
+                )
+            except asyncio.TimeoutError:
+                result.timed_out = True
+                break
+            if not data:
+                collector.finish()
+                break
+            if not collector.feed(data):
+                break
+    except BaseException:
+        # Reap the killed process even when the pane is cancelled, so neither it nor its transport is leaked.
+        kill_process_group(proc)
+        await asyncio.shield(proc.wait())
+        raise
+    if result.timed_out or result.truncated:
+        kill_process_group(proc)
+    result.exit_status = await proc.wait()
+    return result
+
+
+class DashboardPane:
+    def __init__(self, command: str, interval: float) -> None:
+        self.command = command
+        self.interval = interval
+        self.max_lines = 1
+        self.result: Optional[CommandResult] = None
+        self.execution_time = 0.0
+
+
+def dashboard_layout(height: int, pane_count: int) -> List[int]:
+    # Rows available below the global status line are split evenly, each pane uses one of its rows for its own header.
+    available = height - 1
+    if pane_count < 1 or available < 2 * pane_count:
+        raise PyProcWatchError(f"Terminal window too small for {pane_count} panes: height {height}")
+    return [available // pane_count + (1 if index < available % pane_count else 0) for index in range(pane_count)]
+
+
+async def _run_dashboard_pane(pane: DashboardPane, max_bytes: int, timeout: float, updated: "asyncio.Event") -> None:
+    import asyncio
+
+    use_shell, run_command = check_shell(pane.command)
+    loop = asyncio.get_running_loop()
+    while True:
+        start_time = loop.time()
+        pane.result = await get_output_async(run_command, use_shell, pane.max_lines, max_bytes, timeout)
+        pane.execution_time = loop.time() - start_time
+        updated.set()
+        await asyncio.sleep(pane.interval)
+
+
+async def _dashboard(panes: Sequence[DashboardPane], show_debug: bool, max_bytes: int, timeout: float) -> None:
+    import asyncio
+
+    renderer = FrameRenderer()
+    updated = asyncio.Event()
+    tasks: List["asyncio.Task[None]"] = []
+    try:
+        while True:
+            width, height = os.get_terminal_size()
+            if width < 48:
+                raise PyProcWatchError(f"Terminal window too small: ({width}x{height}), need at least 48 columns")
+            rows: List[str] = []
+            for pane_index, pane_height in enumerate(dashboard_layout(height, len(panes))):
+                pane = panes[pane_index]
+                pane.max_lines = pane_height - 1
+                result = pane.result
+                run_status = "waiting" if result is None else _run_status(result)
+                color = COLOR_GREY if result is None or result.exit_status == 0 else COLOR_RED
+                debug_display = f"<<{pane.execution_time:0.03f}s>>" if show_debug and result is not None else ""
+                header = _fit_status_line(
+                    f"Every {pane.interval:0.01f}s: {pane.command} ({run_status})", debug_display, width
+                )
+                rows.append(f"{color}{header}{COLOR_RESET}")
+                lines = result.stdout_lines[: pane.max_lines] if result is not None else []
+                last_row = pane.max_lines - 1 if pane_index + 1 == len(panes) else -1
+                rows.extend(
+                    ansi_aware_line_trim(line, width - 1 if index == last_row else width)
+                    for index, line in enumerate(lines)
+                )
+                rows.extend([PADDING_LINE] * (pane.max_lines - len(lines)))
+
+            debug_display = f"<<w={width},h={height} O:{renderer.last_frame_bytes}>>" if show_debug else ""
+            status_line = _fit_status_line(
+                f"pywatch: {len(panes)} panes", debug_display + time.strftime(" %H:%M:%S"), width
             )
+            sys.stdout.write(renderer.render((width, height), COLOR_GREY, status_line, rows))
             sys.stdout.flush()
-            output_write_time = time.time() - start_time
 
-            if precise:
-                time.sleep(max(0, interval - execution_time - lines_processing_time - output_write_time))
-            else:
-                time.sleep(interval)
+            if not tasks:
+                tasks = [asyncio.create_task(_run_dashboard_pane(pane, max_bytes, timeout, updated)) for pane in panes]
+            updated.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(updated.wait(), 1.0)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def dashboard(
+    panes: Sequence[Tuple[str, float]], show_debug: bool = False, max_bytes: int = 0, timeout: float = 0.0
+) -> None:
+    import asyncio
+
+    if not panes:
+        raise ValueError("No panes to watch")
+    for command, interval in panes:
+        if not command:
+            raise ValueError(f"Invalid command: {command}")
+        if interval < 0.0 or interval >= 24 * 60 * 60:
+            raise ValueError(f"Invalid interval value: {interval}")
+
+    if not sys.stdout.isatty():
+        raise PyProcWatchError("stdout is not a tty!")
+
+    try:
+        asyncio.run(
+            _dashboard(
+                [DashboardPane(command, interval) for command, interval in panes], show_debug, max_bytes, timeout
+            )
+        )
     except KeyboardInterrupt:
         pass
 
 
+def decode_keys(data: str) -> List[str]:
+    keys = []
+    position = 0
+    while position < len(data):
+        for sequence, key in KEY_SEQUENCES.items():
+            if data.startswith(sequence, position):
+                keys.append(key)
+                position += len(sequence)
+                break
+        else:
+            keys.append(data[position])
+            position += 1
+    return keys
+
+
+class KeyReader:
+    # Reads single key presses from the terminal without waiting for enter, escape sequences of special keys are
+    # translated to names like "up" or "page_down".
+    def __init__(self, fd: Optional[int] = None) -> None:
+        self.fd = sys.stdin.fileno() if fd is None else fd
+        self.pending: List[str] = []
+        self.saved_attributes: Optional[List[Any]] = None
+
+    def __enter__(self) -> "KeyReader":
+        if sys.platform != "win32":
+            self.saved_attributes = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        if sys.platform != "win32" and self.saved_attributes is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved_attributes)
+
+    def read(self, timeout: Optional[float] = None, wakeup_fds: Sequence[int] = ()) -> Optional[str]:
+        # Returns None when the timeout expires or one of wakeup_fds becomes readable before a key is pressed.
+        if not self.pending:
+            self.pending = self._read_keys(timeout, wakeup_fds)
+        return self.pending.pop(0) if self.pending else None
+
+    if sys.platform == "win32":  # pragma: no cover
+
+        def _read_keys(self, timeout: Optional[float], _wakeup_fds: Sequence[int]) -> List[str]:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not msvcrt.kbhit():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return []
+                time.sleep(0.01)
+            key = msvcrt.getwch()
+            if key in ("\x00", "\xe0"):
+                return [WINDOWS_KEYS.get(msvcrt.getwch(), "")]
+            return [key]
+
+    else:
+
+        def _read_keys(self, timeout: Optional[float], wakeup_fds: Sequence[int]) -> List[str]:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.fd, selectors.EVENT_READ)
+                for wakeup_fd in wakeup_fds:
+                    selector.register(wakeup_fd, selectors.EVENT_READ)
+                if not any(key.fd == self.fd for key, _ in selector.select(timeout)):
+                    return []
+            return decode_keys(os.read(self.fd, 64).decode("UTF-8", "replace"))
+
+
+class ResizeMonitor:
+    # Keeps the terminal size up to date from SIGWINCH instead of querying it on every run, the signal handler also
+    # wakes up wait() through a pipe. Without SIGWINCH (Windows) the size is queried on every get_size(). Other
+    # sources of events (e.g. file change notifications) can end wait() too through extra_fds.
+    def __init__(self) -> None:
+        columns, lines = os.get_terminal_size()
+        self.size = (columns, lines)
+        self.resized = False
+        self.wakeup_fd: Optional[int] = None
+        self.notify_fd: Optional[int] = None
+        self.previous_handler: Any = None
+        self.extra_fds: List[int] = []
+
+    def __enter__(self) -> "ResizeMonitor":
+        if hasattr(signal, "SIGWINCH"):
+            self.wakeup_fd, self.notify_fd = os.pipe()
+            os.set_blocking(self.wakeup_fd, False)
+            os.set_blocking(self.notify_fd, False)
+            self.previous_handler = signal.signal(signal.SIGWINCH, self._handle_resize)
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        if self.wakeup_fd is not None and self.notify_fd is not None:
+            signal.signal(signal.SIGWINCH, self.previous_handler)
+            os.close(self.wakeup_fd)
+            os.close(self.notify_fd)
+            self.wakeup_fd = self.notify_fd = None
+
+    def _handle_resize(self, _signal_number: int, _frame: Any) -> None:
+        columns, lines = os.get_terminal_size()
+        self.size = (columns, lines)
+        self.resized = True
+        if self.notify_fd is not None:
+            # A full pipe already holds a pending wakeup.
+            with contextlib.suppress(BlockingIOError):
+                os.write(self.notify_fd, b"\0")
+
+    def _drain(self) -> None:
+        if self.wakeup_fd is not None:
+            with contextlib.suppress(BlockingIOError):
+                while os.read(self.wakeup_fd, 64):
+                    pass
+
+    def get_size(self) -> Tuple[int, int]:
+        # Wakeups of resizes before this call are consumed, the returned size is already the new one.
+        self._drain()
+        if self.wakeup_fd is None:
+            columns, lines = os.get_terminal_size()
+            self.size = (columns, lines)
+        self.resized = False
+        return self.size
+
+    def check_resized(self) -> bool:
+        # Whether the terminal was resized since the last get_size(), consumes the pending wakeup.
+        self._drain()
+        return self.resized
+
+    @property
+    def wakeup_fds(self) -> List[int]:
+        return ([] if self.wakeup_fd is None else [self.wakeup_fd]) + self.extra_fds
+
+    def wait(self, timeout: float) -> None:
+        # Sleeps like time.sleep, returns early when the terminal is resized or one of extra_fds becomes readable.
+        wakeup_fds = self.wakeup_fds
+        if not wakeup_fds:
+            time.sleep(timeout)
+            return
+        with selectors.DefaultSelector() as selector:
+            for wakeup_fd in wakeup_fds:
+                selector.register(wakeup_fd, selectors.EVENT_READ)
+            selector.select(timeout)
+
+
+def parse_timestamp(value: str, now: float) -> float:
+    import datetime
+
+    # Accepts ISO dates with time, or a time of day meaning its most recent occurrence.
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        pass
+    moment = datetime.datetime.combine(datetime.date.fromtimestamp(now), datetime.time.fromisoformat(value))
+    if moment.timestamp() > now:
+        moment -= datetime.timedelta(days=1)
+    return moment.timestamp()
+
+
+def replay(path: str, start: Optional[float] = None) -> None:
+    import datetime
+
+    if not sys.stdout.isatty():
+        raise PyProcWatchError("stdout is not a tty!")
+
+    renderer = FrameRenderer()
+    with RecordingReader(path) as reader, KeyReader() as keys:
+        frame, next_frame = reader.locate(math.inf if start is None else start)
+        frame = frame or next_frame
+        if frame is None:
+            raise PyProcWatchError(f"No frames recorded in {path}")
+        try:
+            while True:
+                width, height = os.get_terminal_size()
+                _check_terminal_size(width, height)
+                status_line = _fit_status_line(
+                    f"Replay {path} (exit status: {frame.exit_status})",
+                    f" ←/→ b/f g/G q {datetime.datetime.fromtimestamp(frame.timestamp):%Y-%m-%d %H:%M:%S}",
+                    width,
+                )
+                sys.stdout.write(
+                    renderer.render(
+                        (width, height),
+                        COLOR_GREY if frame.exit_status == 0 else COLOR_RED,
+                        status_line,
+                        _screen_lines(frame.lines, width, height),
+                    )
+                )
+                sys.stdout.flush()
+
+                key = keys.read()
+                if key == "q":
+                    break
+                if key in ("right", "n"):
+                    target = reader.locate(frame.timestamp)[1]
+                elif key in ("left", "p"):
+                    target = reader.locate(math.nextafter(frame.timestamp, -math.inf))[0]
+                elif key in ("f", "page_down"):
+                    target = reader.locate(frame.timestamp + 60)[0]
+                elif key in ("b", "page_up"):
+                    target, next_frame = reader.locate(frame.timestamp - 60)
+                    target = target or next_frame
+                elif key in ("g", "home"):
+                    target = reader.locate(-math.inf)[1]
+                elif key in ("G", "end"):
+                    target = reader.locate(math.inf)[0]
+                else:
+                    continue
+                frame = target or frame
+        except KeyboardInterrupt:
+            pass
+
+
 def main(command_line_args: List[str]) -> None:
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-n",
         "--interval",
         action="store",
-        default="1.0",
+        default=None,
         type=float,
-        help="seconds to wait between command runs, positive floats and zero are accepted",
+        help="seconds to wait between command runs, positive floats and zero are accepted (default: 1.0), with "
+        "--on-change the longest time to wait for a change",
     )
     parser.add_argument(
         "-p", "--precise", action="store_true", default=False, help="try to run the command precisely at intervals"
     )
+    parser.add_argument(
+        "--missed-ticks",
+        action="store",
+        default="skip",
+        choices=MISSED_TICK_POLICIES,
+        help="what to do in precise mode when a run takes longer than the interval: skip missed ticks and wait for the "
+        "next one, run immediately for every missed tick, or coalesce missed ticks into a single immediate run",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store",
+        default=0,
+        type=int,
+        metavar="RUNS",
+        help="start a run every interval without waiting for the previous ones to finish, with at most RUNS runs at "
+        "once, the newest result is shown and results finishing after a newer one are dropped",
+    )
+    parser.add_argument(
+        "--each",
+        action="store",
+        default=None,
+        metavar="TARGETS",
+        help="run the command once for every comma separated target with {} in the command replaced by the target, "
+        "targets with identical output are shown as one group",
+    )
+    parser.add_argument(
+        "--each-file",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="like --each with one target per line of FILE",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store",
+        default=16,
+        type=int,
+        metavar="TARGETS",
+        help="with --each or --each-file run at most this many targets at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--on-change",
+        action="append",
+        default=[],
+        metavar="PATH",
+        help="run the command only when the file or directory (with its subdirectories) at PATH changes, can be "
+        "repeated (Linux only)",
+    )
+    parser.add_argument(
+        "--file",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="show the content of the file at PATH like cat, reading it without running a command and (on Linux) "
+        "as soon as it changes",
+    )
+    parser.add_argument(
+        "--tail", action="store_true", default=False, help="with --file show the last lines of the file like tail"
+    )
+    parser.add_argument(
+        "--track",
+        action="append",
+        default=[],
+        metavar="REGEX",
+        help="extract a number from the output of every run, the first capture group (or the whole match) of the "
+        "first matching line, and show its recent values, min, max and rate under the status line, can be repeated",
+    )
     parser.add_argument("-v", "--debug", action="store_true", default=False, help="show debug information")
+    parser.add_argument(
+        "--persistent-shell",
+        action="store_true",
+        default=False,
+        help="run the command in a single long-lived $SHELL process instead of starting a new one on every run",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        action="store",
+        default=0,
+        type=int,
+        help="stop reading and kill the command after it produced this many bytes of output, zero means no limit",
+    )
+    parser.add_argument(
+        "--timeout",
+        action="store",
+        default=0.0,
+        type=float,
+        help="kill the command if it runs longer than this many seconds, zero means no limit",
+    )
+    parser.add_argument(
+        "-d",
+        "--differences",
+        action="store_true",
+        default=False,
+        help="highlight the characters that changed since the previous run",
+    )
+    parser.add_argument(
+        "--cumulative",
+        action="store_true",
+        default=False,
+        help="highlight every character that changed since the first run, implies --differences",
+    )
+    parser.add_argument(
+        "-g", "--chgexit", action="store_true", default=False, help="exit when the output of the command changes"
+    )
+    parser.add_argument(
+        "-q",
+        "--equexit",
+        action="store",
+        default=0,
+        type=int,
+        metavar="CYCLES",
+        help="exit when the output of the command does not change for the given number of runs",
+    )
+    parser.add_argument(
+        "--scrollback",
+        action="store",
+        default=0,
+        type=int,
+        metavar="LINES",
+        help="keep up to LINES lines of output of every run and scroll through them with PgUp/PgDn, j/k and g/G",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store",
+        default=None,
+        choices=HEADLESS_FORMATS,
+        help="do not draw the screen, write the output of every run to stdout as JSON lines or plain text, works with "
+        "pipes and files",
+    )
+    parser.add_argument(
+        "--deltas",
+        action="store_true",
+        default=False,
+        help="with --headless write only the lines added and removed since the previous run",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="append phase timings, byte and line counts of every run to FILE as JSON lines",
+    )
+    parser.add_argument(
+        "--record",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="append every displayed frame to FILE (and its FILE.idx index), view it later with --replay",
+    )
+    parser.add_argument(
+        "--replay", action="store", default=None, metavar="FILE", help="view frames recorded with --record"
+    )
+    parser.add_argument(
+        "--seek",
+        action="store",
+        default=None,
+        metavar="TIME",
+        help="with --replay start at TIME, an ISO date and time or a time of day (HH:MM[:SS]), default is the end",
+    )
+    parser.add_argument(
+        "--pane",
+        action="append",
+        nargs=2,
+        default=[],
+        metavar=("INTERVAL", "COMMAND"),
+        help="watch an additional command with its own interval in a separate pane, can be repeated",
+    )
     parser.add_argument(
         "command",
-        nargs="+",
+        nargs="*",
         help="command to watch, can be specified as a quoted string or as a list "
         "(use -- to separate pywatch and command options)",
     )
     options = parser.parse_args(command_line_args)
+    if options.replay:
+        start = None
+        if options.seek:
+            try:
+                start = parse_timestamp(options.seek, time.time())
+            except ValueError:
+                parser.error(f"argument --seek: invalid time value: {options.seek!r}")
+        fix_windows_console()
+        replay(options.replay, start)
+        return
+    if not options.command and not options.pane and options.file is None:
+        parser.error("the following arguments are required: command")
+    if options.file is not None and options.command:
+        parser.error("argument --file: not allowed with argument command")
+    if options.tail and options.file is None:
+        parser.error("argument --tail: only allowed with argument --file")
+    if options.each is not None and options.each_file is not None:
+        parser.error("argument --each-file: not allowed with argument --each")
+    targets = [target for target in (options.each or "").split(",") if target]
+    if options.each_file is not None:
+        import pathlib
+
+        try:
+            targets = [
+                line.strip() for line in pathlib.Path(options.each_file).read_text().splitlines() if line.strip()
+            ]
+        except OSError as error:
+            parser.error(f"argument --each-file: {error}")
+    if (options.each is not None or options.each_file is not None) and not targets:
+        parser.error(f"argument {'--each' if options.each is not None else '--each-file'}: no targets given")
+    for pattern in options.track:
+        try:
+            re.compile(pattern.encode())
+        except re.error as error:
+            parser.error(f"argument --track: invalid pattern {pattern!r}: {error}")
+
+    if options.interval is None:
+        # Without an interval runs on changes wait for a change as long as it takes.
+        options.interval = 0.0 if options.on_change else 1.0
+    panes = [(" ".join(options.command), options.interval)] if options.command else []
+    for pane_interval, pane_command in options.pane:
+        try:
+            panes.append((pane_command, float(pane_interval)))
+        except ValueError:
+            parser.error(f"argument --pane: invalid interval value: {pane_interval!r}")
+
+    if options.pane:
+        # Panes share a single event loop and a single screen, only the run limits and the debug overlay apply there.
+        unsupported = [
+            option
+            for option, used in (
+                ("-p/--precise", options.precise),
+                ("--missed-ticks", options.missed_ticks != "skip"),
+                ("--persistent-shell", options.persistent_shell),
+                ("-d/--differences", options.differences),
+                ("--cumulative", options.cumulative),
+                ("-g/--chgexit", options.chgexit),
+                ("-q/--equexit", options.equexit),
+                ("--scrollback", options.scrollback),
+                ("--headless", options.headless),
+                ("--deltas", options.deltas),
+                ("--metrics-file", options.metrics_file),
+                ("--record", options.record),
+                ("--pipeline", options.pipeline),
+                ("--each", options.each),
+                ("--each-file", options.each_file),
+                ("--file", options.file),
+                ("--on-change", options.on_change),
+                ("--track", options.track),
+            )
+            if used
+        ]
+        if unsupported:
+            parser.error(f"argument --pane: not allowed with argument {', '.join(unsupported)}")
 
-    colorama.just_fix_windows_console()
+    fix_windows_console()
+    if options.pane:
+        dashboard(panes=panes, show_debug=options.debug, max_bytes=options.max_bytes, timeout=options.timeout)
+        return
     watch(
-        command=" ".join(options.command), interval=options.interval, precise=options.precise, show_debug=options.debug
+        command=" ".join(options.command),
+        interval=options.interval,
+        precise=options.precise,
+        show_debug=options.debug,
+        persistent_shell=options.persistent_shell,
+        max_bytes=options.max_bytes,
+        timeout=options.timeout,
+        missed_tick_policy=options.missed_ticks,
+        metrics_file=options.metrics_file,
+        exit_on_change=options.chgexit,
+        exit_on_unchanged=options.equexit,
+        differences=options.differences,
+        cumulative_differences=options.cumulative,
+        record_file=options.record,
+        scrollback=options.scrollback,
+        headless=options.headless,
+        headless_deltas=options.deltas,
+        pipeline_runs=options.pipeline,
+        targets=targets,
+        parallel_targets=options.parallel,
+        file_path=options.file,
+        file_tail=options.tail,
+        change_paths=options.on_change,
+        track=options.track,
     )
 
 
@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import io
+import json
+import os
+import pathlib
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+
+import py_proc_watch
+
+BenchResult = Dict[str, Any]
+
+TERMINAL_SIZE = (160, 48)
+
+# Modules only some modes need, importing any of them with py_proc_watch slows down every pywatch start.
+LAZY_MODULES = ["argparse", "asyncio", "colorama", "concurrent.futures", "datetime", "json", "pathlib", "shlex", "uuid"]
+
+
+def colored_line(columns: int) -> str:
+    colors = [f"\033[{30 + index % 8};1m" for index in range(8)]
+    return "".join(f"{colors[index % 8]}{index % 10}" for index in range(columns)) + "\033[0m"
+
+
+def many_short_lines() -> bytes:
+    return b"".join(b"line %d\n" % index for index in range(200_000))
+
+
+def few_huge_lines() -> bytes:
+    return (b"x" * 1_000_000 + b"\n") * 4
+
+
+def ansi_dense() -> bytes:
+    return ((colored_line(TERMINAL_SIZE[0] * 2) + "\n") * 5_000).encode()
+
+
+def overflow() -> bytes:
+    return (b"x" * 99 + b"\n") * 640_000
+
+
+def zero_output() -> bytes:
+    return b""
+
+
+WORKLOADS: Dict[str, Callable[[], bytes]] = {
+    "many_short_lines": many_short_lines,
+    "few_huge_lines": few_huge_lines,
+    "ansi_dense": ansi_dense,
+    "overflow": overflow,
+    "zero_output": zero_output,
+}
+
+
+def best_of(function: Callable[[], object], number: int, repeat: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def result(benchmark: str, workload: str, seconds: float, **extra: Any) -> BenchResult:
+    print(f"{benchmark:24s} {workload:20s} {seconds * 1e3:10.3f}ms", *(f"{k}={v}" for k, v in extra.items()))
+    return {"benchmark": benchmark, "workload": workload, "seconds": seconds, **extra}
+
+
+def read_workload(data: bytes, max_lines: int) -> py_proc_watch.CommandResult:
+    command_result = py_proc_watch.CommandResult()
+    py_proc_watch.reader_thread_func(command_result, io.BytesIO(data), max_lines)
+    return command_result
+
+
+def import_times(code: str) -> Dict[str, int]:
+    # Installed pywatch starts from cached bytecode, so the measured interpreter may write it even when the
+    # environment asks not to.
+    env = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("imported package"):
+            _self_time, cumulative, name = line[len("import time:") :].split("|")
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def bench_startup(repeat: int) -> List[BenchResult]:
+    # Cumulative import time of the module as pywatch loads it, and wall time of pywatch -h through the entry point.
+    import_times("import py_proc_watch")
+    imported = min(import_times("import py_proc_watch")["py_proc_watch"] for _ in range(repeat)) / 1e6
+    loaded = sorted(import_times("import py_proc_watch").keys() & set(LAZY_MODULES))
+    command = [sys.executable, "-c", "import sys, py_proc_watch; sys.argv[1:] = ['-h']; py_proc_watch._entry_point()"]
+    seconds = best_of(lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True), 1, repeat)
+    return [
+        result("startup_import", "py_proc_watch", imported, eager_modules=",".join(loaded) or "-"),
+        result("startup_help", "_entry_point", seconds),
+    ]
+
+
+def bench_reader_thread_func(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    results = []
+    for name, data in workloads.items():
+        seconds = best_of(lambda: read_workload(data, TERMINAL_SIZE[1] - 1), 1, repeat)
+        results.append(result("reader_thread_func", name, seconds, bytes=len(data)))
+    return results
+
+
+def bench_get_output(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    # The child copies a prepared file to its stdout, interpreter startup is part of every run just like a real command.
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, data in workloads.items():
+            path = pathlib.Path(directory) / name
+            path.write_bytes(data)
+            command = [
+                sys.executable,
+                "-c",
+                "import shutil, sys; shutil.copyfileobj(open(sys.argv[1], 'rb'), sys.stdout.buffer)",
+                str(path),
+            ]
+            seconds = best_of(lambda: py_proc_watch.get_output(command, False, TERMINAL_SIZE[1] - 1), 1, repeat)
+            results.append(result("get_output", name, seconds, bytes=len(data)))
+    return results
+
+
+def bench_read_file(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    # In-process reads of the same files get_output copies through a child, and the tail of them. An unchanged file
+    # is not read again by FileSource.
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, data in workloads.items():
+            path = str(pathlib.Path(directory) / name)
+            pathlib.Path(path).write_bytes(data)
+            for tail in (False, True):
+                seconds = best_of(lambda: py_proc_watch.read_file(path, TERMINAL_SIZE[1] - 1, tail=tail), 10, repeat)
+                results.append(result("read_file_tail" if tail else "read_file", name, seconds, bytes=len(data)))
+            with py_proc_watch.FileSource(path) as source:
+                seconds = best_of(lambda: source.read(TERMINAL_SIZE[1] - 1), 100, repeat)
+            results.append(result("file_source_unchanged", name, seconds))
+    return results
+
+
+def bench_ansi_aware_line_trim(widths: List[int]) -> List[BenchResult]:
+    results = []
+    for width in widths:
+        line = colored_line(width * 2)
+        number = max(1, 65536 // width)
+        seconds = best_of(lambda: py_proc_watch.ansi_aware_line_trim(line, width), number, 5)
+        results.append(
+            result("ansi_aware_line_trim", f"colored_{width}", seconds, ns_per_column=round(seconds / width * 1e9, 1))
+        )
+    return results
+
+
+def bench_ansi_aware_line_trim_workloads(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    results = []
+    for name, data in workloads.items():
+        lines = read_workload(data, TERMINAL_SIZE[1] - 1).stdout_lines[:]
+
+        def trim_lines() -> None:
+            for line in lines:
+                py_proc_watch.ansi_aware_line_trim(line, TERMINAL_SIZE[0])
+
+        seconds = best_of(trim_lines, 10, repeat)
+        results.append(result("ansi_aware_line_trim", name, seconds, lines=len(lines)))
+    return results
+
+
+def bench_scrollback(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    # Memory of the compact line store against a list of str, and cost of one screen from the middle of the output,
+    # which should not depend on the size of the output.
+    results = []
+    width, height = TERMINAL_SIZE
+    for name, data in workloads.items():
+        command_result = py_proc_watch.CommandResult()
+        py_proc_watch.reader_thread_func(command_result, io.BytesIO(data), py_proc_watch.MAX_SCROLLBACK_LINES)
+        lines = command_result.stdout_lines
+        view = py_proc_watch.ScrollView()
+        view.position = len(lines) // 2
+
+        def show_window() -> None:
+            for line in view.window(lines, height - 1):
+                py_proc_watch.ansi_aware_line_trim(line, width)
+
+        seconds = best_of(show_window, 10, repeat)
+        decoded = [lines[index] for index in range(len(lines))]
+        results.append(
+            result(
+                "scrollback_window",
+                name,
+                seconds,
+                lines=len(lines),
+                buffer_bytes=len(lines.data) + lines.ends.itemsize * len(lines.ends),
+                list_bytes=sys.getsizeof(decoded) + sum(sys.getsizeof(line) for line in decoded),
+            )
+        )
+    return results
+
+
+def bench_headless_writer(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    # Cost of writing one run in --headless mode, runs alternate between two outputs that differ in a single line.
+    results = []
+    for name, data in workloads.items():
+        command_results = []
+        for variant in (data, data.replace(b"1", b"2", 1)):
+            command_result = py_proc_watch.CommandResult()
+            py_proc_watch.reader_thread_func(command_result, io.BytesIO(variant), py_proc_watch.MAX_SCROLLBACK_LINES)
+            command_results.append(command_result)
+        for output_format in py_proc_watch.HEADLESS_FORMATS:
+            for deltas in (False, True):
+                writer = py_proc_watch.HeadlessWriter(io.BytesIO(), "a-command", output_format, deltas)
+
+                def write_runs() -> None:
+                    writer.stream = io.BytesIO()
+                    for command_result in command_results:
+                        writer.write(0.0, command_result)
+
+                seconds = best_of(write_runs, 1, repeat) / len(command_results)
+                mode = f"{output_format}_deltas" if deltas else output_format
+                results.append(result("headless_writer", f"{name}_{mode}", seconds, bytes=len(data)))
+    return results
+
+
+def bench_difference_highlighter(repeat: int) -> List[BenchResult]:
+    # Worst case for --differences: every visible line changed, compared with a screen where only one cell changed.
+    height = TERMINAL_SIZE[1] - 1
+    cases = {
+        "ansi_dense_all_changed": (
+            [colored_line(TERMINAL_SIZE[0]) + "\n"] * height,
+            [colored_line(TERMINAL_SIZE[0]).replace("5", "6") + "\n"] * height,
+        ),
+        "one_cell_changed": (
+            ["x" * TERMINAL_SIZE[0] + "\n"] * height,
+            ["x" * TERMINAL_SIZE[0] + "\n"] * (height - 1) + ["y" + "x" * (TERMINAL_SIZE[0] - 1) + "\n"],
+        ),
+    }
+    results = []
+    for name, (previous_lines, lines) in cases.items():
+
+        def highlight() -> None:
+            highlighter = py_proc_watch.DifferenceHighlighter()
+            highlighter.highlight(previous_lines)
+            highlighter.highlight(lines)
+
+        seconds = best_of(highlight, 10, repeat)
+        results.append(result("difference_highlighter", name, seconds, lines=height))
+    return results
+
+
+def bench_frame_recorder(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    # Cost of --record per tick: unchanged output is stored as an empty delta, changing output alternates two results.
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, data in workloads.items():
+            command_result = read_workload(data, TERMINAL_SIZE[1] - 1)
+            changed_result = read_workload(data.replace(b"1", b"2"), TERMINAL_SIZE[1] - 1)
+            for mode, command_results in (
+                ("unchanged", [command_result, command_result]),
+                ("changed", [command_result, changed_result]),
+            ):
+                path = str(pathlib.Path(directory) / f"{name}_{mode}.rec")
+                # Lines are decoded before, like the watch loop does once for the highlighter and the recorder.
+                decoded_results = [(result.exit_status, result.stdout_lines[:]) for result in command_results]
+                with py_proc_watch.FrameRecorder(path) as recorder:
+                    frames = 0
+
+                    def record_frames() -> None:
+                        nonlocal frames
+                        for exit_status, lines in decoded_results * 50:
+                            recorder.record(float(frames), exit_status, lines)
+                            frames += 1
+
+                    seconds = best_of(record_frames, 1, repeat) / (len(command_results) * 50)
+                    file_bytes = recorder.file.tell()
+                results.append(
+                    result(f"frame_recorder_{mode}", name, seconds, bytes_per_frame=round(file_bytes / frames))
+                )
+    return results
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self) -> bool:
+        return True
+
+
+def run_watch_frames(command_result: py_proc_watch.CommandResult, frames: int) -> int:
+    # Runs the real watch() loop with the command, the terminal and the wait between frames replaced.
+    terminal = FakeTerminal()
+    remaining = [frames]
+
+    def next_frame(_monitor: py_proc_watch.ResizeMonitor, _interval: float) -> None:
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            raise KeyboardInterrupt()
+
+    with mock.patch.object(py_proc_watch, "get_output", return_value=command_result), mock.patch.object(
+        os, "get_terminal_size", return_value=os.terminal_size(TERMINAL_SIZE)
+    ), mock.patch.object(py_proc_watch.ResizeMonitor, "wait", next_frame), mock.patch.object(sys, "stdout", terminal):
+        py_proc_watch.watch("bench", interval=1.0)
+    return len(terminal.getvalue())
+
+
+def bench_watch_frame(workloads: Dict[str, bytes], repeat: int) -> List[BenchResult]:
+    results = []
+    for name, data in workloads.items():
+        command_result = read_workload(data, TERMINAL_SIZE[1] - 1)
+        # The first frame is always drawn in full, following frames with unchanged output only redraw the status line.
+        seconds = best_of(lambda: run_watch_frames(command_result, 1), 10, repeat)
+        output_bytes = run_watch_frames(command_result, 1)
+        results.append(result("watch_frame_full", name, seconds, output_bytes=output_bytes))
+        seconds = best_of(lambda: run_watch_frames(command_result, 100), 1, repeat) / 100
+        results.append(result("watch_frame_steady", name, seconds))
+    return results
+
+
+def iterations_per_second(function: Callable[[], object], duration: float = 2.0) -> float:
+    iterations = 0
+    start_time = time.monotonic()
+    while (elapsed := time.monotonic() - start_time) < duration:
+        function()
+        iterations += 1
+    return iterations / elapsed
+
+
+def bench_reader_rate(command: str) -> List[BenchResult]:
+    # Runs per second of trivial commands with a reader thread per run, and with reading on the calling thread.
+    run_command = shlex.split(command)
+    results = []
+    for name, read in (
+        ("thread", py_proc_watch.read_output_in_thread),
+        ("selector", py_proc_watch.read_output),
+    ):
+
+        def run() -> None:
+            with subprocess.Popen(
+                run_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, start_new_session=True
+            ) as proc:
+                command_result = py_proc_watch.CommandResult()
+                command_result.exit_status = read(proc, command_result, 100)
+
+        rate = iterations_per_second(run)
+        results.append(result(f"reader_rate_{name}", command, 1 / rate, runs_per_second=round(rate, 1)))
+    return results
+
+
+def bench_pipeline(command: str, interval: float, in_flight: List[int]) -> List[BenchResult]:
+    # Results per second of a slow command started every interval, a single run in flight is the serial loop.
+    results = []
+    for max_in_flight in in_flight:
+        with py_proc_watch.RunPipeline(
+            lambda on_start: py_proc_watch.get_output(["sh", "-c", command], False, 100, on_start=on_start),
+            interval,
+            max_in_flight,
+        ) as pipeline:
+            rate = iterations_per_second(pipeline.next_result)
+        results.append(
+            result(
+                f"pipeline_{max_in_flight}",
+                command,
+                1 / rate,
+                results_per_second=round(rate, 1),
+                dropped=pipeline.dropped,
+            )
+        )
+    return results
+
+
+def bench_fan_out(command: str, target_counts: List[int]) -> List[BenchResult]:
+    # Targets run at once, time per run should stay close to a single target as the number of targets grows.
+    results = []
+    for target_count in target_counts:
+        with py_proc_watch.FanOut(command, [str(index) for index in range(target_count)], 16) as fan_out:
+            rate = iterations_per_second(lambda: fan_out.run(100))
+        results.append(result("fan_out_run", f"{target_count}_targets", 1 / rate, runs_per_second=round(rate, 1)))
+    return results
+
+
+def bench_persistent_shell(command: str) -> List[BenchResult]:
+    use_shell, run_command = py_proc_watch.check_shell(command)
+    rate = iterations_per_second(lambda: py_proc_watch.get_output(run_command, use_shell, 100))
+    results = [result("get_output_rate", command, 1 / rate, runs_per_second=round(rate, 1))]
+    if use_shell:
+        return results
+    with py_proc_watch.ShellCoprocess(run_command[0]) as coprocess:
+        coprocess_rate = iterations_per_second(lambda: coprocess.run(command, 100))
+    results.append(
+        result("shell_coprocess_rate", command, 1 / coprocess_rate, runs_per_second=round(coprocess_rate, 1))
+    )
+    return results
+
+
+def bench_get_output_overflow(total_bytes: int) -> BenchResult:
+    script = (
+        "import sys\n"
+        "block = (b'x' * 99 + b'\\n') * 10000\n"
+        f"for _ in range({total_bytes} // len(block)):\n"
+        "    sys.stdout.buffer.write(block)\n"
+    )
+    start_time = time.monotonic()
+    start_cpu_time = time.process_time()
+    command_result = py_proc_watch.get_output([sys.executable, "-c", script], False, 100)
+    elapsed = time.monotonic() - start_time
+    cpu_time = time.process_time() - start_cpu_time
+    return result(
+        "get_output_overflow",
+        f"{total_bytes // 1_000_000}MB",
+        elapsed,
+        cpu_seconds=round(cpu_time, 3),
+        megabytes_per_second=round(command_result.total_read_bytes / elapsed / 1e6),
+    )
+
+
+# Runs PANES panes of `true` every 0.1s on one event loop for SECONDS, then reports its runs, CPU time and peak RSS.
+PANES_SCRIPT = (
+    "import asyncio, json, resource, sys\n"
+    "import py_proc_watch\n"
+    "async def pane(runs):\n"
+    "    use_shell, run_command = py_proc_watch.check_shell('true')\n"
+    "    while True:\n"
+    "        await py_proc_watch.get_output_async(run_command, use_shell, 100)\n"
+    "        runs[0] += 1\n"
+    "        await asyncio.sleep(0.1)\n"
+    "async def run_panes(pane_count, duration, runs):\n"
+    "    tasks = [asyncio.create_task(pane(runs)) for _ in range(pane_count)]\n"
+    "    await asyncio.sleep(duration)\n"
+    "    for task in tasks:\n"
+    "        task.cancel()\n"
+    "    await asyncio.gather(*tasks, return_exceptions=True)\n"
+    "runs = [0]\n"
+    "asyncio.run(run_panes(int(sys.argv[1]), float(sys.argv[2]), runs))\n"
+    "usage = resource.getrusage(resource.RUSAGE_SELF)\n"
+    "print(json.dumps([runs[0], usage.ru_utime + usage.ru_stime, usage.ru_maxrss]))\n"
+)
+
+
+def run_pane_processes(pane_counts: List[int], duration: float) -> Dict[str, Any]:
+    # One process per entry of pane_counts, all at once. CPU time and RSS are the sums over the processes, the commands
+    # the panes run are not included.
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", PANES_SCRIPT, str(pane_count), str(duration)], stdout=subprocess.PIPE, text=True
+        )
+        for pane_count in pane_counts
+    ]
+    reports = [json.loads(process.communicate()[0]) for process in processes]
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "runs": sum(runs for runs, _, _ in reports),
+        "cpu_seconds": sum(cpu_seconds for _, cpu_seconds, _ in reports),
+        "rss_mb": round(sum(max_rss for _, _, max_rss in reports) * rss_unit / 1e6, 1),
+    }
+
+
+def bench_dashboard_panes(pane_counts: List[int], duration: float = 2.0) -> List[BenchResult]:
+    # All panes share one event loop and one interpreter: CPU time per pane run and memory should stay flat as the
+    # number of panes grows, while N separate pywatch processes pay for N interpreters.
+    results = []
+    for pane_count in pane_counts:
+        for benchmark, processes in (
+            ("dashboard_cpu_per_run", [pane_count]),
+            ("processes_cpu_per_run", [1] * pane_count),
+        ):
+            usage = run_pane_processes(processes, duration)
+            results.append(
+                result(
+                    benchmark,
+                    f"{pane_count}_panes",
+                    usage["cpu_seconds"] / max(1, usage["runs"]),
+                    runs=usage["runs"],
+                    rss_mb=usage["rss_mb"],
+                )
+            )
+    return results
+
+
+def compare(results: List[BenchResult], baseline_path: str) -> None:
+    with pathlib.Path(baseline_path).open(encoding="utf-8") as baseline_file:
+        baseline = {
+            (item["benchmark"], item["workload"]): item["seconds"] for item in json.load(baseline_file)["results"]
+        }
+    for item in results:
+        old_seconds = baseline.get((item["benchmark"], item["workload"]))
+        if old_seconds:
+            print(f"{item['benchmark']:24s} {item['workload']:20s} {item['seconds'] / old_seconds:6.2f}x")
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="py-proc-watch benchmarks")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE as JSON")
+    parser.add_argument(
+        "--compare", metavar="FILE", help="Print time ratios against results from a previous --json run"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Number of repetitions, the best one is reported")
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=60.0,
+        metavar="MS",
+        help="Maximum import time of py_proc_watch in milliseconds (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--entry-point-budget",
+        type=float,
+        default=150.0,
+        metavar="MS",
+        help="Maximum wall time of pywatch -h through _entry_point in milliseconds (default: %(default)s)",
+    )
+    parser.add_argument("--quick", action="store_true", help="Skip the slow overflow, dashboard and shell benchmarks")
+    options = parser.parse_args(args)
+
+    workloads = {name: generate() for name, generate in WORKLOADS.items()}
+    results = bench_startup(options.repeat)
+    startup, entry_point = results[0], results[1]
+    results += bench_ansi_aware_line_trim([1024, 2048, 4096, 8192])
+    per_column = [item["ns_per_column"] for item in results[2:]]
+    results += bench_ansi_aware_line_trim_workloads(workloads, options.repeat)
+    results += bench_reader_thread_func(workloads, options.repeat)
+    results += bench_get_output(workloads, options.repeat)
+    results += bench_read_file(workloads, options.repeat)
+    results += bench_watch_frame(workloads, options.repeat)
+    results += bench_scrollback(workloads, options.repeat)
+    results += bench_headless_writer(workloads, options.repeat)
+    results += bench_difference_highlighter(options.repeat)
+    results += bench_frame_recorder(workloads, options.repeat)
+    if not options.quick:
+        results.append(bench_get_output_overflow(500_000_000))
+        if os.name == "posix":
+            results += bench_dashboard_panes([1, 4, 16])
+            results += bench_reader_rate("true")
+            results += bench_reader_rate("date")
+            results += bench_pipeline("sleep 0.2", 0.05, [1, 4])
+            results += bench_fan_out("sleep 0.2; echo {}", [1, 16])
+            results += bench_persistent_shell("true")
+            results += bench_persistent_shell("date")
+
+    if options.json:
+        with pathlib.Path(options.json).open("w", encoding="utf-8") as json_file:
+            json.dump(
+                {
+                    "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "implementation": platform.python_implementation(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                json_file,
+                indent=2,
+            )
+    if options.compare:
+        compare(results, options.compare)
+
+    # Linear time means constant cost per column, allow some noise before calling it a regression.
+    if per_column[-1] > per_column[0] * 2:
+        print("ansi_aware_line_trim does not scale linearly!")
+        return 1
+    if startup["eager_modules"] != "-" or startup["seconds"] * 1e3 > options.startup_budget:
+        print("py_proc_watch imports too much at start-up!")
+        return 1
+    # Includes interpreter start-up and argparse, which pywatch needs on every start.
+    if entry_point["seconds"] * 1e3 > options.entry_point_budget:
+        print("pywatch starts too slowly!")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 
+import array
+import asyncio
+import concurrent.futures
+import datetime
+import hashlib
 import io
+import itertools
+import json
+import math
 import os
 import pathlib
+import re
+import selectors
 import shutil
+import signal
 import subprocess
 import sys
+import threading
 import time
-from typing import List
+import tracemalloc
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
 
 import colorama
 import colorama.ansi
@@ -16,6 +29,35 @@ import pytest
 
 import py_proc_watch
 
+WATCH_DEFAULT_OPTIONS: Dict[str, Any] = {
+    "persistent_shell": False,
+    "max_bytes": 0,
+    "timeout": 0.0,
+    "missed_tick_policy": "skip",
+    "metrics_file": None,
+    "exit_on_change": False,
+    "exit_on_unchanged": 0,
+    "differences": False,
+    "cumulative_differences": False,
+    "record_file": None,
+    "scrollback": 0,
+    "headless": None,
+    "headless_deltas": False,
+    "pipeline_runs": 0,
+    "targets": [],
+    "parallel_targets": 16,
+    "file_path": None,
+    "file_tail": False,
+    "change_paths": [],
+    "track": [],
+}
+
+
+def stub_process_termination(when: mockito.when, process_mock: mockito.mock) -> None:
+    when(process_mock).kill()
+    if sys.platform != "win32":
+        when(os).killpg(-1, signal.SIGKILL)
+
 
 def test_command_result() -> None:
     cr = py_proc_watch.CommandResult()
@@ -39,20 +81,143 @@ def test_command_result() -> None:
 
 
 @pytest.mark.parametrize(
-    ("buffer", "expected_lines", "max_lines"),
+    ("buffer", "expected_lines", "max_lines", "expected_used_bytes"),
     [
-        (io.StringIO("1\n2\n3\n"), ["1\n"], 1),
-        (io.StringIO("1\n2\n3\n"), ["1\n", "2\n", "3\n"], 3),
-        (io.StringIO("1\n2\n3\n"), ["1\n", "2\n", "3\n"], 100),
-        (io.StringIO("1\n2\n3\n" + "filler\n" * io.DEFAULT_BUFFER_SIZE), ["1\n", "2\n"], 2),
+        (io.BytesIO(b"1\n2\n3\n"), ["1\n"], 1, 2),
+        (io.BytesIO(b"1\n2\n3\n"), ["1\n", "2\n", "3\n"], 3, 6),
+        (io.BytesIO(b"1\n2\n3\n"), ["1\n", "2\n", "3\n"], 100, 6),
+        (io.BytesIO(b"1\n2\n3"), ["1\n", "2\n", "3"], 100, 5),
+        (io.BytesIO(b"1\n2\n3\n" + b"filler\n" * io.DEFAULT_BUFFER_SIZE), ["1\n", "2\n"], 2, 4),
+        (io.BytesIO(b"x" * 3_000_000 + b"\n2\n"), ["x" * 3_000_000 + "\n"], 1, 3_000_001),
+        (
+            io.BytesIO(b"za\xc5\xbc\xc3\xb3\xc5\x82\xc4\x87\n\xff\n\xff\n"),
+            ["za\u017c\u00f3\u0142\u0107\n", "\\xff\n"],
+            2,
+            13,
+        ),
+        (io.BytesIO(b"1\n" + b"overflow\n" * 300_000), ["1\n"], 1, 2),
     ],
+    ids=lambda value: repr(value)[:40],
 )
-def test_reader_thread_func(buffer: io.StringIO, expected_lines: List[str], max_lines: int) -> None:
+def test_reader_thread_func(
+    buffer: io.BytesIO, expected_lines: List[str], max_lines: int, expected_used_bytes: int
+) -> None:
     result = py_proc_watch.CommandResult()
     py_proc_watch.reader_thread_func(result, buffer, max_lines)
 
     assert result.total_read_bytes == buffer.tell()
+    assert result.used_bytes == expected_used_bytes
     assert result.stdout_lines == expected_lines
+    assert (
+        result.output_hash.digest() == hashlib.blake2b(buffer.getvalue()[:expected_used_bytes], digest_size=16).digest()
+    )
+
+
+def test_line_buffer() -> None:
+    lines = py_proc_watch.LineBuffer()
+    assert len(lines) == 0
+    assert lines.window(0, 10) == []
+    assert lines.split_lines() == []
+
+    for line in (b"first\n", b"", b"\xff\n", bytearray(b"last")):
+        lines.append(line)
+
+    assert len(lines) == 4
+    assert [lines[index] for index in range(4)] == ["first\n", "", "\\xff\n", "last"]
+    assert lines.window(1, 2) == ["", "\\xff\n"]
+    assert lines.window(-1, 2) == ["first\n"]
+    assert lines.window(3, 10) == ["last"]
+    with pytest.raises(IndexError):
+        lines[4]
+
+    # Read like the list of lines it replaces.
+    assert lines[-1] == "last"
+    assert lines[-4] == "first\n"
+    for index in (-5, -6):
+        with pytest.raises(IndexError):
+            lines[index]
+    assert lines[1:3] == ["", "\\xff\n"]
+    assert lines[::-2] == ["last", ""]
+    assert list(lines) == ["first\n", "", "\\xff\n", "last"]
+    assert lines == ["first\n", "", "\\xff\n", "last"]
+    assert ["first\n", "", "\\xff\n", "last"] == lines
+    assert lines != ["first\n"]
+    assert lines != "first\n\n"
+    assert "last" in lines
+    with lines.raw(2) as raw_line:
+        assert raw_line == b"\xff\n"
+        # The view is not a copy, the buffer can not grow while it exists.
+        with pytest.raises(BufferError):
+            lines.append(b"more")
+
+    lines = py_proc_watch.LineBuffer()
+    for line in (b"a\n", b"\n", b"b\n"):
+        lines.append(line)
+    assert lines.split_lines() == [b"a", b"", b"b"]
+    lines.append(b"c")
+    assert lines.split_lines() == [b"a", b"", b"b", b"c"]
+
+
+def test_command_result_allocations() -> None:
+    # Collected lines are stored in a single buffer, not as an object per line, so allocations per run do not grow with
+    # the number of lines.
+    data = b"".join(b"%d: some output line\n" % number for number in range(20_000))
+    py_proc_watch.reader_thread_func(py_proc_watch.CommandResult(), io.BytesIO(data), 10)
+    tracemalloc.start()
+    try:
+        snapshot = tracemalloc.take_snapshot()
+        result = py_proc_watch.CommandResult()
+        py_proc_watch.reader_thread_func(result, io.BytesIO(data), 8192)
+        statistics = tracemalloc.take_snapshot().compare_to(snapshot, "filename")
+    finally:
+        tracemalloc.stop()
+
+    assert result.line_count == 8192
+    module_statistics = [stat for stat in statistics if stat.traceback[0].filename == py_proc_watch.__file__]
+    assert sum(stat.count_diff for stat in module_statistics) < 50
+    # The buffer and the array of line ends, growing buffers may over-allocate by an eighth.
+    assert sum(stat.size_diff for stat in module_statistics) < result.used_bytes * 1.25 + 8 * 8192 * 1.25 + 64 * 1024
+
+
+def test_reader_thread_func_scrollback() -> None:
+    data = b"".join(b"line %d\n" % number for number in range(20_000)) + b"partial"
+    result = py_proc_watch.CommandResult()
+    py_proc_watch.reader_thread_func(result, io.BytesIO(data), py_proc_watch.MAX_SCROLLBACK_LINES)
+
+    assert result.line_count == 20_001
+    assert result.stdout_lines.window(19_999, 5) == ["line 19999\n", "partial"]
+    assert result.total_read_bytes == result.used_bytes == len(data)
+    assert result.output_hash.digest() == hashlib.blake2b(data, digest_size=16).digest()
+
+    result = py_proc_watch.CommandResult()
+    py_proc_watch.reader_thread_func(result, io.BytesIO(data), 10)
+
+    assert result.line_count == 10
+    assert result.stdout_lines[9] == "line 9\n"
+    assert result.total_read_bytes == len(data)
+    assert result.used_bytes == len(data[: data.index(b"line 10\n")])
+
+
+@pytest.mark.parametrize(
+    ("buffer", "max_lines", "expected_lines", "expected_total_read_bytes"),
+    [
+        (io.BytesIO(b"1\n2\n3\n" * 1_000_000), 2, ["1\n", "2\n"], 2 * py_proc_watch.READ_BUFFER_SIZE),
+        (io.BytesIO((b"x" * 99 + b"\n") * 30_000), 1_000_000, None, 2 * py_proc_watch.READ_BUFFER_SIZE),
+        (io.BytesIO(b"1\n" + b"x" * 2_000_000), 1_000_000, ["1\n"], 2_000_002),
+    ],
+    ids=["drain", "lines", "partial-line"],
+)
+def test_reader_thread_func_max_bytes(
+    buffer: io.BytesIO, max_lines: int, expected_lines: Optional[List[str]], expected_total_read_bytes: int
+) -> None:
+    result = py_proc_watch.CommandResult()
+    py_proc_watch.reader_thread_func(result, buffer, max_lines, 1_500_000)
+
+    assert result.truncated
+    assert result.total_read_bytes == expected_total_read_bytes == buffer.tell()
+    if expected_lines is not None:
+        assert result.stdout_lines == expected_lines
+    assert result.used_bytes == sum(len(line) for line in result.stdout_lines)
 
 
 def test_get_output_no_stdout(when: mockito.when) -> None:
@@ -65,9 +230,8 @@ def test_get_output_no_stdout(when: mockito.when) -> None:
         shell=True,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        text=True,
-        encoding="UTF-8",
-        errors="backslashreplace",
+        bufsize=0,
+        start_new_session=True,
     ).thenReturn(process_mock)
 
     with pytest.raises(ValueError, match=r"Invalid number of maximum lines: -1"):
@@ -77,79 +241,708 @@ def test_get_output_no_stdout(when: mockito.when) -> None:
         py_proc_watch.get_output(["a-command"], True, 1)
 
 
+def stdout_pipe(data: bytes, keep_open: bool = False) -> Tuple[io.FileIO, int]:
+    # Output of mocked processes is read with a selector, so it needs a real pipe.
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, data)
+    if not keep_open:
+        os.close(write_fd)
+    return io.FileIO(read_fd), write_fd
+
+
 def test_get_output_failure(when: mockito.when) -> None:
-    process_mock = mockito.mock({"stdout": io.StringIO("No such command\n")}, spec=subprocess.Popen)
+    stdout, _ = stdout_pipe(b"No such command\n")
+    process_mock = mockito.mock({"stdout": stdout, "pid": -1}, spec=subprocess.Popen)
     when(process_mock).__enter__().thenReturn(process_mock)
     when(process_mock).__exit__(*mockito.ARGS)
-    when(process_mock).poll().thenReturn(None, 12345)
-    when(process_mock).kill()
+    when(process_mock).wait().thenReturn(12345)
 
     when(subprocess).Popen(
         ["a-command"],
         shell=True,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        text=True,
-        encoding="UTF-8",
-        errors="backslashreplace",
+        bufsize=0,
+        start_new_session=True,
     ).thenReturn(process_mock)
 
-    result = py_proc_watch.get_output(["a-command"], True, 1000)
+    with stdout:
+        result = py_proc_watch.get_output(["a-command"], True, 1000)
 
     assert result.exit_status == 12345
     assert result.stdout_lines == ["No such command\n"]
 
 
 def test_get_output_small(when: mockito.when) -> None:
-    process_mock = mockito.mock(
-        {"stdout": io.StringIO("Command result\nSecond line\nThird line\n")}, spec=subprocess.Popen
-    )
+    stdout, _ = stdout_pipe(b"Command result\nSecond line\nThird line\n")
+    process_mock = mockito.mock({"stdout": stdout, "pid": -1}, spec=subprocess.Popen)
     when(process_mock).__enter__().thenReturn(process_mock)
     when(process_mock).__exit__(*mockito.ARGS)
-    when(process_mock).poll().thenReturn(None, 0)
-    when(process_mock).kill()
+    when(process_mock).wait().thenReturn(0)
 
     when(subprocess).Popen(
         ["a-command"],
         shell=True,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        text=True,
-        encoding="UTF-8",
-        errors="backslashreplace",
+        bufsize=0,
+        start_new_session=True,
     ).thenReturn(process_mock)
 
-    result = py_proc_watch.get_output(["a-command"], True, 1000)
+    with stdout:
+        result = py_proc_watch.get_output(["a-command"], True, 1000)
 
     assert result.exit_status == 0
     assert result.stdout_lines == ["Command result\n", "Second line\n", "Third line\n"]
 
 
 def test_get_output_large(when: mockito.when) -> None:
-    process_mock = mockito.mock(
-        {"stdout": io.StringIO("Command result\nSecond line\nThird line\n" + "filler\n" * 1024)}, spec=subprocess.Popen
-    )
+    stdout, _ = stdout_pipe(b"Command result\nSecond line\nThird line\n" + b"filler\n" * 1024)
+    process_mock = mockito.mock({"stdout": stdout, "pid": -1}, spec=subprocess.Popen)
     when(process_mock).__enter__().thenReturn(process_mock)
     when(process_mock).__exit__(*mockito.ARGS)
-    when(process_mock).poll().thenReturn(None, None, None, 0)
-    when(process_mock).kill()
+    when(process_mock).wait().thenReturn(0)
 
     when(subprocess).Popen(
         ["a-command"],
         shell=True,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        text=True,
-        encoding="UTF-8",
-        errors="backslashreplace",
+        bufsize=0,
+        start_new_session=True,
     ).thenReturn(process_mock)
 
-    result = py_proc_watch.get_output(["a-command"], True, 3)
+    with stdout:
+        result = py_proc_watch.get_output(["a-command"], True, 3)
 
     assert result.exit_status == 0
     assert result.stdout_lines == ["Command result\n", "Second line\n", "Third line\n"]
 
 
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_shell_coprocess() -> None:
+    with py_proc_watch.ShellCoprocess("/bin/sh") as coprocess:
+        with pytest.raises(ValueError, match=r"Invalid number of maximum lines: 0"):
+            coprocess.run("true", 0)
+
+        result = coprocess.run("echo first; echo second", 1000)
+        assert result.exit_status == 0
+        assert result.stdout_lines == ["first\n", "second\n"]
+        assert result.total_read_bytes == len("first\nsecond\n")
+
+        proc = coprocess.proc
+        result = coprocess.run("printf partial; false", 1000)
+        assert coprocess.proc is proc
+        assert result.exit_status == 1
+        assert result.stdout_lines == ["partial"]
+
+        result = coprocess.run("seq 1 10; cat; exit 3", 2)
+        assert coprocess.proc is None
+        assert result.exit_status == 3
+        assert result.stdout_lines == ["1\n", "2\n"]
+        assert result.total_read_bytes == len("".join(f"{number}\n" for number in range(1, 11)))
+
+        result = coprocess.run("echo respawned >&2", 1000)
+        assert coprocess.proc is not None
+        assert result.exit_status == 0
+        assert result.stdout_lines == ["respawned\n"]
+
+        assert coprocess.proc.stdin is not None
+        coprocess.proc.stdin.close()
+        coprocess.proc.kill()
+        coprocess.proc.wait()
+        assert coprocess.run("echo again", 1000).stdout_lines == ["again\n"]
+
+        coprocess.close()
+        coprocess.proc = subprocess.Popen(
+            ["/bin/sh", "-c", "exec 0<&-; echo ready; exec sleep 10"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        assert coprocess.proc.stdout is not None
+        assert coprocess.proc.stdout.readline() == b"ready\n"
+        assert coprocess.run("echo after broken pipe", 1000).stdout_lines == ["after broken pipe\n"]
+
+    assert coprocess.proc is None
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_shell_coprocess_scrollback() -> None:
+    with py_proc_watch.ShellCoprocess("/bin/sh") as coprocess:
+        with pytest.raises(ValueError, match=r"Invalid number of maximum lines: 8193"):
+            coprocess.run("true", 8193)
+
+        result = coprocess.run("seq 1 10000", 9000, scrollback=True)
+        assert result.line_count == 9000
+        assert result.stdout_lines.window(8998, 5) == ["8999\n", "9000\n"]
+        assert result.used_bytes == len("".join(f"{number}\n" for number in range(1, 9001)))
+        assert (
+            result.output_hash.digest()
+            == hashlib.blake2b("".join(f"{number}\n" for number in range(1, 9001)).encode(), digest_size=16).digest()
+        )
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_shell_coprocess_limits() -> None:
+    with py_proc_watch.ShellCoprocess("/bin/sh") as coprocess:
+        result = coprocess.run("echo before; sleep 30", 1000, timeout=0.5)
+        assert result.timed_out
+        assert result.stdout_lines == ["before\n"]
+        assert coprocess.proc is None
+
+        result = coprocess.run("yes", 10, max_bytes=100_000)
+        assert result.truncated
+        assert not result.timed_out
+        assert result.stdout_lines == ["y\n"] * 10
+        assert coprocess.proc is None
+
+        result = coprocess.run("echo fast", 1000, max_bytes=100_000, timeout=10.0)
+        assert not result.truncated
+        assert not result.timed_out
+        assert result.stdout_lines == ["fast\n"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+@pytest.mark.parametrize(
+    "shell_script",
+    [
+        # Never answers, like fish or tcsh failing on the POSIX syntax of the probe.
+        "exec cat >/dev/null",
+        # Answers the probe with a failure status.
+        'read line; read line; read line; set -- $line; echo "$4 1"; exec cat >/dev/null',
+        # Exits right away.
+        "exit 0",
+    ],
+    ids=["silent", "failing", "exiting"],
+)
+def test_shell_coprocess_non_posix_shell(tmp_path: pathlib.Path, shell_script: str) -> None:
+    shell = tmp_path / "not-a-posix-shell"
+    shell.write_text(f"#!/bin/sh\n{shell_script}\n")
+    shell.chmod(0o755)
+    start_time = time.monotonic()
+
+    with py_proc_watch.ShellCoprocess(str(shell), probe_timeout=0.5) as coprocess:
+        with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Shell .* does not understand POSIX syntax"):
+            coprocess.run("true", 1)
+        assert coprocess.proc is None
+
+    assert time.monotonic() - start_time < 5.0
+
+
+def test_shell_coprocess_no_pipes(when: mockito.when) -> None:
+    process_mock = mockito.mock({"stdin": None, "stdout": None, "pid": -1}, spec=subprocess.Popen)
+    stub_process_termination(when, process_mock)
+    when(process_mock).__enter__().thenReturn(process_mock)
+    when(process_mock).__exit__(*mockito.ARGS)
+    when(subprocess).Popen(["a-shell"], *mockito.ARGS, **mockito.KWARGS).thenReturn(process_mock)
+
+    with py_proc_watch.ShellCoprocess("a-shell") as coprocess:
+        with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Failed to open shell co-process pipes"):
+            coprocess.run("true", 1)
+
+
+def test_get_output_real_process() -> None:
+    result = py_proc_watch.get_output([sys.executable, "-c", "print('first'); print('second')"], False, 1000)
+
+    assert result.exit_status == 0
+    assert result.stdout_lines == ["first\n", "second\n"]
+
+    result = py_proc_watch.get_output([sys.executable, "-c", "print('fast')"], False, 1000, timeout=10.0)
+
+    assert result.exit_status == 0
+    assert not result.timed_out
+    assert result.stdout_lines == ["fast\n"]
+
+    started: List["subprocess.Popen[bytes]"] = []
+    py_proc_watch.get_output([sys.executable, "-c", "pass"], False, 1000, on_start=started.append)
+
+    assert len(started) == 1
+    assert started[0].returncode == 0
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_get_output_keeps_background_jobs() -> None:
+    result = py_proc_watch.get_output(["sleep 30 >/dev/null 2>&1 & echo $!"], True, 10)
+
+    background_pid = int(result.stdout_lines[0])
+    try:
+        os.kill(background_pid, 0)
+    finally:
+        os.kill(background_pid, signal.SIGKILL)
+
+
+def test_get_output_interrupted(when: mockito.when, expect: mockito.expect) -> None:
+    stdout, _ = stdout_pipe(b"")
+    process_mock = mockito.mock({"stdout": stdout, "pid": -1}, spec=subprocess.Popen)
+    when(process_mock).__enter__().thenReturn(process_mock)
+    when(process_mock).__exit__(*mockito.ARGS)
+    when(subprocess).Popen(["a-command"], *mockito.ARGS, **mockito.KWARGS).thenReturn(process_mock)
+    read = "read_output_in_thread" if sys.platform == "win32" else "read_output"
+    getattr(when(py_proc_watch), read)(*mockito.ARGS).thenRaise(KeyboardInterrupt)
+    expect(py_proc_watch, times=1).kill_process_group(process_mock)
+
+    with stdout, pytest.raises(KeyboardInterrupt):
+        py_proc_watch.get_output(["a-command"], True, 1000)
+
+
+@pytest.mark.parametrize(
+    ("data", "line_count", "expected_offset"),
+    [
+        (b"", 2, 0),
+        (b"a\nb\nc\n", 2, 2),
+        (b"a\nb\nc", 2, 2),
+        (b"a\nb\nc\n", 3, 0),
+        (b"a\nb\nc\n", 5, 0),
+        (b"\n\n", 1, 1),
+    ],
+    ids=repr,
+)
+def test_tail_offset(data: bytes, line_count: int, expected_offset: int) -> None:
+    assert py_proc_watch._tail_offset(data, line_count) == expected_offset  # noqa: SLF001
+
+
+@pytest.mark.parametrize("scrollback", [False, True], ids=str)
+def test_read_file(tmp_path: pathlib.Path, scrollback: bool) -> None:
+    path = tmp_path / "some.log"
+    path.write_bytes(b"".join(b"line %d\n" % number for number in range(1000)) + b"last")
+
+    def read_lines(max_lines: int, tail: bool = False) -> List[str]:
+        result = py_proc_watch.read_file(str(path), max_lines, scrollback=scrollback, tail=tail)
+        assert result.exit_status == 0
+        return result.stdout_lines[:]
+
+    assert read_lines(2) == ["line 0\n", "line 1\n"]
+    assert read_lines(2, tail=True) == ["line 999\n", "last"]
+    assert len(read_lines(2000)) == 1001
+    with pytest.raises(ValueError, match=r"Invalid number of maximum lines: 0"):
+        py_proc_watch.read_file(str(path), 0)
+
+
+def test_read_file_output_hash(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "some.log"
+    path.write_bytes(b"a\nb\n" + b"x" * (3 * py_proc_watch.READ_BUFFER_SIZE))
+
+    result = py_proc_watch.read_file(str(path), 1)
+    truncated = py_proc_watch.read_file(str(path), 10, max_bytes=10)
+
+    assert result.output_hash.digest() == hashlib.blake2b(b"a\n", digest_size=16).digest()
+    assert result.total_read_bytes == path.stat().st_size
+    assert truncated.truncated
+    assert truncated.stdout_lines == ["a\n", "b\n"]
+
+
+def test_read_file_empty_and_missing(tmp_path: pathlib.Path) -> None:
+    # An empty file can not be mapped and is read instead, errors are shown like the output of a failed command.
+    path = tmp_path / "empty.log"
+    path.write_bytes(b"")
+
+    empty = py_proc_watch.read_file(str(path), 10)
+    missing = py_proc_watch.read_file(str(tmp_path / "missing.log"), 10)
+
+    assert empty.stdout_lines == []
+    assert empty.exit_status == 0
+    assert missing.stdout_lines == [f"{tmp_path / 'missing.log'}: No such file or directory\n"]
+    assert missing.exit_status == 1
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires procfs")
+def test_read_file_procfs() -> None:
+    result = py_proc_watch.read_file("/proc/self/status", 100)
+
+    assert result.exit_status == 0
+    assert result.stdout_lines[0].startswith("Name:")
+    assert py_proc_watch._is_pseudo_file("/proc/self/status")  # noqa: SLF001
+
+
+def test_is_pseudo_file(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "file"
+    path.write_bytes(b"data\n")
+
+    assert not py_proc_watch._is_pseudo_file(str(path))  # noqa: SLF001
+    assert not py_proc_watch._is_pseudo_file(str(tmp_path / "missing"))  # noqa: SLF001
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_inotify(tmp_path: pathlib.Path) -> None:
+    with py_proc_watch.Inotify() as inotify:
+        descriptor = inotify.add_watch(str(tmp_path), py_proc_watch.INOTIFY_CHANGE_MASK)
+        assert inotify.read_events() == []
+
+        (tmp_path / "first").write_bytes(b"1")
+        (tmp_path / "second").write_bytes(b"2")
+        events = inotify.read_events()
+
+        assert {name for _, _, name in events} == {"first", "second"}
+        assert all(event_descriptor == descriptor for event_descriptor, _, _ in events)
+        with pytest.raises(FileNotFoundError):
+            inotify.add_watch(str(tmp_path / "missing"), py_proc_watch.INOTIFY_CHANGE_MASK)
+    assert inotify.fd == -1
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_inotify_init_failure(when: mockito.when) -> None:
+    import ctypes
+
+    libc = mockito.mock()
+    when(libc).inotify_init1(mockito.ANY).thenReturn(-1)
+    when(ctypes).CDLL(None, use_errno=True).thenReturn(libc)
+    when(ctypes).get_errno().thenReturn(24)
+
+    with pytest.raises(OSError, match=r"Too many open files"):
+        py_proc_watch.Inotify()
+
+
+def test_file_source(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "some.log"
+    path.write_bytes(b"1\n")
+    with py_proc_watch.FileSource(str(path)) as source:
+        first = source.read(10)
+
+        assert first.stdout_lines == ["1\n"]
+        assert source.read(10) is first
+        assert source.read(5) is not first
+
+        path.write_bytes(b"2\n")
+        if source.fd is not None:
+            assert select_readable(source.fd)
+        second = source.read(5)
+
+        assert second.stdout_lines == ["2\n"]
+        assert source.read(5) is second
+
+        path.unlink()
+
+        assert source.read(5).exit_status == 1
+
+
+def select_readable(fd: int) -> bool:
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        return bool(selector.select(5.0))
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_file_source_replaced(tmp_path: pathlib.Path) -> None:
+    # Same size and (coarse) modification time, only the notification tells that the file changed.
+    path = tmp_path / "some.log"
+    path.write_bytes(b"1\n")
+    with py_proc_watch.FileSource(str(path)) as source:
+        assert source.read(10).stdout_lines == ["1\n"]
+
+        modified = path.stat().st_mtime_ns
+        path.write_bytes(b"2\n")
+        os.utime(path, ns=(modified, modified))
+
+        assert source.read(10).stdout_lines == ["2\n"]
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_file_source_errors(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Failed to watch .*file for changes: .*No such file"):
+        py_proc_watch.FileSource(str(tmp_path / "missing" / "file"))
+
+    with py_proc_watch.FileSource("/proc/self/status") as source:
+        assert source.fd is None
+        first = source.read(100)
+
+        assert source.read(100) is not first
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_change_monitor(tmp_path: pathlib.Path) -> None:
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    watched_file = tmp_path / "watched.txt"
+    with py_proc_watch.ChangeMonitor([str(tree), str(watched_file)]) as changes:
+        assert not changes.changed()
+
+        (tmp_path / "other.txt").write_bytes(b"ignored")
+        assert not changes.changed()
+
+        watched_file.write_bytes(b"1")
+        assert changes.changed()
+
+        (tree / "sub" / "file").write_bytes(b"1")
+        assert changes.changed()
+
+        (tree / "new").mkdir()
+        assert changes.changed()
+
+        # Changes while the command ran run it once more, changes during that extra run are dropped.
+        (tree / "new" / "file").write_bytes(b"1")
+        changes.after_run()
+        assert changes.changed()
+        (tree / "new" / "file").write_bytes(b"2")
+        changes.after_run()
+        assert not changes.changed()
+        changes.after_run()
+        assert not changes.changed()
+
+        (tree / "new" / "file").write_bytes(b"3")
+        assert changes.changed()
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_change_monitor_wait(tmp_path: pathlib.Path) -> None:
+    watched_file = tmp_path / "watched.txt"
+    with py_proc_watch.ChangeMonitor([str(tmp_path)]) as changes:
+        start_time = time.monotonic()
+        changes.wait(0.2)
+        assert 0.15 < time.monotonic() - start_time < 5.0
+
+        # Writes every 20ms for 0.3s are a single burst, the wait ends after the writes settled.
+        def write_burst() -> None:
+            for number in range(15):
+                watched_file.write_bytes(b"%d" % number)
+                time.sleep(0.02)
+
+        writer = threading.Thread(target=write_burst)
+        start_time = time.monotonic()
+        writer.start()
+        changes.wait()
+        elapsed = time.monotonic() - start_time
+        writer.join()
+
+        assert 0.3 <= elapsed < 5.0
+        assert not changes.changed()
+
+        # A sleep replacing the selector ends the wait early by returning True.
+        sleeps: List[float] = []
+
+        def sleep(seconds: float) -> bool:
+            sleeps.append(seconds)
+            return len(sleeps) == 2
+
+        changes.wait(sleep=sleep)
+        assert sleeps == [60.0, 60.0]
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_change_monitor_errors(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Failed to watch .*missing for changes: No such file"):
+        py_proc_watch.ChangeMonitor([str(tmp_path / "missing" / "file")])
+
+
+def test_value_history() -> None:
+    history = py_proc_watch.ValueHistory(3)
+    assert (len(history), history.latest(2), list(history.kept()), history.rate()) == (0, [], [], 0.0)
+
+    for timestamp, value in ((10.0, 1.0), (11.0, 5.0), (12.0, 2.0), (14.0, 8.0)):
+        history.append(timestamp, value)
+
+    assert len(history) == 3
+    assert history.latest(2) == [2.0, 8.0]
+    assert history.latest(10) == [5.0, 2.0, 8.0]
+    assert sorted(history.kept()) == [2.0, 5.0, 8.0]
+    assert history.rate() == pytest.approx(1.0)
+    with pytest.raises(ValueError, match=r"Invalid history size: 1"):
+        py_proc_watch.ValueHistory(1)
+
+
+def test_sparkline() -> None:
+    assert py_proc_watch.sparkline([0.0, 3.5, 7.0, 1.0]) == "▁▅█▂"
+    assert py_proc_watch.sparkline([2.0, 2.0]) == "▁▁"
+    assert py_proc_watch.sparkline([]) == ""
+
+
+def test_field_tracker() -> None:
+    tracker = py_proc_watch.FieldTracker(
+        [r"depth: (\d+)", r"(?P<free>[\d.]+)G free", "[0-9]+", r"^(\d+)", r"(n/a)?G free"], history=4
+    )
+    lines = py_proc_watch.LineBuffer()
+    values = tracker.new_values()
+    for line in (b"depth: 12\n", b"depth: 13 free: n/a G free\n", b"0.5G free 7\n"):
+        lines.append(line)
+        tracker.extract(lines, len(lines) - 1, values)
+
+    # The first line where the match is a number wins, patterns without a group use the whole match. Lines are searched
+    # in place, ^ matches at the start of every line.
+    assert list(values[:4]) == [12.0, 0.5, 12.0, 0.0]
+    assert math.isnan(values[4])
+    assert tracker.labels[:3] == [r"depth: (\d+)", "free", "[0-9]+"]
+
+    tracker = py_proc_watch.FieldTracker([r"depth: (\d+)", r"(?P<free>[\d.]+)G free", "[0-9]+"], history=4)
+    values = tracker.new_values()
+    tracker.extract(lines, 0, values)
+    tracker.record(10.0, values)
+    tracker.record(12.0, array.array("d", [16.0, math.nan, 12.0]))
+    assert tracker.describe() == (
+        r"depth: (\d+) ▁█ 16 min 12 max 16 +2/s  free ▁ 0.5 min 0.5 max 0.5 +0/s  [0-9]+ ▁▁ 12 min 12 max 12 +0/s"
+    )
+    assert py_proc_watch.FieldTracker(["x"]).describe() == "x -"
+    tracker = py_proc_watch.FieldTracker(["[0-9.]+"])
+    tracker.record(10.0, array.array("d", [4765372.0]))
+    tracker.record(11.0, array.array("d", [0.1234567]))
+    assert tracker.describe() == "[0-9.]+ █▁ 0.123457 min 0.123457 max 4765372 -4.77e+06/s"
+    with pytest.raises(ValueError, match=r"Invalid track pattern \(: missing \), unterminated subpattern"):
+        py_proc_watch.FieldTracker(["("])
+
+
+def test_get_output_tracks_numbers() -> None:
+    tracker = py_proc_watch.FieldTracker([r"^(\d+)$", "missing"])
+    script = "print('header'); print(42); print(43)"
+
+    result = py_proc_watch.get_output([sys.executable, "-c", script], False, 1000, tracker=tracker)
+
+    assert result.tracked is not None
+    assert result.tracked[0] == 42.0
+    assert math.isnan(result.tracked[1])
+    assert py_proc_watch.get_output([sys.executable, "-c", script], False, 1000).tracked is None
+
+
+def test_get_output_scrollback() -> None:
+    script = "for number in range(10000): print(number)"
+    with pytest.raises(ValueError, match=r"Invalid number of maximum lines: 1048577"):
+        py_proc_watch.get_output([sys.executable, "-c", script], False, 1024 * 1024 + 1, scrollback=True)
+
+    result = py_proc_watch.get_output([sys.executable, "-c", script], False, 10_000, scrollback=True)
+
+    assert result.exit_status == 0
+    assert result.stdout_lines.window(9_998, 10) == ["9998\n", "9999\n"]
+
+
+def test_get_output_does_not_spin() -> None:
+    start_cpu_time = time.process_time()
+    start_time = time.monotonic()
+
+    result = py_proc_watch.get_output([sys.executable, "-c", "import time; time.sleep(2)"], False, 1000)
+
+    assert result.exit_status == 0
+    assert time.monotonic() - start_time >= 2.0
+    assert time.process_time() - start_cpu_time < 0.2
+
+
+def test_get_output_timeout(when: mockito.when) -> None:
+    stdout, write_fd = stdout_pipe(b"Partial\n", keep_open=True)
+    process_mock = mockito.mock({"stdout": stdout, "pid": -1}, spec=subprocess.Popen)
+    when(process_mock).__enter__().thenReturn(process_mock)
+    when(process_mock).__exit__(*mockito.ARGS)
+    when(process_mock).wait().thenReturn(-9)
+    # Killing the process closes its end of the pipe.
+    when(process_mock).kill().thenAnswer(lambda: os.close(write_fd))
+    if sys.platform != "win32":
+        when(os).killpg(-1, signal.SIGKILL)
+    when(subprocess).Popen(["a-command"], *mockito.ARGS, **mockito.KWARGS).thenReturn(process_mock)
+
+    with stdout:
+        result = py_proc_watch.get_output(["a-command"], True, 1000, timeout=0.5)
+
+    assert result.timed_out
+    assert result.exit_status == -9
+    assert result.stdout_lines == ["Partial\n"]
+
+
+def test_get_output_timeout_after_output(when: mockito.when) -> None:
+    # Without pidfd the child is waited for after its output ended, only the rest of the timeout is left for that.
+    stdout, _ = stdout_pipe(b"Done\n")
+    process_mock = mockito.mock({"stdout": stdout, "pid": -1}, spec=subprocess.Popen)
+    when(process_mock).__enter__().thenReturn(process_mock)
+    when(process_mock).__exit__(*mockito.ARGS)
+    when(process_mock).wait(mockito.ANY(float)).thenRaise(subprocess.TimeoutExpired(["a-command"], 0.5))
+    when(process_mock).wait().thenReturn(-9)
+    stub_process_termination(when, process_mock)
+    when(subprocess).Popen(["a-command"], *mockito.ARGS, **mockito.KWARGS).thenReturn(process_mock)
+
+    with stdout:
+        result = py_proc_watch.get_output(["a-command"], True, 1000, timeout=0.5)
+
+    assert result.timed_out
+    assert result.exit_status == -9
+    assert result.stdout_lines == ["Done\n"]
+
+
+@pytest.mark.parametrize(
+    ("script", "max_bytes", "timeout", "expected_lines", "expected_status"),
+    [
+        ("print('first'); print('second', end='')", 0, 0.0, ["first\n", "second"], (True, False, False)),
+        ("print('first', flush=True); import time; time.sleep(30)", 0, 0.5, ["first\n"], (False, True, False)),
+        ("import sys; sys.stdout.write('x\\n' * 10**7)", 100_000, 0.0, ["x\n"] * 3, (False, False, True)),
+    ],
+    ids=["output", "timeout", "truncated"],
+)
+def test_read_output_in_thread(
+    script: str, max_bytes: int, timeout: float, expected_lines: List[str], expected_status: Tuple[bool, bool, bool]
+) -> None:
+    with subprocess.Popen(
+        [sys.executable, "-c", script], stdout=subprocess.PIPE, bufsize=0, start_new_session=True
+    ) as proc:
+        result = py_proc_watch.CommandResult()
+        result.exit_status = py_proc_watch.read_output_in_thread(proc, result, 3, max_bytes, timeout)
+
+    assert result.stdout_lines == expected_lines
+    assert (result.exit_status == 0, result.timed_out, result.truncated) == expected_status
+
+
+def test_wait_for_exit_reader_timeout(when: mockito.when) -> None:
+    process_mock = mockito.mock({"pid": -1}, spec=subprocess.Popen)
+    when(process_mock).wait(0.2).thenReturn(0)
+    reader_thread = threading.Thread(target=time.sleep, args=(1.0,))
+    reader_thread.start()
+
+    assert py_proc_watch.wait_for_exit(process_mock, reader_thread, -1, 0.2) is None
+    reader_thread.join()
+
+
+def test_wait_for_exit_process_timeout(when: mockito.when) -> None:
+    process_mock = mockito.mock({"pid": -1}, spec=subprocess.Popen)
+    when(process_mock).wait(0.2).thenRaise(subprocess.TimeoutExpired(["a-command"], 0.2))
+    reader_thread = threading.Thread(target=time.sleep, args=(0.0,))
+    reader_thread.start()
+
+    assert py_proc_watch.wait_for_exit(process_mock, reader_thread, -1, 0.2) is None
+    reader_thread.join()
+
+
+def test_get_output_real_timeout(tmp_path: pathlib.Path) -> None:
+    start_time = time.monotonic()
+    pid_file = tmp_path / "grandchild.pid"
+    script = (
+        "import subprocess, sys, time\n"
+        "grandchild = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(grandchild.pid))\n"
+        "print('started', flush=True)\n"
+        "time.sleep(30)\n"
+    )
+
+    result = py_proc_watch.get_output([sys.executable, "-c", script], False, 1000, timeout=1.0)
+
+    assert time.monotonic() - start_time < 10.0
+    assert result.timed_out
+    assert result.exit_status != 0
+    assert result.stdout_lines == ["started\n"]
+    if sys.platform != "win32":
+        grandchild_pid = int(pid_file.read_text())
+        for _ in range(100):
+            try:
+                os.kill(grandchild_pid, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.05)
+        else:
+            pytest.fail("grandchild process is still running")
+
+
+def test_get_output_real_max_bytes() -> None:
+    script = "import sys\nwhile True:\n    sys.stdout.buffer.write(b'x' * 99 + b'\\n')\n"
+
+    result = py_proc_watch.get_output([sys.executable, "-c", script], False, 10, max_bytes=5_000_000)
+
+    assert result.truncated
+    assert not result.timed_out
+    assert result.exit_status != 0
+    assert result.total_read_bytes >= 5_000_000
+    assert result.stdout_lines == ["x" * 99 + "\n"] * 10
+
+
+def test_escape_sequences() -> None:
+    assert py_proc_watch.COLOR_GREY == colorama.Fore.LIGHTBLACK_EX
+    assert py_proc_watch.COLOR_RED == colorama.Fore.LIGHTRED_EX
+    assert py_proc_watch.COLOR_RESET == colorama.Fore.RESET
+    assert py_proc_watch.STYLE_RESET == colorama.Style.RESET_ALL
+    assert py_proc_watch.CLEAR_LINE == colorama.ansi.clear_line(0)
+    assert py_proc_watch.cursor_position(3, 7) == colorama.Cursor.POS(3, 7)
+
+
 def test_ansi_aware_line_trim() -> None:
     st = f"{colorama.Style.RESET_ALL}"
 
@@ -180,6 +973,108 @@ def test_ansi_aware_line_trim() -> None:
     )
 
 
+@pytest.mark.parametrize(
+    ("line", "max_width", "expected"),
+    [
+        ("\033[1;2;3;4mfoo", 2, "\033[1;2;3;4mfo{st}"),
+        ("f\033]0;title\007oo", 2, "fo{st}"),
+        ("f\033(Boo", 80, "foo{cl}\n"),
+        ("foo\033[3", 80, "foo{cl}\n"),
+        ("fo\ro\x00", 80, "foo{cl}\n"),
+        ("a\tb", 80, "a       b{cl}\n"),
+        ("a\tb", 4, "a   {st}"),
+        ("\u4f60\u597d", 80, "\u4f60\u597d{cl}\n"),
+        ("\u4f60\u597d", 4, "\u4f60\u597d{st}"),
+        ("\u4f60\u597d", 3, "\u4f60 {st}"),
+        ("e\u0301e\u0301e\u0301", 2, "e\u0301e\u0301{st}"),
+        ("e\u0301e\u0301", 80, "e\u0301e\u0301{cl}\n"),
+    ],
+    ids=repr,
+)
+def test_ansi_aware_line_trim_columns(line: str, max_width: int, expected: str) -> None:
+    assert py_proc_watch.ansi_aware_line_trim(line, max_width) == expected.format(
+        st=colorama.Style.RESET_ALL, cl=colorama.ansi.clear_line(0)
+    )
+
+
+ON = py_proc_watch.HIGHLIGHT_ON
+OFF = py_proc_watch.HIGHLIGHT_OFF
+
+
+@pytest.mark.parametrize(
+    ("line", "changed", "expected"),
+    [
+        ("abcd", bytearray(b"\x00\x01\x01\x00"), f"a{ON}bc{OFF}d"),
+        ("abcd", bytearray(b"\x00\x00\x00\x01\x01"), f"abc{ON}d{OFF}"),
+        ("abcd", bytearray(b"\x00"), "abcd"),
+        ("a\033[31mbc\033[0md", bytearray(b"\x00\x01\x01\x01"), f"a\033[31m{ON}bc\033[0m{ON}d{OFF}"),
+        ("\033[31mab", bytearray(b"\x00\x01"), f"\033[31ma{ON}b{OFF}"),
+    ],
+    ids=repr,
+)
+def test_highlight_cells(line: str, changed: bytearray, expected: str) -> None:
+    assert py_proc_watch.highlight_cells(line, changed) == expected
+
+
+def test_difference_highlighter() -> None:
+    highlighter = py_proc_watch.DifferenceHighlighter()
+
+    assert highlighter.highlight(["abc\n", "\033[32mdef\n"]) == ["abc\n", "\033[32mdef\n"]
+    assert not highlighter.highlighted
+    lines = highlighter.highlight(["abc\n", "\033[32mdxf\n", "new\n"])
+    assert lines == ["abc\n", f"\033[32md{ON}x{OFF}f", f"{ON}new{OFF}"]
+    assert highlighter.highlighted
+    assert highlighter.highlight(["abc\n", "\033[32mdxf\n", "new\n"]) == ["abc\n", "\033[32mdxf\n", "new\n"]
+    assert not highlighter.highlighted
+    assert py_proc_watch.ansi_aware_line_trim(lines[1], 2) == f"\033[32md{ON}x{colorama.Style.RESET_ALL}"
+
+
+def test_difference_highlighter_cumulative() -> None:
+    highlighter = py_proc_watch.DifferenceHighlighter(cumulative=True)
+
+    highlighter.highlight(["abc\n", "def\n"])
+    assert highlighter.highlight(["xbc\n", "def\n"]) == [f"{ON}x{OFF}bc", "def\n"]
+    assert highlighter.highlight(["xbz\n", "def\n"]) == [f"{ON}x{OFF}b{ON}z{OFF}", "def\n"]
+    assert highlighter.highlight(["xbz\n", "def\n"]) == [f"{ON}x{OFF}b{ON}z{OFF}", "def\n"]
+    assert highlighter.highlight(["x\n", "def\n", "g\n"]) == [f"{ON}x{OFF}", "def\n", f"{ON}g{OFF}"]
+    assert highlighter.highlighted
+
+
+def test_frame_renderer() -> None:
+    renderer = py_proc_watch.FrameRenderer()
+    color = colorama.Fore.LIGHTBLACK_EX
+
+    frame = renderer.render((10, 4), color, "status 12", ["a\n", "b\n", "c\n"])
+    assert frame == f"\033[1;1H{color}status 12{colorama.Fore.RESET}\033[2;1Ha\nb\nc\033[4;10H"
+    assert renderer.last_frame_bytes == len(frame)
+
+    assert renderer.render((10, 4), color, "status 12", ["a\n", "b\n", "c\n"]) == "\033[4;10H"
+    assert renderer.last_frame_bytes == len("\033[4;10H")
+
+    assert (
+        renderer.render((10, 4), color, "status 13", ["a\n", "B\n", "c\n"])
+        == f"\033[1;9H{color}3{colorama.Fore.RESET}\033[3;1HB\n\033[4;10H"
+    )
+    assert renderer.render((10, 4), color, "status 13", ["A\n", "B\n", "C\n"]) == "\033[2;1HA\n\033[4;1HC\033[4;10H"
+
+    red = colorama.Fore.LIGHTRED_EX
+    assert (
+        renderer.render((10, 4), red, "status 13", ["x\n", "B\n", "C\n"])
+        == f"\033[1;1H{red}status 13{colorama.Fore.RESET}\033[2;1Hx\n\033[4;10H"
+    )
+
+    assert (
+        renderer.render((11, 4), red, "status 13 ", ["x\n", "B\n", "C\n"])
+        == f"\033[1;1H{red}status 13 {colorama.Fore.RESET}\033[2;1Hx\nB\nC\033[4;11H"
+    )
+
+    # The cursor does not wrap after the full-width status line, an empty first row is positioned like any other.
+    assert (
+        renderer.render((11, 4), color, "status 14 ", ["\033[0K\n", "B\n", "C\n"])
+        == f"\033[1;1H{color}status 14 {colorama.Fore.RESET}\033[2;1H\033[0K\n\033[4;11H"
+    )
+
+
 def test_check_shell(when: mockito.when) -> None:
     when(os).getenv("SHELL").thenReturn(None, "/bin/shell", "shell", "missing-shell")
 
@@ -209,43 +1104,363 @@ def test_check_shell(when: mockito.when) -> None:
         py_proc_watch.check_shell("kubectl get pod")
 
 
-def test_watch_invalid_params() -> None:
-    with pytest.raises(ValueError, match=r"Invalid command: "):
-        py_proc_watch.watch("")
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
 
-    with pytest.raises(ValueError, match=r"Invalid interval value: -?[\d\.]+"):
-        py_proc_watch.watch("a-command", -0.1)
-    with pytest.raises(ValueError, match=r"Invalid interval value: -?[\d\.]+"):
-        py_proc_watch.watch("a-command", 24 * 60 * 60 + 1)
+    def __call__(self) -> float:
+        return self.now
 
+    def sleep(self, duration: float) -> None:
+        assert duration >= 0.0
+        self.now += duration
 
-def test_watch_tty_check(when: mockito.when) -> None:
-    when(sys.stdout).isatty().thenReturn(False)
 
-    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"stdout is not a tty!"):
-        py_proc_watch.watch("a-command")
+def test_tick_scheduler_invalid_policy() -> None:
+    with pytest.raises(ValueError, match=r"Invalid missed tick policy: sometimes"):
+        py_proc_watch.TickScheduler(1.0, "sometimes")
 
 
-def test_watch_screen_size_check(when: mockito.when) -> None:
-    when(sys.stdout).isatty().thenReturn(True)
-    when(os).get_terminal_size().thenReturn((47, 3))
+def test_tick_scheduler_no_drift() -> None:
+    clock = FakeClock()
+    scheduler = py_proc_watch.TickScheduler(0.1, clock=clock, sleep=clock.sleep)
+    work = [0.0, 0.05, 0.0999, 0.03, 0.07]
 
-    with pytest.raises(
-        py_proc_watch.PyProcWatchError, match=r"Terminal window too small: \(47x3\), need at least \(\d+x\d+\)"
-    ):
-        py_proc_watch.watch("a-command")
+    for tick in range(1, 10_001):
+        clock.now += work[tick % len(work)]
+        scheduler.wait()
+        assert clock.now == pytest.approx(1000.0 + tick * 0.1, abs=1e-9)
+        assert scheduler.jitter == pytest.approx(0.0, abs=1e-9)
 
+    assert scheduler.overruns == 0
+    assert scheduler.tick == 10_000
 
-def test_watch_normal_call(when: mockito.when, expect: mockito.expect) -> None:
-    when(sys.stdout).isatty().thenReturn(True)
-    when(os).get_terminal_size().thenReturn((50, 4))
-    when(time).time().thenReturn(
-        0.0,
+
+def test_tick_scheduler_oversleep_does_not_accumulate() -> None:
+    clock = FakeClock()
+
+    def late_sleep(duration: float) -> None:
+        clock.sleep(duration + 0.001)
+
+    scheduler = py_proc_watch.TickScheduler(0.1, clock=clock, sleep=late_sleep)
+    for _ in range(10_000):
+        clock.now += 0.01
+        scheduler.wait()
+        assert scheduler.jitter == pytest.approx(0.001)
+
+    assert clock.now == pytest.approx(1000.0 + 10_000 * 0.1 + 0.001)
+
+
+@pytest.mark.parametrize(
+    ("policy", "expected_wakeups", "expected_overruns"),
+    [
+        ("skip", [1.0, 2.0, 5.0, 6.0, 7.0], 1),
+        ("immediate", [1.0, 2.0, 4.5, 4.5, 5.0], 2),
+        ("coalesce", [1.0, 2.0, 4.5, 5.0, 6.0], 1),
+    ],
+    ids=str,
+)
+def test_tick_scheduler_missed_ticks(policy: str, expected_wakeups: List[float], expected_overruns: int) -> None:
+    clock = FakeClock()
+    clock.now = 0.0
+    scheduler = py_proc_watch.TickScheduler(1.0, policy, clock=clock, sleep=clock.sleep)
+    work = [0.1, 0.1, 2.5, 0.0, 0.0]
+    wakeups = []
+
+    for duration in work:
+        clock.now += duration
+        scheduler.wait()
+        wakeups.append(clock.now)
+
+    assert wakeups == pytest.approx(expected_wakeups)
+    assert scheduler.overruns == expected_overruns
+    assert scheduler.jitter == pytest.approx(0.0)
+
+
+def test_tick_scheduler_zero_interval() -> None:
+    clock = FakeClock()
+    scheduler = py_proc_watch.TickScheduler(0.0, clock=clock, sleep=clock.sleep)
+    clock.now += 0.5
+    scheduler.wait()
+
+    assert clock.now == pytest.approx(1000.5)
+    assert scheduler.overruns == 0
+
+
+class FakeRuns:
+    # The first runs block until they are released, the output of a run is the sequence number the pipeline gave it.
+    def __init__(self, count: int) -> None:
+        self.started = [threading.Event() for _ in range(count)]
+        self.release = [threading.Event() for _ in range(count)]
+        self.pipeline: Optional[py_proc_watch.RunPipeline] = None
+
+    def run(self, on_start: "Callable[[subprocess.Popen[bytes]], None]") -> py_proc_watch.CommandResult:
+        proc = mockito.mock()
+        on_start(proc)
+        assert self.pipeline is not None
+        sequence = next(sequence for sequence, started in self.pipeline.processes.items() if started is proc)
+        if sequence < len(self.release):
+            self.started[sequence].set()
+            self.release[sequence].wait(10)
+        result = py_proc_watch.CommandResult()
+        result.add_line(f"{sequence}\n")
+        return result
+
+
+def test_run_pipeline_invalid_runs() -> None:
+    with pytest.raises(ValueError, match=r"Invalid number of runs in flight: 0"):
+        py_proc_watch.RunPipeline(FakeRuns(0).run, 1.0, 0)
+
+
+def test_run_pipeline_drops_stale_results() -> None:
+    runs = FakeRuns(3)
+    pipeline = py_proc_watch.RunPipeline(runs.run, 0.0, 2)
+    runs.pipeline = pipeline
+    runs.release[1].set()
+    _, _, result = pipeline.next_result()
+
+    assert result.stdout_lines == ["1\n"]
+    assert pipeline.dropped == 0
+
+    runs.release[0].set()
+    runs.release[2].set()
+    _, _, result = pipeline.next_result()
+
+    assert result.stdout_lines[0] in ("2\n", "3\n")
+    assert pipeline.dropped >= 1
+    assert pipeline.started in (3, 4)
+
+    pipeline.executor.shutdown()
+    pipeline.close()
+
+
+def test_run_pipeline_interval() -> None:
+    runs = FakeRuns(2)
+    for event in runs.release:
+        event.set()
+    with py_proc_watch.RunPipeline(runs.run, 0.2, 2) as pipeline:
+        runs.pipeline = pipeline
+        start_time = time.time()
+        first_start, _, result = pipeline.next_result()
+
+        assert result.stdout_lines == ["0\n"]
+
+        second_start, execution_time, result = pipeline.next_result()
+
+        assert result.stdout_lines == ["1\n"]
+        assert start_time <= first_start < second_start
+        assert second_start - first_start >= 0.15
+        assert 0.0 <= execution_time < 0.15
+        assert pipeline.dropped == 0
+
+
+def test_run_pipeline_close_kills_runs(expect: mockito.expect) -> None:
+    runs = FakeRuns(1)
+    pipeline = py_proc_watch.RunPipeline(runs.run, 1.0, 1)
+    runs.pipeline = pipeline
+    expect(py_proc_watch, times=1).kill_process_group(mockito.ANY).thenAnswer(lambda _proc: runs.release[0].set())
+    results: List[Tuple[float, float, py_proc_watch.CommandResult]] = []
+    waiter = threading.Thread(target=lambda: results.append(pipeline.next_result()))
+    waiter.start()
+    assert runs.started[0].wait(10)
+
+    pipeline.close()
+    waiter.join(10)
+
+    assert results[0][2].stdout_lines == ["0\n"]
+    assert not pipeline.processes
+
+
+def target_result(exit_status: int, *lines: str) -> py_proc_watch.CommandResult:
+    command_result = py_proc_watch.CommandResult()
+    for line in lines:
+        command_result.output_hash.update(line.encode())
+        command_result.add_raw_line(line.encode())
+    command_result.exit_status = exit_status
+    return command_result
+
+
+def test_group_results() -> None:
+    results = [target_result(0, "x\n"), target_result(2, "y\n", "z\n"), target_result(0, "x\n")]
+    results[1].truncated = True
+
+    combined = py_proc_watch.group_results(["a", "b", "c"], results, 10)
+    short = py_proc_watch.group_results(["a", "b", "c"], results, 3)
+
+    lines = ["a, c (exit status: 0):\n", "x\n", "b (exit status: 2, truncated):\n", "y\n", "z\n"]
+    assert combined.stdout_lines == lines
+    assert short.line_count == 3
+    assert short.output_hash.digest() == combined.output_hash.digest()
+    assert combined.exit_status == 2
+    assert combined.used_bytes == combined.total_read_bytes == 8
+    assert combined.truncated
+    assert not combined.timed_out
+
+
+def test_group_results_tracks_target_output() -> None:
+    tracker = py_proc_watch.FieldTracker([r"(\d+)", r"^z (\d+)", "missing"])
+    results = [target_result(1, "x\n"), target_result(0, "y 42\n", "z 3\n"), target_result(0, "y 7\n")]
+
+    # Exit statuses and digits in target names are in the headers, numbers come only from the targets' own lines.
+    combined = py_proc_watch.group_results(["a1", "b2", "c3"], results, 2, tracker)
+
+    assert combined.stdout_lines == ["a1 (exit status: 1):\n", "x\n"]
+    assert combined.tracked is not None
+    assert list(combined.tracked[:2]) == [42.0, 3.0]
+    assert math.isnan(combined.tracked[2])
+    assert py_proc_watch.group_results(["a"], results[:1], 10).tracked is None
+
+
+def test_group_results_timed_out() -> None:
+    results = [target_result(-9), target_result(-9)]
+    for result in results:
+        result.timed_out = True
+
+    combined = py_proc_watch.group_results(["a", "b"], results, 10)
+
+    assert combined.stdout_lines == ["a, b (timed out):\n"]
+    assert combined.exit_status == -9
+    assert combined.timed_out
+
+
+def test_fan_out_invalid_params() -> None:
+    with pytest.raises(ValueError, match=r"No targets to run the command for"):
+        py_proc_watch.FanOut("a-command {}", [], 1)
+    with pytest.raises(ValueError, match=r"Invalid number of parallel targets: 0"):
+        py_proc_watch.FanOut("a-command {}", ["a"], 0)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_fan_out_runs_targets_at_once(when: mockito.when) -> None:
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+
+    with py_proc_watch.FanOut("sleep 0.5; echo {}", ["a", "b c", "a"], 3) as fan_out:
+        start_time = time.monotonic()
+        result = fan_out.run(10)
+        elapsed = time.monotonic() - start_time
+
+    assert result.stdout_lines == ["a, a (exit status: 0):\n", "a\n", "b c (exit status: 0):\n", "b c\n"]
+    assert elapsed < 1.2
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_fan_out_close_kills_targets(when: mockito.when) -> None:
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+    fan_out = py_proc_watch.FanOut("sleep {}", ["30", "30"], 1)
+    errors: List[BaseException] = []
+
+    def run() -> None:
+        try:
+            fan_out.run(10)
+        except BaseException as error:
+            errors.append(error)
+
+    runner = threading.Thread(target=run)
+    runner.start()
+    deadline = time.monotonic() + 10
+    while not fan_out.processes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    fan_out.close()
+    runner.join(10)
+
+    assert not runner.is_alive()
+    assert isinstance(errors[0], concurrent.futures.CancelledError)
+    assert not fan_out.processes
+
+
+def test_watch_invalid_params() -> None:
+    with pytest.raises(ValueError, match=r"Invalid command: "):
+        py_proc_watch.watch("")
+
+    with pytest.raises(ValueError, match=r"Invalid interval value: -?[\d\.]+"):
+        py_proc_watch.watch("a-command", -0.1)
+    with pytest.raises(ValueError, match=r"Invalid interval value: -?[\d\.]+"):
+        py_proc_watch.watch("a-command", 24 * 60 * 60 + 1)
+    with pytest.raises(ValueError, match=r"Invalid number of unchanged runs: -1"):
+        py_proc_watch.watch("a-command", exit_on_unchanged=-1)
+
+
+def test_watch_persistent_shell_without_shell(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).getenv("SHELL").thenReturn(None)
+
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Persistent shell requires the SHELL environment"):
+        py_proc_watch.watch("a-command", persistent_shell=True)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_watch_persistent_shell(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+    when(os).get_terminal_size().thenReturn((50, 4))
+    expect(py_proc_watch, times=0).get_output(*mockito.ARGS)
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=1).write(written_output)
+
+    py_proc_watch.watch("echo from-coprocess", persistent_shell=True)
+
+    assert f"from-coprocess{colorama.ansi.clear_line(0)}\n" in written_output.value
+
+
+def test_watch_invalid_limits() -> None:
+    with pytest.raises(ValueError, match=r"Invalid maximum bytes value: -1"):
+        py_proc_watch.watch("a-command", max_bytes=-1)
+    with pytest.raises(ValueError, match=r"Invalid timeout value: -0.5"):
+        py_proc_watch.watch("a-command", timeout=-0.5)
+
+
+@pytest.mark.parametrize(
+    ("truncated", "timed_out", "expected_status"),
+    [(True, False, "(exit status: -9, truncated)"), (False, True, "(timed out)")],
+    ids=str,
+)
+def test_watch_limits(
+    when: mockito.when, expect: mockito.expect, truncated: bool, timed_out: bool, expected_status: str
+) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((80, 4))
+    command_result = py_proc_watch.CommandResult()
+    command_result.exit_status = -9
+    command_result.truncated = truncated
+    command_result.timed_out = timed_out
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 1024, 2.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=1).write(written_output)
+
+    py_proc_watch.watch("a-command", max_bytes=1024, timeout=2.0)
+
+    assert f"{colorama.Fore.LIGHTRED_EX}Every 1.0s: a-command {expected_status} " in written_output.value
+
+
+def test_watch_tty_check(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(False)
+
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"stdout is not a tty!"):
+        py_proc_watch.watch("a-command")
+
+
+def test_watch_screen_size_check(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((47, 3))
+
+    with pytest.raises(
+        py_proc_watch.PyProcWatchError, match=r"Terminal window too small: \(47x3\), need at least \(\d+x\d+\)"
+    ):
+        py_proc_watch.watch("a-command")
+
+
+def test_watch_normal_call(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    when(time).time().thenReturn(
+        0.0,
         0.1,  # Execution time
         0.0,
         0.2,  # Line processing time
-        0.0,
-        0.3,  # Output write time
     )
     command_result = py_proc_watch.CommandResult()
     command_result.exit_status = 0
@@ -253,8 +1468,10 @@ def test_watch_normal_call(when: mockito.when, expect: mockito.expect) -> None:
     command_result.add_line("2\n")
     command_result.add_line("3\n")
     command_result.total_read_bytes *= 2
-    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1).thenReturn(command_result)
-    expect(time, times=1).sleep(pytest.approx(1)).thenRaise(KeyboardInterrupt)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
     written_output = mockito.matchers.captor()
     expect(sys.stdout, times=1).write(written_output)
 
@@ -278,8 +1495,6 @@ def test_watch_normal_call_narrow_header(when: mockito.when, expect: mockito.exp
         0.1,  # Execution time
         0.0,
         0.2,  # Line processing time
-        0.0,
-        0.3,  # Output write time
     )
     command_result = py_proc_watch.CommandResult()
     command_result.exit_status = 1234567
@@ -287,8 +1502,10 @@ def test_watch_normal_call_narrow_header(when: mockito.when, expect: mockito.exp
     command_result.add_line("2\n")
     command_result.add_line("3\n")
     command_result.total_read_bytes *= 2
-    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1).thenReturn(command_result)
-    expect(time, times=1).sleep(pytest.approx(1)).thenRaise(KeyboardInterrupt)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
     written_output = mockito.matchers.captor()
     expect(sys.stdout, times=1).write(written_output)
 
@@ -312,15 +1529,15 @@ def test_watch_normal_call_one_line_output(when: mockito.when, expect: mockito.e
         0.1,  # Execution time
         0.0,
         0.2,  # Line processing time
-        0.0,
-        0.3,  # Output write time
     )
     command_result = py_proc_watch.CommandResult()
     command_result.exit_status = 123
     command_result.add_line("1\n")
     command_result.total_read_bytes *= 2
-    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1).thenReturn(command_result)
-    expect(time, times=1).sleep(pytest.approx(1)).thenRaise(KeyboardInterrupt)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
     written_output = mockito.matchers.captor()
     expect(sys.stdout, times=1).write(written_output)
 
@@ -344,8 +1561,6 @@ def test_watch_precise(when: mockito.when, expect: mockito.expect) -> None:
         0.1,  # Execution time
         0.0,
         0.2,  # Line processing time
-        0.0,
-        0.3,  # Output write time
     )
     command_result = py_proc_watch.CommandResult()
     command_result.exit_status = 0
@@ -353,8 +1568,11 @@ def test_watch_precise(when: mockito.when, expect: mockito.expect) -> None:
     command_result.add_line("2\n")
     command_result.add_line("3\n")
     command_result.total_read_bytes *= 2
-    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1).thenReturn(command_result)
-    expect(time, times=1).sleep(pytest.approx(1.4)).thenRaise(KeyboardInterrupt)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    when(time).monotonic().thenReturn(0.0, 0.6)
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1.4, abs=0.01)).thenRaise(KeyboardInterrupt)
     written_output = mockito.matchers.captor()
     expect(sys.stdout, times=1).write(written_output)
 
@@ -378,8 +1596,6 @@ def test_watch_precise_long_command(when: mockito.when, expect: mockito.expect)
         2.1,  # Execution time
         0.0,
         0.2,  # Line processing time
-        0.0,
-        0.3,  # Output write time
     )
     command_result = py_proc_watch.CommandResult()
     command_result.exit_status = 123
@@ -387,8 +1603,11 @@ def test_watch_precise_long_command(when: mockito.when, expect: mockito.expect)
     command_result.add_line("2\n")
     command_result.add_line("3\n")
     command_result.total_read_bytes *= 2
-    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1).thenReturn(command_result)
-    expect(time, times=1).sleep(pytest.approx(0)).thenRaise(KeyboardInterrupt)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    when(time).monotonic().thenReturn(0.0, 2.6)
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1.4, abs=0.01)).thenRaise(KeyboardInterrupt)
     written_output = mockito.matchers.captor()
     expect(sys.stdout, times=1).write(written_output)
 
@@ -412,8 +1631,6 @@ def test_watch_debug(when: mockito.when, expect: mockito.expect) -> None:
         0.1,  # Execution time
         0.0,
         0.2,  # Line processing time
-        0.0,
-        0.3,  # Output write time
     )
     command_result = py_proc_watch.CommandResult()
     command_result.exit_status = 123
@@ -421,8 +1638,10 @@ def test_watch_debug(when: mockito.when, expect: mockito.expect) -> None:
     command_result.add_line("2\n")
     command_result.add_line("3\n")
     command_result.total_read_bytes *= 2
-    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1).thenReturn(command_result)
-    expect(time, times=1).sleep(pytest.approx(1)).thenRaise(KeyboardInterrupt)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
     written_output = mockito.matchers.captor()
     expect(sys.stdout, times=1).write(written_output)
 
@@ -436,7 +1655,1214 @@ def test_watch_debug(when: mockito.when, expect: mockito.expect) -> None:
         in written_output.value
     )
     assert written_output.value.endswith("\033[4;99H")
-    assert "<<w=99,h=4 B:12->6 0.100s+0.200s>>" in written_output.value
+    assert "<<w=99,h=4 B:12->6 O:0 W:0.000s 0.100s+0.200s>>" in written_output.value
+
+
+def test_watch_debug_precise(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((120, 4))
+    when(time).time().thenReturn(
+        0.0,
+        0.1,  # Execution time
+        0.0,
+        0.2,  # Line processing time
+    )
+    when(time).monotonic().thenReturn(0.0, 0.6)
+    command_result = py_proc_watch.CommandResult()
+    command_result.exit_status = 0
+    command_result.add_line("1\n")
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(0.4, abs=0.01)).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=1).write(written_output)
+
+    py_proc_watch.watch("a-command", precise=True, show_debug=True)
+
+    assert "<<w=120,h=4 B:2->2 O:0 W:0.000s 0.100s+0.200s J:+0.0ms X:0>>" in written_output.value
+
+
+def test_watch_metrics_file(when: mockito.when, expect: mockito.expect, tmp_path: pathlib.Path) -> None:
+    metrics_file = tmp_path / "metrics.jsonl"
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((160, 4))
+    when(time).time().thenReturn(
+        10.0,
+        10.1,  # Execution time
+        10.1,
+        10.3,  # Line processing time
+        10.3,
+        10.4,  # Render time
+        10.4,
+        10.6,  # Write time
+        10.6,
+        10.65,  # Record time
+        10.65,
+        11.75,  # Sleep time
+    )
+    command_result = py_proc_watch.CommandResult()
+    command_result.exit_status = 0
+    command_result.add_line("1\n")
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result
+    )
+    expect(py_proc_watch.ResizeMonitor, times=2).wait(pytest.approx(1, abs=0.01)).thenReturn(None).thenRaise(
+        KeyboardInterrupt
+    )
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=2).write(written_output)
+
+    py_proc_watch.watch("a-command", show_debug=True, metrics_file=str(metrics_file))
+
+    # Every run is written before the wait after it, the wait is reported with the next run.
+    records = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[0] == {
+        "time": 10.0,
+        "exec_time": pytest.approx(0.1),
+        "lines_time": pytest.approx(0.2),
+        "render_time": pytest.approx(0.1),
+        "write_time": pytest.approx(0.2),
+        "record_time": pytest.approx(0.05),
+        "sleep_time": None,
+        "sleep_overshoot": None,
+        "total_read_bytes": 2,
+        "used_bytes": 2,
+        "lines": 1,
+        "output_bytes": records[0]["output_bytes"],
+        "exit_status": 0,
+        "truncated": False,
+        "timed_out": False,
+        "unchanged": False,
+    }
+    assert records[0]["output_bytes"] > 0
+    assert records[1]["time"] == 11.75
+    assert records[1]["sleep_time"] == pytest.approx(1.1)
+    assert records[1]["sleep_overshoot"] == pytest.approx(0.1)
+    assert records[1]["unchanged"]
+    assert "W:0.200s" in written_output.all_values[1]
+    assert " p50/95/99 e:110.2/110.2/110.2 l:220.4/220.4/220.4 r:110.2/110.2/110.2 w:220.4/220.4/220.4ms>>" in (
+        written_output.all_values[1]
+    )
+
+
+def test_watch_metrics_file_last_run(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    # The run ending the watch is written too.
+    metrics_file = tmp_path / "metrics.jsonl"
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((160, 4))
+    when(py_proc_watch).get_output(*mockito.ARGS, **mockito.KWARGS).thenReturn(command_result_with_lines("1\n"))
+    when(sys.stdout).write(mockito.ANY)
+
+    py_proc_watch.watch("a-command", 0.0, exit_on_unchanged=2, metrics_file=str(metrics_file))
+
+    records = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+    assert [record["unchanged"] for record in records] == [False, True, True]
+    assert [record["sleep_time"] is None for record in records] == [True, False, False]
+
+
+def command_result_with_lines(*lines: str) -> py_proc_watch.CommandResult:
+    command_result = py_proc_watch.CommandResult()
+    command_result.exit_status = 0
+    for line in lines:
+        command_result.add_line(line)
+    return command_result
+
+
+def test_watch_unchanged_output(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("same\n"), command_result_with_lines("same\n")
+    )
+    expect(py_proc_watch, times=1).ansi_aware_line_trim("same\n", 50).thenReturn("same\n")
+    expect(py_proc_watch.ResizeMonitor, times=2).wait(pytest.approx(1, abs=0.01)).thenReturn(None).thenRaise(
+        KeyboardInterrupt
+    )
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=2).write(written_output)
+
+    py_proc_watch.watch("a-command")
+
+    assert "same" in written_output.all_values[0]
+    assert "same" not in written_output.all_values[1]
+    assert written_output.all_values[1].endswith("\033[4;50H")
+
+
+@pytest.mark.parametrize(
+    ("options", "outputs"),
+    [
+        ({"exit_on_change": True}, ["a\n", "a\n", "b\n"]),
+        ({"exit_on_unchanged": 2}, ["a\n", "b\n", "b\n", "c\n", "c\n", "c\n"]),
+        ({"exit_on_change": True, "exit_on_unchanged": 1}, ["a\n", "a\n"]),
+    ],
+    ids=str,
+)
+def test_watch_exit_on_output(
+    when: mockito.when, expect: mockito.expect, options: Dict[str, Any], outputs: List[str]
+) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        *[command_result_with_lines(output) for output in outputs]
+    )
+    expect(py_proc_watch.ResizeMonitor, times=len(outputs) - 1).wait(pytest.approx(1, abs=0.01))
+    expect(sys.stdout, times=len(outputs)).write(mockito.ANY)
+
+    py_proc_watch.watch("a-command", **options)
+
+
+def test_watch_differences(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("value: 1\n"),
+        command_result_with_lines("value: 2\n"),
+        command_result_with_lines("value: 2\n"),
+        command_result_with_lines("value: 2\n"),
+    )
+    expect(py_proc_watch.ResizeMonitor, times=4).wait(pytest.approx(1, abs=0.01)).thenReturn(None).thenReturn(
+        None
+    ).thenReturn(None).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=4).write(written_output)
+
+    py_proc_watch.watch("a-command", differences=True)
+
+    assert f"value: {ON}2{OFF}{colorama.ansi.clear_line(0)}" in written_output.all_values[1]
+    # Highlight is removed when the output stops changing, after that nothing is redrawn.
+    assert f"value: 2{colorama.ansi.clear_line(0)}" in written_output.all_values[2]
+    assert "value" not in written_output.all_values[3]
+
+
+def test_latency_histogram() -> None:
+    histogram = py_proc_watch.LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+
+    for milliseconds in range(1, 101):
+        histogram.add(milliseconds / 1000)
+    histogram.add(0.0)
+    histogram.add(1e9)
+
+    assert histogram.count == 102
+    assert 0.050 <= histogram.percentile(50) < 0.050 * 2**0.25
+    assert 0.095 <= histogram.percentile(95) < 0.095 * 2**0.25
+    assert histogram.percentile(0.5) == 1e-6
+    assert histogram.percentile(100) == 2**39.75 / 1e6
+
+
+RECORDED_FRAMES = [
+    (100.0, 0, ["a\n", "b\n", "c\n"]),
+    (101.0, 0, ["a\n", "B\n", "c\n"]),
+    (102.0, 1, ["a\n", "B\n", "c\n", "d\n", "e\n"]),
+    (103.0, 1, ["x\n"]),
+    (104.0, 0, []),
+    (105.0, 0, ["\033[31mred\033[0m\n", "\xff\n"]),
+    (106.0, 2, ["y\n", "z\n"]),
+]
+
+
+def record_frames(path: pathlib.Path, frames: List[Tuple[float, int, List[str]]], keyframe_interval: int) -> None:
+    with py_proc_watch.FrameRecorder(str(path), keyframe_interval) as recorder:
+        for timestamp, exit_status, lines in frames:
+            recorder.record(timestamp, exit_status, lines)
+
+
+def test_frame_recorder(tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    record_frames(record_file, RECORDED_FRAMES, 3)
+    # A second recording session appended to the same file starts with a keyframe.
+    record_frames(record_file, [(200.0, 0, ["a\n"]), (201.0, 0, ["b\n"])], 3)
+    frames = [py_proc_watch.RecordedFrame(*frame) for frame in RECORDED_FRAMES] + [
+        py_proc_watch.RecordedFrame(200.0, 0, ["a\n"]),
+        py_proc_watch.RecordedFrame(201.0, 0, ["b\n"]),
+    ]
+
+    assert (tmp_path / "watch.rec.idx").stat().st_size == 4 * py_proc_watch.RECORD_INDEX_ENTRY.size
+    with py_proc_watch.RecordingReader(str(record_file)) as reader:
+        assert reader.locate(99.0) == (None, frames[0])
+        for index, frame in enumerate(frames):
+            following = frames[index + 1] if index + 1 < len(frames) else None
+            assert reader.locate(frame.timestamp) == (frame, following)
+            assert reader.locate(frame.timestamp + 0.5) == (frame, following)
+        assert reader.locate(math.inf) == (frames[-1], None)
+
+    with pytest.raises(ValueError, match=r"Invalid keyframe interval: 0"):
+        py_proc_watch.FrameRecorder(str(record_file), 0)
+
+
+class CountingReads:
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+        self.reads = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.file, name)
+
+    def read(self, size: int) -> bytes:
+        self.reads += 1
+        return self.file.read(size)
+
+
+def test_recording_reader_seek_is_logarithmic(tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    record_frames(record_file, [(float(timestamp), 0, [f"{timestamp}\n"]) for timestamp in range(1024)], 1)
+
+    with py_proc_watch.RecordingReader(str(record_file)) as reader:
+        index = reader.index = CountingReads(reader.index)  # type: ignore[assignment]
+        frame, _ = reader.locate(700.5)
+
+    assert frame == py_proc_watch.RecordedFrame(700.0, 0, ["700\n"])
+    assert index.reads <= math.log2(1024) + 2
+
+
+def test_recording_reader_truncated(tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    # Partially written last frame, like after a crash while recording.
+    record_frames(record_file, RECORDED_FRAMES[:-1], 3)
+    with record_file.open("r+b") as recording:
+        recording.truncate(record_file.stat().st_size - 1)
+
+    with py_proc_watch.RecordingReader(str(record_file)) as reader:
+        assert reader.locate(math.inf)[0] == py_proc_watch.RecordedFrame(*RECORDED_FRAMES[-3])
+
+    with record_file.open("ab") as recording:
+        recording.truncate(py_proc_watch.RECORD_HEADER.size - 1)
+    with py_proc_watch.RecordingReader(str(record_file)) as reader:
+        assert reader.locate(math.inf) == (None, None)
+
+
+def test_recording_reader_errors(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Failed to open recording .*missing.rec"):
+        py_proc_watch.RecordingReader(str(tmp_path / "missing.rec"))
+
+    (tmp_path / "empty.rec").touch()
+    (tmp_path / "empty.rec.idx").touch()
+    with py_proc_watch.RecordingReader(str(tmp_path / "empty.rec")) as reader, pytest.raises(
+        py_proc_watch.PyProcWatchError, match=r"Recording is empty"
+    ):
+        reader.locate(0.0)
+
+
+def test_watch_record(when: mockito.when, expect: mockito.expect, tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    when(time).time().thenReturn(10.0)
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("1\n")
+    )
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1, abs=0.01)).thenRaise(KeyboardInterrupt)
+    expect(sys.stdout, times=1).write(mockito.ANY)
+
+    py_proc_watch.watch("a-command", record_file=str(record_file))
+
+    with py_proc_watch.RecordingReader(str(record_file)) as reader:
+        assert reader.locate(math.inf) == (py_proc_watch.RecordedFrame(10.0, 0, ["1\n"]), None)
+
+
+def test_scroll_view() -> None:
+    lines = py_proc_watch.LineBuffer()
+    for number in range(1, 11):
+        lines.append(b"%d\n" % number)
+    view = py_proc_watch.ScrollView()
+
+    assert view.window(lines, 3) == ["1\n", "2\n", "3\n"]
+    assert view.describe(len(lines), 3) == " [1-3/10]"
+    assert not view.scroll("k", len(lines), 3)
+    assert not view.scroll("x", len(lines), 3)
+    assert view.scroll("j", len(lines), 3)
+    assert view.scroll("page_down", len(lines), 3)
+    assert view.window(lines, 3) == ["5\n", "6\n", "7\n"]
+    assert view.scroll(" ", len(lines), 3)
+    assert view.at_end
+    assert not view.scroll("down", len(lines), 3)
+    assert view.scroll("up", len(lines), 3)
+    assert not view.at_end
+    assert view.scroll("end", len(lines), 3)
+    assert view.window(lines, 3) == ["8\n", "9\n", "10\n"]
+
+    # At the end the view follows the end of the output, elsewhere it keeps its position unless the output got shorter.
+    lines.append(b"11\n")
+    assert view.window(lines, 3) == ["9\n", "10\n", "11\n"]
+    assert view.scroll("page_up", len(lines), 3)
+    lines.append(b"12\n")
+    assert view.window(lines, 3) == ["6\n", "7\n", "8\n"]
+    assert view.scroll("g", len(lines), 3)
+    assert view.position == 0
+    assert view.scroll("G", len(lines), 3)
+    assert view.scroll("home", len(lines), 3)
+    assert view.window(py_proc_watch.LineBuffer(), 3) == []
+    assert view.describe(0, 0) == " [0-0/0]"
+
+
+def test_watch_scrollback(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(sys.stdin).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((80, 4))
+    numbers = [f"{number}\n" for number in range(1, 13)]
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 100, 0, 0.0, True, tracker=None).thenReturn(
+        command_result_with_lines(*numbers[:10]),
+        command_result_with_lines(*numbers[:10]),
+        command_result_with_lines(*numbers),
+    )
+    when(py_proc_watch).KeyReader().thenReturn(FakeKeyReader(["j", "x", "page_down", None, "G", None]))
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=6).write(written_output)
+
+    py_proc_watch.watch("a-command", 0.05, differences=True, scrollback=100)
+
+    def shown(frame: str) -> List[str]:
+        return re.findall(r"(\d+)" + re.escape(colorama.ansi.clear_line(0)), frame.replace(ON, "").replace(OFF, ""))
+
+    frames = written_output.all_values
+    assert shown(frames[0]) == ["1", "2", "3"]
+    assert "(exit status: 0) [1-3/10]" in frames[0]
+    # Key presses redraw only the changed lines of the window, the position is kept for the next runs.
+    assert shown(frames[1]) == ["2", "3", "4"]
+    assert "2-4/10]" in frames[1]
+    assert shown(frames[2]) == ["5", "6", "7"]
+    assert shown(frames[3]) == []
+    assert shown(frames[4]) == ["8", "9", "10"]
+    assert shown(frames[5]) == ["10", "11", "12"]
+    assert "10-12/12]" in frames[5]
+    assert f"1{ON}2{OFF}" in frames[5]
+
+
+def test_watch_scrollback_checks(when: mockito.when) -> None:
+    with pytest.raises(ValueError, match=r"Invalid number of scrollback lines: -1"):
+        py_proc_watch.watch("a-command", scrollback=-1)
+    with pytest.raises(ValueError, match=r"Invalid number of scrollback lines: 1048577"):
+        py_proc_watch.watch("a-command", scrollback=1024 * 1024 + 1)
+
+    when(sys.stdout).isatty().thenReturn(True)
+    when(sys.stdin).isatty().thenReturn(False)
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"stdin is not a tty, scrollback needs keyboard input"):
+        py_proc_watch.watch("a-command", scrollback=100)
+
+
+@pytest.mark.parametrize(
+    ("previous_lines", "lines", "expected_added", "expected_removed"),
+    [
+        ([], [b"a\n", b"b\n"], [b"a\n", b"b\n"], []),
+        ([b"a\n", b"b\n"], [b"b\n", b"a\n"], [], []),
+        ([b"a\n", b"b\n", b"a\n"], [b"a\n", b"c\n"], [b"c\n"], [b"b\n", b"a\n"]),
+        ([b"a", b"b", b"c", b"d"], [b"a", b"x", b"c", b"d", b"b"], [b"x"], []),
+        ([b"a", b"b", b"c"], [b"a", b"x", b"c"], [b"x"], [b"b"]),
+        ([b"x\n"], [], [], [b"x\n"]),
+    ],
+    ids=repr,
+)
+def test_line_changes(
+    previous_lines: List[bytes], lines: List[bytes], expected_added: List[bytes], expected_removed: List[bytes]
+) -> None:
+    assert py_proc_watch.line_changes(previous_lines, lines) == (expected_added, expected_removed)
+
+
+@pytest.mark.parametrize(
+    ("output_format", "deltas", "expected_output"),
+    [
+        (
+            "jsonl",
+            False,
+            '{"time": 10.0, "command": "a-command", "exit_status": 0, "truncated": false, "timed_out": false, '
+            '"lines": ["a", "b"]}\n'
+            '{"time": 11.0, "command": "a-command", "exit_status": 0, "truncated": false, "timed_out": false, '
+            '"lines": ["a", "b"]}\n'
+            '{"time": 12.0, "command": "a-command", "exit_status": 1, "truncated": false, "timed_out": false, '
+            '"lines": ["b", "\\\\xff"]}\n',
+        ),
+        (
+            "jsonl",
+            True,
+            '{"time": 10.0, "command": "a-command", "exit_status": 0, "truncated": false, "timed_out": false, '
+            '"added": ["a", "b"], "removed": []}\n'
+            '{"time": 11.0, "command": "a-command", "exit_status": 0, "truncated": false, "timed_out": false, '
+            '"added": [], "removed": []}\n'
+            '{"time": 12.0, "command": "a-command", "exit_status": 1, "truncated": false, "timed_out": false, '
+            '"added": ["\\\\xff"], "removed": ["a"]}\n',
+        ),
+        (
+            "text",
+            False,
+            "--- T10 a-command (exit status: 0)\na\nb\n"
+            "--- T11 a-command (exit status: 0)\na\nb\n"
+            "--- T12 a-command (exit status: 1)\nb\n\udcff\n",
+        ),
+        (
+            "text",
+            True,
+            "--- T10 a-command (exit status: 0)\n+a\n+b\n"
+            "--- T11 a-command (exit status: 0)\n"
+            "--- T12 a-command (exit status: 1)\n-a\n+\udcff\n",
+        ),
+    ],
+    ids=str,
+)
+def test_headless_writer(output_format: str, deltas: bool, expected_output: str) -> None:
+    stream = io.BytesIO()
+    writer = py_proc_watch.HeadlessWriter(stream, "a-command", output_format, deltas)
+    writer.write(10.0, command_result_with_lines("a\n", "b"))
+    writer.write(11.0, command_result_with_lines("a\n", "b"))
+    command_result = py_proc_watch.CommandResult()
+    for line in (b"b\n", b"\xff"):
+        command_result.output_hash.update(line)
+        command_result.add_raw_line(line)
+    command_result.exit_status = 1
+    writer.write(12.0, command_result)
+
+    output = stream.getvalue().decode("UTF-8", "surrogateescape")
+    for timestamp in (10.0, 11.0, 12.0):
+        moment = datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds")
+        output = output.replace(moment, f"T{timestamp:.0f}")
+    assert output == expected_output
+
+    with pytest.raises(ValueError, match=r"Invalid headless output format: html"):
+        py_proc_watch.HeadlessWriter(stream, "a-command", "html")
+
+
+def test_watch_headless(when: mockito.when, expect: mockito.expect, capsysbinary: pytest.CaptureFixture[bytes]) -> None:
+    expect(sys.stdout, times=0).isatty()
+    when(time).time().thenReturn(10.0)
+    when(py_proc_watch).get_output(
+        mockito.ANY, mockito.ANY, py_proc_watch.MAX_SCROLLBACK_LINES, 0, 0.0, True, tracker=None
+    ).thenReturn(command_result_with_lines("1\n"), command_result_with_lines("2\n"))
+    expect(time, times=2).sleep(pytest.approx(1)).thenReturn(None).thenRaise(KeyboardInterrupt)
+
+    py_proc_watch.watch("a-command", headless="jsonl", headless_deltas=True)
+
+    assert [json.loads(line) for line in capsysbinary.readouterr().out.splitlines()] == [
+        {
+            "time": 10.0,
+            "command": "a-command",
+            "exit_status": 0,
+            "truncated": False,
+            "timed_out": False,
+            "added": [number],
+            "removed": removed,
+        }
+        for number, removed in (("1", []), ("2", ["1"]))
+    ]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_watch_headless_persistent_shell(
+    when: mockito.when, expect: mockito.expect, capsysbinary: pytest.CaptureFixture[bytes]
+) -> None:
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+    expect(py_proc_watch, times=0).get_output(*mockito.ARGS)
+
+    py_proc_watch.watch(
+        "seq 1 5", 0.0, precise=True, persistent_shell=True, exit_on_unchanged=1, scrollback=3, headless="text"
+    )
+
+    output = capsysbinary.readouterr().out
+    assert re.fullmatch(rb"(--- [-:.T\d]+ seq 1 5 \(exit status: 0\)\n1\n2\n3\n){2}", output)
+
+
+def test_watch_headless_broken_pipe(when: mockito.when, expect: mockito.expect) -> None:
+    when(py_proc_watch).get_output(*mockito.ARGS, **mockito.KWARGS).thenReturn(command_result_with_lines("1\n"))
+    when(py_proc_watch.HeadlessWriter).write(*mockito.ARGS).thenRaise(BrokenPipeError)
+    when(sys.stdout).fileno().thenReturn(1)
+    when(os).open(os.devnull, os.O_WRONLY).thenReturn(99)
+    expect(os, times=1).dup2(99, 1)
+
+    py_proc_watch.watch("a-command", headless="text")
+
+
+def resize_terminal(when: mockito.when, size: Tuple[int, int]) -> None:
+    when(os).get_terminal_size().thenReturn(size)
+    os.kill(os.getpid(), signal.SIGWINCH)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGWINCH"), reason="requires SIGWINCH")
+def test_watch_resize_redraws_last_output(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    expect(py_proc_watch, times=1).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("1\n", "2\n")
+    )
+    expect(py_proc_watch, times=1).get_output(mockito.ANY, mockito.ANY, 6 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("1\n", "2\n")
+    )
+
+    def resize_during_interval(timeout: float) -> None:
+        # The interval passes while the terminal is resized, the next run starts after the redraw.
+        resize_terminal(when, (60, 6))
+        time.sleep(timeout)
+
+    expect(py_proc_watch.ResizeMonitor, times=2).wait(mockito.ANY).thenAnswer(resize_during_interval).thenRaise(
+        KeyboardInterrupt
+    )
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=3).write(written_output)
+
+    py_proc_watch.watch("a-command", 0.1)
+
+    redraw = written_output.all_values[1]
+    assert redraw.startswith(f"{colorama.Cursor.POS(1, 1)}{colorama.Fore.LIGHTBLACK_EX}Every 0.1s: a-command")
+    assert f"1{colorama.ansi.clear_line(0)}\n2{colorama.ansi.clear_line(0)}\n" in redraw
+    assert redraw.count(py_proc_watch.PADDING_LINE) == 2
+    assert redraw.endswith("\033[6;60H")
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGWINCH"), reason="requires SIGWINCH")
+def test_watch_resize_reruns_when_taller(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((50, 4))
+    expect(py_proc_watch, times=1).get_output(mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("1\n", "2\n", "3\n")
+    )
+    expect(py_proc_watch, times=1).get_output(mockito.ANY, mockito.ANY, 6 - 1, 0, 0.0, False, tracker=None).thenReturn(
+        command_result_with_lines("1\n", "2\n", "3\n", "4\n", "5\n")
+    )
+    expect(py_proc_watch.ResizeMonitor, times=2).wait(mockito.ANY).thenAnswer(
+        lambda _timeout: resize_terminal(when, (50, 6))
+    ).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=2).write(written_output)
+
+    py_proc_watch.watch("a-command")
+
+    assert f"5{colorama.ansi.clear_line(0)}" in written_output.all_values[1]
+    assert written_output.all_values[1].endswith("\033[6;50H")
+
+
+def test_watch_pipeline(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((99, 4))
+    first_result = py_proc_watch.CommandResult()
+    first_result.add_line("first\n")
+    second_result = py_proc_watch.CommandResult()
+    second_result.add_line("second\n")
+    when(py_proc_watch).get_output(
+        mockito.ANY, mockito.ANY, 4 - 1, 0, 0.0, False, on_start=mockito.ANY, tracker=None
+    ).thenReturn(first_result, second_result)
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+
+    py_proc_watch.watch("a-command", interval=0.0, show_debug=True, exit_on_unchanged=2, pipeline_runs=2)
+
+    assert any(f"second{colorama.ansi.clear_line(0)}" in frame for frame in written_output.all_values)
+    assert re.search(r" F:[0-2] D:\d+>>", written_output.all_values[0])
+
+
+def test_watch_pipeline_checks() -> None:
+    with pytest.raises(ValueError, match=r"Invalid number of pipelined runs: 65"):
+        py_proc_watch.watch("a-command", pipeline_runs=65)
+    with pytest.raises(ValueError, match=r"Pipelined runs do not support precise timing, persistent shell, scrollback"):
+        py_proc_watch.watch("a-command", scrollback=100, pipeline_runs=2)
+
+
+def test_watch_targets(when: mockito.when, expect: mockito.expect) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((99, 6))
+    expect(py_proc_watch, times=2).get_output(
+        mockito.ANY, mockito.ANY, 6 - 1, 0, 2.0, False, on_start=mockito.ANY
+    ).thenReturn(command_result_with_lines("same\n"))
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1.0, abs=0.01)).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=1).write(written_output)
+
+    py_proc_watch.watch("a-command {}", timeout=2.0, targets=["a", "b"], parallel_targets=2)
+
+    assert f"a, b (exit status: 0):{colorama.ansi.clear_line(0)}\nsame{colorama.ansi.clear_line(0)}" in (
+        written_output.value
+    )
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_watch_headless_targets(when: mockito.when, capsysbinary: pytest.CaptureFixture[bytes]) -> None:
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+
+    py_proc_watch.watch("echo {}", 0.0, exit_on_unchanged=1, headless="text", targets=["a", "b", "a"])
+
+    output = capsysbinary.readouterr().out
+    expected = rb"--- [-:.T\d]+ echo \{\} \(exit status: 0\)\na, a \(exit status: 0\):\na\nb \(exit status: 0\):\nb\n"
+    assert re.fullmatch(rb"(" + expected + rb"){2}", output)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires a POSIX shell")
+def test_watch_headless_targets_track(when: mockito.when, capsysbinary: pytest.CaptureFixture[bytes]) -> None:
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+
+    py_proc_watch.watch(
+        "echo {} 42", 0.0, exit_on_unchanged=1, headless="jsonl", targets=["a", "b", "c"], track=[r"(\d+)"]
+    )
+
+    records = [json.loads(line) for line in capsysbinary.readouterr().out.splitlines()]
+    assert [record["tracked"] for record in records] == [[42.0], [42.0]]
+
+
+def test_watch_targets_checks() -> None:
+    with pytest.raises(ValueError, match=r"Invalid number of parallel targets: 0"):
+        py_proc_watch.watch("a-command {}", targets=["a"], parallel_targets=0)
+    with pytest.raises(ValueError, match=r"Command must contain \{\} to be run for each target: a-command"):
+        py_proc_watch.watch("a-command", targets=["a"])
+    with pytest.raises(ValueError, match=r"Targets do not support persistent shell and pipelined runs"):
+        py_proc_watch.watch("a-command {}", targets=["a"], pipeline_runs=2)
+
+
+def test_watch_file(when: mockito.when, expect: mockito.expect, tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "some.log"
+    path.write_bytes(b"1\n2\n3\n4\n")
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((99, 4))
+    expect(py_proc_watch, times=0).get_output(*mockito.ARGS)
+    expect(py_proc_watch.ResizeMonitor, times=1).wait(pytest.approx(1.0, abs=0.01)).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    expect(sys.stdout, times=1).write(written_output)
+
+    py_proc_watch.watch("", file_path=str(path), file_tail=True)
+
+    assert f"Every 1.0s: {path} (exit status: 0)" in written_output.value
+    assert f"2{colorama.ansi.clear_line(0)}\n3{colorama.ansi.clear_line(0)}\n4" in written_output.value
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_watch_file_wakes_up_on_change(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "some.log"
+    path.write_bytes(b"before\n")
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((99, 4))
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+    writer = threading.Timer(0.2, lambda: path.write_bytes(b"after\n"))
+    writer.start()
+    start_time = time.monotonic()
+
+    py_proc_watch.watch("", 60.0, exit_on_change=True, file_path=str(path))
+
+    assert time.monotonic() - start_time < 30.0
+    assert f"after{colorama.ansi.clear_line(0)}" in written_output.value
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_watch_file_ignores_other_files(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    # The parent directory is watched, writes to other files in it do not end the wait.
+    path = tmp_path / "some.log"
+    path.write_bytes(b"same\n")
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((99, 4))
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+    stop = threading.Event()
+
+    def write_other_files() -> None:
+        for number in itertools.count():
+            (tmp_path / f"other-{number % 3}.log").write_bytes(b"other\n")
+            if stop.wait(0.02):
+                return
+
+    writer = threading.Thread(target=write_other_files)
+    writer.start()
+    start_time = time.monotonic()
+    try:
+        py_proc_watch.watch("", 0.5, exit_on_unchanged=1, file_path=str(path))
+    finally:
+        stop.set()
+        writer.join()
+
+    assert time.monotonic() - start_time >= 0.45
+    assert len(written_output.all_values) == 2
+
+
+def test_watch_headless_file(capsysbinary: pytest.CaptureFixture[bytes], tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "some.log"
+    path.write_bytes(b"1\n2\n")
+
+    py_proc_watch.watch("", 0.0, exit_on_unchanged=1, headless="text", file_path=str(path))
+
+    output = capsysbinary.readouterr().out
+    expected = rf"--- [-:.T\d]+ {re.escape(str(path))} \(exit status: 0\)\n1\n2\n".encode()
+    assert re.fullmatch(rb"(" + expected + rb"){2}", output)
+
+
+def test_watch_headless_track(capsysbinary: pytest.CaptureFixture[bytes], tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "queue.txt"
+    path.write_bytes(b"depth 7\n")
+
+    py_proc_watch.watch(
+        "", 0.0, exit_on_unchanged=1, headless="jsonl", file_path=str(path), track=[r"depth (\d+)", "missing"]
+    )
+
+    records = [json.loads(line) for line in capsysbinary.readouterr().out.splitlines()]
+    assert [record["tracked"] for record in records] == [[7.0, None], [7.0, None]]
+
+
+def test_watch_track(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((80, 5))
+
+    def run(*_args: object, tracker: Optional[py_proc_watch.FieldTracker] = None) -> py_proc_watch.CommandResult:
+        command_result = py_proc_watch.CommandResult(tracker=tracker)
+        command_result.add_raw_line(next(outputs))
+        command_result.exit_status = 0
+        return command_result
+
+    outputs = iter([b"depth 5\n", b"depth 7\n"])
+    # Only the rows under the status line and the row of tracked numbers are used for the output.
+    when(py_proc_watch).get_output(mockito.ANY, mockito.ANY, 5 - 2, 0, 0.0, False, tracker=mockito.ANY).thenAnswer(run)
+    when(py_proc_watch.ResizeMonitor).wait(mockito.ANY).thenReturn(None).thenRaise(KeyboardInterrupt)
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+
+    py_proc_watch.watch("a-command", track=[r"depth (?P<depth>\d+)"])
+
+    assert f"depth ▁ 5 min 5 max 5 +0/s{colorama.ansi.clear_line(0)}\ndepth 5" in written_output.all_values[0]
+    assert "depth ▁█ 7 min 5 max 7 " in written_output.value
+
+
+def test_watch_file_checks() -> None:
+    with pytest.raises(ValueError, match=r"Tail is only shown for a file source"):
+        py_proc_watch.watch("a-command", file_tail=True)
+    with pytest.raises(ValueError, match=r"File source does not support commands, persistent shell, pipelined"):
+        py_proc_watch.watch("a-command", file_path="some.log")
+    with pytest.raises(ValueError, match=r"Invalid command: "):
+        py_proc_watch.watch("", file_tail=True)
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_watch_on_change(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "watched.txt"
+    path.write_bytes(b"before\n")
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((250, 4))
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+    writer = threading.Timer(0.2, lambda: path.write_bytes(b"after\n"))
+    writer.start()
+
+    py_proc_watch.watch("", exit_on_change=True, file_path=str(path), change_paths=[str(path)], interval=0.0)
+
+    assert f"On change: {path} (exit status: 0)" in written_output.all_values[0]
+    assert f"after{colorama.ansi.clear_line(0)}" in written_output.value
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_watch_on_change_interval(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    # Without changes the interval bounds how long the output can be stale.
+    path = tmp_path / "watched.txt"
+    path.write_bytes(b"same\n")
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((250, 4))
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+    start_time = time.monotonic()
+
+    py_proc_watch.watch("", 0.2, exit_on_unchanged=1, file_path=str(path), change_paths=[str(tmp_path)])
+
+    assert 0.15 < time.monotonic() - start_time < 5.0
+    assert len(written_output.all_values) == 2
+    assert f"On change or every 0.2s: {path} (exit status: 0)" in written_output.all_values[0]
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_watch_headless_on_change(capsysbinary: pytest.CaptureFixture[bytes], tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "watched.txt"
+    path.write_bytes(b"before\n")
+    writer = threading.Timer(0.2, lambda: path.write_bytes(b"after\n"))
+    writer.start()
+
+    py_proc_watch.watch("", 0.0, exit_on_change=True, headless="text", file_path=str(path), change_paths=[str(path)])
+
+    output = capsysbinary.readouterr().out
+    assert output.endswith(b"(exit status: 0)\nafter\n")
+    assert output.count(b"--- ") == 2
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="requires inotify")
+def test_watch_headless_on_change_during_run(
+    when: mockito.when, capsysbinary: pytest.CaptureFixture[bytes], tmp_path: pathlib.Path
+) -> None:
+    # An edit while the command runs is not in its output yet, the command runs once more.
+    when(os).getenv("SHELL").thenReturn("/bin/sh")
+    path = tmp_path / "watched.txt"
+    path.write_bytes(b"before\n")
+    writer = threading.Timer(0.2, lambda: path.write_bytes(b"after\n"))
+    writer.start()
+    start_time = time.monotonic()
+
+    py_proc_watch.watch(f"cat {path}; sleep 0.5", 30.0, exit_on_change=True, headless="text", change_paths=[str(path)])
+
+    assert time.monotonic() - start_time < 10.0
+    output = capsysbinary.readouterr().out
+    assert output.endswith(b"(exit status: 0)\nafter\n")
+    assert output.count(b"--- ") == 2
+
+
+def test_watch_on_change_checks() -> None:
+    with pytest.raises(ValueError, match=r"Runs on changes do not support precise timing and pipelined runs"):
+        py_proc_watch.watch("a-command", precise=True, change_paths=["."])
+    with pytest.raises(ValueError, match=r"Invalid track pattern \(: "):
+        py_proc_watch.watch_frames("a-command", track=["("])
+
+
+def test_watch_headless_checks() -> None:
+    with pytest.raises(ValueError, match=r"Deltas are only written in headless mode"):
+        py_proc_watch.watch("a-command", headless_deltas=True)
+    with pytest.raises(ValueError, match=r"Headless mode does not support differences, metrics and recording"):
+        py_proc_watch.watch("a-command", differences=True, headless="text")
+    with pytest.raises(ValueError, match=r"Headless mode writes the frames itself, it does not use a render callback"):
+        py_proc_watch.watch("a-command", headless="text", render=print)
+    with pytest.raises(ValueError, match=r"Invalid headless output format: html"):
+        py_proc_watch.watch("a-command", headless="html")
+
+
+def test_watch_frames(when: mockito.when, expect: mockito.expect) -> None:
+    long_line = "x" * 500 + "\n"
+    when(time).time().thenReturn(10.0)
+    when(shutil).get_terminal_size().thenReturn(os.terminal_size((80, 24)))
+    when(py_proc_watch).get_output(
+        mockito.ANY, mockito.ANY, py_proc_watch.MAX_SCROLLBACK_LINES, 0, 0.0, True, tracker=None
+    ).thenReturn(
+        command_result_with_lines(long_line),
+        command_result_with_lines(long_line),
+        command_result_with_lines("2\n"),
+    )
+    # Runs are not started ahead of the consumer, taking three frames sleeps only between them.
+    expect(time, times=2).sleep(2.0)
+    expect(py_proc_watch.CommandSource, times=1).close()
+
+    frames = py_proc_watch.watch_frames("a-command", 2.0)
+    taken = [next(frames) for _ in range(3)]
+    frames.close()
+
+    assert [(frame.time, frame.size, frame.changed, frame.unchanged_runs) for frame in taken] == [
+        (10.0, (80, 24), False, 0),
+        (10.0, (80, 24), False, 1),
+        (10.0, (80, 24), True, 0),
+    ]
+    assert taken[0].command_result.stdout_lines.window(0, 2) == [long_line]
+
+
+def test_watch_frames_checks(expect: mockito.expect) -> None:
+    expect(py_proc_watch.CommandSource, times=0).run(*mockito.ARGS)
+    # Options are checked before the first frame is taken.
+    with pytest.raises(ValueError, match=r"Invalid interval value: -1"):
+        py_proc_watch.watch_frames("a-command", -1)
+    with pytest.raises(ValueError, match=r"Invalid missed tick policy: wait"):
+        py_proc_watch.watch_frames("a-command", precise=True, missed_tick_policy="wait")
+    with pytest.raises(ValueError, match=r"Tail is only shown for a file source"):
+        py_proc_watch.watch_frames("a-command", file_tail=True)
+
+
+def test_watch_render(when: mockito.when, expect: mockito.expect) -> None:
+    expect(sys.stdout, times=0).isatty()
+    when(py_proc_watch).get_output(*mockito.ARGS, **mockito.KWARGS).thenReturn(command_result_with_lines("1\n"))
+    expect(time, times=1).sleep(0.5)
+    frames: List[py_proc_watch.Frame] = []
+
+    py_proc_watch.watch("a-command", 0.5, exit_on_unchanged=1, render=frames.append)
+
+    assert [frame.unchanged_runs for frame in frames] == [0, 1]
+    assert frames[1].wait_time >= 0.0
+
+
+def test_command_source_closes_sources_on_error(when: mockito.when, expect: mockito.expect) -> None:
+    when(py_proc_watch).ChangeMonitor(["."]).thenRaise(py_proc_watch.PyProcWatchError("Failed to watch ."))
+    expect(py_proc_watch.FanOut, times=1).close()
+
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Failed to watch \."):
+        py_proc_watch.CommandSource("echo {}", targets=["a"], change_paths=["."])
+
+
+@pytest.mark.parametrize(
+    ("data", "expected_keys"),
+    [
+        ("q", ["q"]),
+        ("\033[A\033[B\033[C\033[D", ["up", "down", "right", "left"]),
+        ("\033OH\033[4~x\033[5~\033[6~", ["home", "end", "x", "page_up", "page_down"]),
+        ("\033", ["\033"]),
+        ("\033[Z", ["\033", "[", "Z"]),
+    ],
+    ids=repr,
+)
+def test_decode_keys(data: str, expected_keys: List[str]) -> None:
+    assert py_proc_watch.decode_keys(data) == expected_keys
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Terminal modes are only available on POSIX")
+def test_key_reader() -> None:
+    master, slave = os.openpty()
+    wakeup_fd, notify_fd = os.pipe()
+    try:
+        with py_proc_watch.KeyReader(slave) as keys:
+            assert keys.read(0.01) is None
+            os.write(notify_fd, b"\0")
+            start_time = time.monotonic()
+            assert keys.read(10.0, [wakeup_fd]) is None
+            assert time.monotonic() - start_time < 5.0
+            os.write(master, b"q\033[A")
+            assert keys.read(1.0, [wakeup_fd]) == "q"
+            assert keys.read(0.0) == "up"
+    finally:
+        for fd in (master, slave, wakeup_fd, notify_fd):
+            os.close(fd)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGWINCH"), reason="requires SIGWINCH")
+def test_resize_monitor(when: mockito.when) -> None:
+    when(os).get_terminal_size().thenReturn((80, 24), (100, 30))
+    previous_handler = signal.getsignal(signal.SIGWINCH)
+    with py_proc_watch.ResizeMonitor() as terminal:
+        assert terminal.get_size() == (80, 24)
+        assert not terminal.check_resized()
+
+        os.kill(os.getpid(), signal.SIGWINCH)
+        start_time = time.monotonic()
+        terminal.wait(10.0)
+
+        assert time.monotonic() - start_time < 5.0
+        assert terminal.check_resized()
+        assert terminal.get_size() == (100, 30)
+        assert not terminal.check_resized()
+    assert signal.getsignal(signal.SIGWINCH) == previous_handler
+    assert terminal.wakeup_fd is None
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires pipes that can be selected")
+def test_resize_monitor_extra_fds(when: mockito.when) -> None:
+    when(os).get_terminal_size().thenReturn((80, 24))
+    wakeup_fd, notify_fd = os.pipe()
+    try:
+        terminal = py_proc_watch.ResizeMonitor()
+        terminal.extra_fds.append(wakeup_fd)
+        os.write(notify_fd, b"\0")
+        start_time = time.monotonic()
+        terminal.wait(10.0)
+
+        assert time.monotonic() - start_time < 5.0
+        assert terminal.wakeup_fds == [wakeup_fd]
+    finally:
+        os.close(wakeup_fd)
+        os.close(notify_fd)
+
+
+def test_resize_monitor_without_signal(when: mockito.when, expect: mockito.expect) -> None:
+    # Without entering the monitor (as on Windows) the size is queried every time and wait() is a plain sleep.
+    when(os).get_terminal_size().thenReturn((80, 24), (80, 24), (100, 30))
+    expect(time, times=1).sleep(0.5)
+    terminal = py_proc_watch.ResizeMonitor()
+
+    assert terminal.get_size() == (80, 24)
+    terminal.wait(0.5)
+    assert terminal.get_size() == (100, 30)
+    assert not terminal.check_resized()
+
+
+def test_parse_timestamp() -> None:
+    now = datetime.datetime(2024, 5, 6, 12, 30).timestamp()
+
+    assert py_proc_watch.parse_timestamp("2024-05-01T10:00:00", now) == datetime.datetime(2024, 5, 1, 10).timestamp()
+    assert py_proc_watch.parse_timestamp("12:00", now) == datetime.datetime(2024, 5, 6, 12).timestamp()
+    assert py_proc_watch.parse_timestamp("13:00:30", now) == datetime.datetime(2024, 5, 5, 13, 0, 30).timestamp()
+    with pytest.raises(ValueError, match=r"Invalid isoformat string"):
+        py_proc_watch.parse_timestamp("noon", now)
+
+
+class FakeKeyReader:
+    def __init__(self, keys: List[Optional[str]]) -> None:
+        self.keys = keys
+
+    def __enter__(self) -> "FakeKeyReader":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        pass
+
+    def read(self, timeout: Optional[float] = None, _wakeup_fds: Sequence[int] = ()) -> Optional[str]:
+        # None stands for no key pressed until the timeout.
+        if not self.keys:
+            raise KeyboardInterrupt()
+        key = self.keys.pop(0)
+        if key is None and timeout is not None:
+            time.sleep(timeout)
+        return key
+
+
+def test_replay(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    record_frames(record_file, [(60.0 * minute, 0, [f"minute {minute}\n"]) for minute in range(1, 6)], 2)
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((80, 4))
+    when(py_proc_watch).KeyReader().thenReturn(
+        FakeKeyReader(["left", "g", "p", "right", "n", "f", "b", "page_down", "page_up", "G", "x", "end", "home", "q"])
+    )
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+
+    py_proc_watch.replay(str(record_file))
+
+    minutes = [
+        int(re.findall(r"minute (\d)", output)[-1]) if "minute" in output else None
+        for output in written_output.all_values
+    ]
+    # Frames that do not change the displayed minute (nothing before the first frame, x) only redraw the status line.
+    assert minutes == [5, 4, 1, None, 2, 3, 4, 3, 4, 3, 5, None, None, 1]
+    assert written_output.all_values[0].startswith(f"{colorama.Cursor.POS(1, 1)}{colorama.Fore.LIGHTBLACK_EX}Replay ")
+    assert f"{datetime.datetime.fromtimestamp(300.0):%Y-%m-%d %H:%M:%S}" in written_output.all_values[0]
+
+
+def test_replay_seek(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    record_frames(record_file, RECORDED_FRAMES, 3)
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((80, 4))
+    when(py_proc_watch).KeyReader().thenReturn(FakeKeyReader([]))
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output)
+
+    py_proc_watch.replay(str(record_file), 99.0)
+
+    assert written_output.value.startswith(f"{colorama.Cursor.POS(1, 1)}{colorama.Fore.LIGHTBLACK_EX}Replay")
+    assert f"a{colorama.ansi.clear_line(0)}\nb{colorama.ansi.clear_line(0)}\nc" in written_output.value
+
+
+def test_replay_errors(when: mockito.when, tmp_path: pathlib.Path) -> None:
+    record_file = tmp_path / "watch.rec"
+    when(sys.stdout).isatty().thenReturn(False)
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"stdout is not a tty!"):
+        py_proc_watch.replay(str(record_file))
+
+    when(sys.stdout).isatty().thenReturn(True)
+    when(py_proc_watch).KeyReader().thenReturn(FakeKeyReader([]))
+    record_file.touch()
+    (tmp_path / "watch.rec.idx").write_bytes(py_proc_watch.RECORD_INDEX_ENTRY.pack(1.0, 0))
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"No frames recorded in .*watch.rec"):
+        py_proc_watch.replay(str(record_file))
+
+    record_frames(record_file, RECORDED_FRAMES, 3)
+    when(os).get_terminal_size().thenReturn((47, 3))
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Terminal window too small: \(47x3\)"):
+        py_proc_watch.replay(str(record_file))
+
+
+def test_get_output_async() -> None:
+    script = "print('first'); print('second'); print('third', end='')"
+
+    result = asyncio.run(py_proc_watch.get_output_async([sys.executable, "-c", script], False, 1000))
+    assert result.exit_status == 0
+    assert result.stdout_lines == ["first\n", "second\n", "third"]
+
+    result = asyncio.run(py_proc_watch.get_output_async([sys.executable, "-c", script], False, 1))
+    assert result.stdout_lines == ["first\n"]
+    assert result.total_read_bytes == len("first\nsecond\nthird")
+
+    with pytest.raises(ValueError, match=r"Invalid number of maximum lines: 0"):
+        asyncio.run(py_proc_watch.get_output_async(["true"], False, 0))
+
+
+def test_get_output_async_shell() -> None:
+    result = asyncio.run(py_proc_watch.get_output_async(["echo", "from shell"], True, 1000))
+
+    assert result.exit_status == 0
+    assert result.stdout_lines == ["from shell\n"]
+
+
+def test_get_output_async_limits() -> None:
+    script = "import sys, time\nprint('started', flush=True)\ntime.sleep(30)\n"
+    result = asyncio.run(py_proc_watch.get_output_async([sys.executable, "-c", script], False, 1000, timeout=0.5))
+    assert result.timed_out
+    assert result.exit_status != 0
+    assert result.stdout_lines == ["started\n"]
+
+    script = "import sys\nwhile True:\n    sys.stdout.buffer.write(b'x' * 99 + b'\\n')\n"
+    result = asyncio.run(py_proc_watch.get_output_async([sys.executable, "-c", script], False, 10, max_bytes=1_000_000))
+    assert result.truncated
+    assert result.exit_status != 0
+    assert result.stdout_lines == ["x" * 99 + "\n"] * 10
+
+
+def test_get_output_async_cancel(when: mockito.when) -> None:
+    processes: List[asyncio.subprocess.Process] = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def create_and_keep(*args: Any, **kwargs: Any) -> asyncio.subprocess.Process:
+        processes.append(await create_subprocess_exec(*args, **kwargs))
+        return processes[-1]
+
+    when(asyncio).create_subprocess_exec(*mockito.ARGS, **mockito.KWARGS).thenAnswer(create_and_keep)
+
+    async def run_and_cancel() -> None:
+        task = asyncio.create_task(
+            py_proc_watch.get_output_async([sys.executable, "-c", "import time; time.sleep(30)"], False, 1000)
+        )
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The killed process was waited for, it is neither running nor a zombie.
+        assert processes[0].returncode is not None
+
+    start_time = time.monotonic()
+    asyncio.run(run_and_cancel())
+    assert time.monotonic() - start_time < 10.0
+
+
+def test_get_output_async_no_stdout(when: mockito.when) -> None:
+    process_mock = mockito.mock({"stdout": None})
+
+    async def create_process(*_args: Any, **_kwargs: Any) -> Any:
+        return process_mock
+
+    when(asyncio).create_subprocess_exec(*mockito.ARGS, **mockito.KWARGS).thenAnswer(create_process)
+
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Failed to open child process stdout"):
+        asyncio.run(py_proc_watch.get_output_async(["a-command"], False, 1))
+
+
+@pytest.mark.parametrize(
+    ("height", "pane_count", "expected_layout"),
+    [(5, 2, [2, 2]), (24, 3, [8, 8, 7]), (24, 1, [23]), (10, 4, [3, 2, 2, 2])],
+    ids=str,
+)
+def test_dashboard_layout(height: int, pane_count: int, expected_layout: List[int]) -> None:
+    assert py_proc_watch.dashboard_layout(height, pane_count) == expected_layout
+
+
+def test_dashboard_layout_too_small() -> None:
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Terminal window too small for 3 panes: height 6"):
+        py_proc_watch.dashboard_layout(6, 3)
+
+
+def test_dashboard_invalid_params(when: mockito.when) -> None:
+    with pytest.raises(ValueError, match=r"No panes to watch"):
+        py_proc_watch.dashboard([])
+    with pytest.raises(ValueError, match=r"Invalid command: "):
+        py_proc_watch.dashboard([("a-command", 1.0), ("", 1.0)])
+    with pytest.raises(ValueError, match=r"Invalid interval value: -?[\d\.]+"):
+        py_proc_watch.dashboard([("a-command", -1.0)])
+
+    when(sys.stdout).isatty().thenReturn(False)
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"stdout is not a tty!"):
+        py_proc_watch.dashboard([("a-command", 1.0)])
+
+
+def test_dashboard_screen_size_check(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((47, 24))
+
+    with pytest.raises(py_proc_watch.PyProcWatchError, match=r"Terminal window too small: \(47x24\)"):
+        py_proc_watch.dashboard([("a-command", 1.0)])
+
+
+def test_dashboard(when: mockito.when) -> None:
+    when(sys.stdout).isatty().thenReturn(True)
+    when(os).get_terminal_size().thenReturn((60, 7))
+    written_output = mockito.matchers.captor()
+    when(sys.stdout).write(written_output).thenReturn(None, None, None, None).thenRaise(KeyboardInterrupt)
+
+    py_proc_watch.dashboard([("echo first-pane", 0.1), ("exit 3", 0.1)], show_debug=True)
+
+    output = "".join(written_output.all_values)
+    assert written_output.all_values[0].startswith(f"{colorama.Cursor.POS(1, 1)}{colorama.Fore.LIGHTBLACK_EX}pywatch")
+    assert "<<w=60,h=7 O:0>>" in written_output.all_values[0]
+    assert "Every 0.1s: echo first-pane (waiting)" in written_output.all_values[0]
+    assert "Every 0.1s: echo first-pane (exit status: 0)" in output
+    assert f"first-pane{colorama.ansi.clear_line(0)}\n" in output
+    assert f"{colorama.Fore.LIGHTRED_EX}Every 0.1s: exit 3 (exit status: 3)" in output
 
 
 @pytest.mark.parametrize(
@@ -457,12 +2883,22 @@ def test_watch_debug(when: mockito.when, expect: mockito.expect) -> None:
         (["--interval", "0.1"], 2),
         (["-v"], 2),
         (["--debug"], 2),
+        (["--pane", "1"], 2),
+        (["--pane", "one", "whoami"], 2),
+        (["--replay", "watch.rec", "--seek", "yesterday"], 2),
+        (["--each", ",", "whoami"], 2),
+        (["--each", "a", "--each-file", "targets.txt", "whoami"], 2),
+        (["--each-file", "does-not-exist.txt", "whoami"], 2),
+        (["--file", "some.log", "whoami"], 2),
+        (["--tail", "whoami"], 2),
+        (["--track", "(", "whoami"], 2),
     ],
     ids=str,
 )
 def test_main_no_command(expect: mockito.expect, args: List[str], expected_exit_code: int) -> None:
-    expect(colorama, times=0).just_fix_windows_console()
+    expect(py_proc_watch, times=0).fix_windows_console()
     expect(py_proc_watch, times=0).watch(mockito.ANY)
+    expect(py_proc_watch, times=0).dashboard(mockito.ANY)
 
     with pytest.raises(SystemExit) as exception_info:
         py_proc_watch.main(args)
@@ -490,12 +2926,161 @@ def test_main_with_command(
     expected_precise: bool,
     expected_debug: bool,
 ) -> None:
-    expect(colorama, times=1).just_fix_windows_console()
+    expect(py_proc_watch, times=1).fix_windows_console()
     expect(py_proc_watch, times=1).watch(
         command=expected_command,
         interval=pytest.approx(expected_interval),
         precise=expected_precise,
         show_debug=expected_debug,
+        **WATCH_DEFAULT_OPTIONS,
+    )
+
+    py_proc_watch.main(args)
+
+
+@pytest.mark.parametrize(
+    ("args", "expected_options"),
+    [
+        (["--persistent-shell", "whoami"], {"persistent_shell": True}),
+        (["--max-bytes", "1024", "whoami"], {"max_bytes": 1024}),
+        (["--timeout", "2.5", "whoami"], {"timeout": 2.5}),
+        (["--missed-ticks", "coalesce", "whoami"], {"missed_tick_policy": "coalesce"}),
+        (["--metrics-file", "metrics.jsonl", "whoami"], {"metrics_file": "metrics.jsonl"}),
+        (["-g", "whoami"], {"exit_on_change": True}),
+        (["--chgexit", "-q", "3", "whoami"], {"exit_on_change": True, "exit_on_unchanged": 3}),
+        (["-d", "whoami"], {"differences": True}),
+        (["--cumulative", "whoami"], {"cumulative_differences": True}),
+        (["--record", "watch.rec", "whoami"], {"record_file": "watch.rec"}),
+        (["--scrollback", "5000", "whoami"], {"scrollback": 5000}),
+        (["--headless", "jsonl", "whoami"], {"headless": "jsonl"}),
+        (["--headless", "text", "--deltas", "whoami"], {"headless": "text", "headless_deltas": True}),
+        (["--pipeline", "4", "whoami"], {"pipeline_runs": 4}),
+        (["--each", "a,,b c", "--parallel", "4", "whoami"], {"targets": ["a", "b c"], "parallel_targets": 4}),
+        (["--on-change", "src", "--on-change", "b", "whoami"], {"change_paths": ["src", "b"], "interval": 0.0}),
+        (["-n", "5", "--on-change", "src", "whoami"], {"change_paths": ["src"], "interval": 5.0}),
+        (["--track", r"depth (\d+)", "--track", "free", "whoami"], {"track": [r"depth (\d+)", "free"]}),
+    ],
+    ids=str,
+)
+def test_main_with_options(expect: mockito.expect, args: List[str], expected_options: Dict[str, Any]) -> None:
+    options = {**WATCH_DEFAULT_OPTIONS, **expected_options}
+    expect(py_proc_watch, times=1).fix_windows_console()
+    expect(py_proc_watch, times=1).watch(
+        command="whoami",
+        interval=pytest.approx(options.pop("interval", 1.0)),
+        precise=False,
+        show_debug=False,
+        **options,
     )
 
     py_proc_watch.main(args)
+
+
+@pytest.mark.parametrize(
+    ("args", "expected_tail"), [(["--file", "some.log"], False), (["--tail", "--file", "some.log"], True)], ids=str
+)
+def test_main_with_file(expect: mockito.expect, args: List[str], expected_tail: bool) -> None:
+    expect(py_proc_watch, times=1).fix_windows_console()
+    expect(py_proc_watch, times=1).watch(
+        command="",
+        interval=pytest.approx(1.0),
+        precise=False,
+        show_debug=False,
+        **{**WATCH_DEFAULT_OPTIONS, "file_path": "some.log", "file_tail": expected_tail},
+    )
+
+    py_proc_watch.main(args)
+
+
+def test_main_with_targets_file(expect: mockito.expect, tmp_path: pathlib.Path) -> None:
+    targets_file = tmp_path / "targets.txt"
+    targets_file.write_text("a\n\n  b  \n")
+    expect(py_proc_watch, times=1).fix_windows_console()
+    expect(py_proc_watch, times=1).watch(
+        command="whoami",
+        interval=pytest.approx(1.0),
+        precise=False,
+        show_debug=False,
+        **{**WATCH_DEFAULT_OPTIONS, "targets": ["a", "b"]},
+    )
+
+    py_proc_watch.main(["--each-file", str(targets_file), "whoami"])
+
+    targets_file.write_text("\n")
+    with pytest.raises(SystemExit):
+        py_proc_watch.main(["--each-file", str(targets_file), "whoami"])
+
+
+@pytest.mark.parametrize(
+    ("args", "expected_start"),
+    [
+        (["--replay", "watch.rec"], None),
+        (["--replay", "watch.rec", "--seek", "2024-05-01T10:00"], datetime.datetime(2024, 5, 1, 10).timestamp()),
+    ],
+    ids=str,
+)
+def test_main_replay(expect: mockito.expect, args: List[str], expected_start: Optional[float]) -> None:
+    expect(py_proc_watch, times=1).fix_windows_console()
+    expect(py_proc_watch, times=0).watch(*mockito.ARGS, **mockito.KWARGS)
+    expect(py_proc_watch, times=1).replay("watch.rec", expected_start)
+
+    py_proc_watch.main(args)
+
+
+@pytest.mark.parametrize(
+    ("args", "expected_panes"),
+    [
+        (["--pane", "2", "uptime"], [("uptime", 2.0)]),
+        (["-n", "3", "--pane", "0.5", "df -h", "whoami"], [("whoami", 3.0), ("df -h", 0.5)]),
+        (["--pane", "1", "uptime", "--pane", "5", "df"], [("uptime", 1.0), ("df", 5.0)]),
+    ],
+    ids=str,
+)
+def test_main_with_panes(expect: mockito.expect, args: List[str], expected_panes: List[Tuple[str, float]]) -> None:
+    expect(py_proc_watch, times=1).fix_windows_console()
+    expect(py_proc_watch, times=0).watch(*mockito.ARGS, **mockito.KWARGS)
+    expect(py_proc_watch, times=1).dashboard(panes=expected_panes, show_debug=False, max_bytes=0, timeout=0.0)
+
+    py_proc_watch.main(args)
+
+
+@pytest.mark.parametrize(
+    ("args", "expected_options"),
+    [
+        (["-p", "--pane", "2", "uptime"], "-p/--precise"),
+        (["--missed-ticks", "coalesce", "--pane", "2", "uptime"], "--missed-ticks"),
+        (["--persistent-shell", "--pane", "2", "uptime"], "--persistent-shell"),
+        (["-d", "--cumulative", "--pane", "2", "uptime"], "-d/--differences, --cumulative"),
+        (["-g", "-q", "3", "--pane", "2", "uptime"], "-g/--chgexit, -q/--equexit"),
+        (["--scrollback", "100", "--pane", "2", "uptime"], "--scrollback"),
+        (["--headless", "text", "--deltas", "--pane", "2", "uptime"], "--headless, --deltas"),
+        (["--metrics-file", "m.jsonl", "--record", "w.rec", "--pane", "2", "uptime"], "--metrics-file, --record"),
+        (["--pipeline", "2", "--pane", "2", "uptime"], "--pipeline"),
+        (["--each", "a", "--pane", "2", "uptime"], "--each"),
+        (["--file", "some.log", "--pane", "2", "uptime"], "--file"),
+        (["--on-change", "src", "--pane", "2", "uptime"], "--on-change"),
+        (["--track", "[0-9]+", "--pane", "2", "uptime"], "--track"),
+    ],
+    ids=str,
+)
+def test_main_with_panes_unsupported_options(
+    expect: mockito.expect, capsys: pytest.CaptureFixture[str], args: List[str], expected_options: str
+) -> None:
+    expect(py_proc_watch, times=0).watch(*mockito.ARGS, **mockito.KWARGS)
+    expect(py_proc_watch, times=0).dashboard(*mockito.ARGS, **mockito.KWARGS)
+
+    with pytest.raises(SystemExit) as exception_info:
+        py_proc_watch.main(args)
+
+    assert exception_info.value.code == 2
+    assert f"argument --pane: not allowed with argument {expected_options}\n" in capsys.readouterr().err
+
+
+def test_import_is_lazy() -> None:
+    # Modules only some modes need are imported where they are used, to keep pywatch start-up fast.
+    script = "import sys, py_proc_watch; print(' '.join(sys.modules))"
+    modules = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout.split()
+
+    assert "py_proc_watch" in modules
+    for module in ("argparse", "asyncio", "colorama", "concurrent.futures", "dataclasses", "datetime", "json"):
+        assert module not in modules